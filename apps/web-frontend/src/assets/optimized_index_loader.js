@@ -2,10 +2,118 @@
 import axios from 'axios'
 
 const INDEX_URL = 'skydata/search_index.json'
+// Same content, searched in place (format in scripts/search_index_binary.py).
+// Only requested when VUE_APP_BINARY_SEARCH_INDEX is 'true', for
+// deployments that ship the file
+const BINARY_INDEX_URL = 'skydata/search_index.bin'
+const USE_BINARY_INDEX = process.env.VUE_APP_BINARY_SEARCH_INDEX === 'true'
+const BINARY_MAGIC = 'SIDX'
+const BINARY_VERSION = 3
+// Matches collected per category, as in binarySearchRange
+const MAX_RANGE_RESULTS = 51
+// Shared lengths of front coded entries are chr(LCP_BASE + length)
+const LCP_BASE = 0x30
 
 let indexData = null
+let binaryIndex = null
+let frontCoded = {}
 let loadingPromise = null
 
+const textDecoder = new TextDecoder()
+const textEncoder = new TextEncoder()
+
+// Length in code points, as len() in the Python generator (the prefix
+// lengths of the completion tables are in code points, not UTF-16 units)
+function codePointLength (s) {
+  return Array.from(s).length
+}
+
+function compareBytes (a, b) {
+  const n = Math.min(a.length, b.length)
+  for (let i = 0; i < n; i++) {
+    if (a[i] !== b[i]) return a[i] < b[i] ? -1 : 1
+  }
+  return a.length - b.length
+}
+
+// Binary index: only the header and the category table are read on load,
+// a category is binary-searched where it lies in the buffer
+class BinaryIndex {
+  constructor (buffer) {
+    this.view = new DataView(buffer)
+    this.bytes = new Uint8Array(buffer)
+    const magic = textDecoder.decode(this.bytes.subarray(0, 4))
+    if (magic !== BINARY_MAGIC || this.view.getUint32(4, true) !== BINARY_VERSION) {
+      throw new Error('Unsupported binary search index')
+    }
+    const count = this.view.getUint32(8, true)
+    this.prefixLength = this.view.getUint8(12)
+    this.categories = {}
+    for (let i = 0; i < count; i++) {
+      const base = 16 + i * 32
+      const name = textDecoder.decode(this.bytes.subarray(base, base + 16)).replace(/\0+$/, '')
+      this.categories[name] = {
+        entries: this.view.getUint32(base + 16, true),
+        entriesOffset: this.view.getUint32(base + 20, true),
+        completions: this.view.getUint32(base + 24, true),
+        completionsOffset: this.view.getUint32(base + 28, true)
+      }
+    }
+  }
+
+  // Bytes of record i of an offsets array
+  record (arrayOffset, i) {
+    const offset = this.view.getUint32(arrayOffset + 4 * i, true)
+    const size = this.view.getUint16(offset, true)
+    return this.bytes.subarray(offset + 2, offset + 2 + size)
+  }
+
+  // First record i (of count) with keyOf(record) > key, or >= key if not upper
+  bound (arrayOffset, count, key, keyOf, upper) {
+    let lo = 0
+    let hi = count
+    while (lo < hi) {
+      const mid = (lo + hi) >> 1
+      const c = compareBytes(keyOf(this.record(arrayOffset, mid)), key)
+      if (c < 0 || (upper && c === 0)) lo = mid + 1
+      else hi = mid
+    }
+    return lo
+  }
+
+  entry (category, i) {
+    return textDecoder.decode(this.record(this.categories[category].entriesOffset, i))
+  }
+
+  // Entries of a category whose normalized key starts with prefix: the
+  // precomputed completions for short prefixes, else in sorted order
+  search (category, prefix, limit) {
+    const cat = this.categories[category]
+    if (!cat || prefix.includes('|')) return []
+    const key = textEncoder.encode(prefix)
+    if (codePointLength(prefix) <= this.prefixLength) {
+      const prefixOf = r => r.subarray(1, 1 + r[0])
+      const i = this.bound(cat.completionsOffset, cat.completions, key, prefixOf, false)
+      if (i === cat.completions) return []
+      const record = this.record(cat.completionsOffset, i)
+      if (compareBytes(prefixOf(record), key) !== 0) return []
+      const ids = new DataView(record.buffer, record.byteOffset + 1 + record[0], record.length - 1 - record[0])
+      const results = []
+      for (let j = 0; j < ids.byteLength / 4 && results.length < limit; j++) {
+        results.push(this.entry(category, ids.getUint32(4 * j, true)))
+      }
+      return results
+    }
+    // Sorted entries: those starting with prefix are contiguous
+    const headOf = r => r.subarray(0, key.length)
+    const lo = this.bound(cat.entriesOffset, cat.entries, key, headOf, false)
+    const hi = Math.min(this.bound(cat.entriesOffset, cat.entries, key, headOf, true), lo + limit)
+    const results = []
+    for (let i = lo; i < hi; i++) results.push(this.entry(category, i))
+    return results
+  }
+}
+
 // Binary search implementation for prefix matching
 function binarySearchRange (arr, prefix) {
   let start = 0
@@ -53,6 +161,94 @@ function binarySearchRange (arr, prefix) {
   return results
 }
 
+// Ranked completions precomputed by generate_search_index.py for the
+// shortest prefixes: one lookup instead of a search. Returns null when the
+// index has no table or the prefix is longer than the cached ones.
+function cachedCompletions (category, entries, prefix) {
+  const completions = indexData.completions
+  if (!completions || codePointLength(prefix) > completions.prefix_length) return null
+  const ids = completions[category][prefix]
+  return ids ? ids.map(i => entries.get(i)) : []
+}
+
+// Category of search_index.json written with --front-coding (format in
+// scripts/front_coding.py): blocks are decoded on first use, and a prefix
+// is located by a binary search on the block heads
+class FrontCodedCategory {
+  constructor (category) {
+    this.blockSize = category.block_size
+    this.fields = category.fields
+    this.heads = category.heads
+    this.blocks = category.blocks
+    this.decoded = new Map()
+  }
+
+  block (b) {
+    let entries = this.decoded.get(b)
+    if (entries) return entries
+    entries = [this.heads[b]]
+    if (this.blocks[b]) {
+      const values = this.blocks[b].split('|')
+      let prev = this.heads[b].split('|')
+      for (let start = 0; start < values.length; start += this.fields) {
+        const current = values.slice(start, start + this.fields).map((value, i) =>
+          i < 2 ? prev[i].substring(0, value.charCodeAt(0) - LCP_BASE) + value.substring(1) : value)
+        entries.push(current.join('|'))
+        prev = current
+      }
+    }
+    this.decoded.set(b, entries)
+    return entries
+  }
+
+  get (i) {
+    return this.block(Math.floor(i / this.blockSize))[i % this.blockSize]
+  }
+
+  search (prefix, limit) {
+    if (prefix.includes('|')) return []
+    const size = prefix.length
+    // First block whose head is not below prefix: the first match is in it
+    // or at the end of the block before
+    let lo = 0
+    let hi = this.heads.length
+    while (lo < hi) {
+      const mid = (lo + hi) >> 1
+      if (this.heads[mid].substring(0, size) < prefix) lo = mid + 1
+      else hi = mid
+    }
+    const results = []
+    for (let b = Math.max(lo - 1, 0); b < this.heads.length; b++) {
+      for (const entry of this.block(b)) {
+        if (entry.startsWith(prefix)) {
+          results.push(entry)
+          if (results.length >= limit) return results
+        } else if (entry.substring(0, size) > prefix) {
+          return results
+        }
+      }
+    }
+    return results
+  }
+}
+
+// Entries of a category of the JSON index: get(i) and search(prefix, limit).
+// Front coded files say so with "front_coding": true (and version 3)
+function jsonCategory (category) {
+  const data = category === 'stars' ? indexData.stars : indexData.dsos[category]
+  if (!indexData.front_coding) {
+    return { get: i => data[i], search: prefix => binarySearchRange(data, prefix) }
+  }
+  if (!frontCoded[category]) frontCoded[category] = new FrontCodedCategory(data)
+  return frontCoded[category]
+}
+
+function findMatches (category, prefix) {
+  if (binaryIndex) return binaryIndex.search(category, prefix, MAX_RANGE_RESULTS)
+  const entries = jsonCategory(category)
+  return cachedCompletions(category, entries, prefix) || entries.search(prefix, MAX_RANGE_RESULTS)
+}
+
 function parseEntry (entry, typeOverride = null) {
   const parts = entry.split('|')
   const norm = parts[0]
@@ -71,10 +267,20 @@ export default {
     if (indexData) return indexData
     if (loadingPromise) return loadingPromise
 
-    loadingPromise = axios.get(INDEX_URL).then(response => {
+    const loadJson = () => axios.get(INDEX_URL).then(response => {
       indexData = response.data
+      frontCoded = {}
       return indexData
-    }).catch(err => {
+    })
+    // The binary index if enabled (falling back to the JSON), else the JSON
+    const loading = USE_BINARY_INDEX
+      ? axios.get(BINARY_INDEX_URL, { responseType: 'arraybuffer' }).then(response => {
+        binaryIndex = new BinaryIndex(response.data)
+        indexData = binaryIndex
+        return indexData
+      }).catch(loadJson)
+      : loadJson()
+    loadingPromise = loading.catch(err => {
       console.error('Failed to load search index', err)
       loadingPromise = null
       throw err
@@ -91,7 +297,7 @@ export default {
 
     // Search Stars
     if (filters.stars) {
-      const matches = binarySearchRange(indexData.stars, normalizedQuery)
+      const matches = findMatches('stars', normalizedQuery)
       for (const m of matches) {
         results.push(parseEntry(m, 'star'))
         if (results.length >= limit) break
@@ -123,7 +329,7 @@ export default {
 
     // We can prioritize based on categories or mix them
     for (const cat of dsoCategories) {
-      const matches = binarySearchRange(indexData.dsos[cat], normalizedQuery)
+      const matches = findMatches(cat, normalizedQuery)
       for (const m of matches) {
         results.push(parseEntry(m)) // Type is in the entry string
         if (results.length >= limit * 2) break // Collect a bit more to sort later
@@ -0,0 +1,290 @@
+"""
+Benchmark the .eph decode pipeline on synthetic star and DSO tiles.
+
+Usage: python scripts/bench_eph.py [--kind star,dso] [--rows 1000,10000,100000]
+                                   [--shuffle 1,0] [--columns SPEC] [--json FILE]
+
+Tiles are generated with eph_writer.py in the same layout as the bundled
+surveys (or the layout given by --columns, e.g. 'hip:i,vmag:f,ra:f,ids:s64'),
+then every stage is timed separately:
+
+    read        open the file and index its chunks
+    inflate     zlib decompression of the table
+    unshuffle   byte unshuffle (shuffled tiles only)
+    decode      rows to columns, strings included
+    jsonl, csv, columnar
+                writing the decoded table with the catalog sinks
+
+Each stage reports rows/s and MB/s (of decompressed table data, file size
+for 'read'), best of --repeat runs.  --json saves the results with the
+machine details, to compare runs over time.
+"""
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from catalog_io import ColumnarSink, CsvSink, JsonlSink, CatalogWriter
+from eph_file import EphFile, StringColumn, read_table_info, read_compressed_block
+from eph_file import unshuffle_bytes, decode_records, CHUNK_DEGREE_COLUMNS
+from eph_writer import encode_table_chunk, write_eph_file, DEFAULT_LEVEL
+from timing import best_time
+
+# Units of the bundled tiles (EPH_UNIT values of src/eph-file.h).
+EPH_RAD = 1 << 16
+EPH_ARCSEC = EPH_RAD | 1 | 2 | 4
+EPH_VMAG = 3 << 16
+EPH_RAD_PER_YEAR = 6 << 16
+
+# (name, type, unit, size) of the columns of the bundled surveys.
+STAR_LAYOUT = [
+    ('hip', 'i', 0, 4),
+    ('hd', 'i', 0, 4),
+    ('vmag', 'f', EPH_VMAG, 4),
+    ('ra', 'f', EPH_RAD, 4),
+    ('de', 'f', EPH_RAD, 4),
+    ('plx', 'f', EPH_ARCSEC, 4),
+    ('pra', 'f', EPH_RAD_PER_YEAR, 4),
+    ('pde', 'f', EPH_RAD_PER_YEAR, 4),
+    ('bv', 'f', 0, 4),
+    ('ids', 's', 0, 256),
+]
+
+DSO_LAYOUT = [
+    ('type', 's', 0, 4),
+    ('vmag', 'f', EPH_VMAG, 4),
+    ('bmag', 'f', EPH_VMAG, 4),
+    ('ra', 'f', EPH_RAD, 4),
+    ('de', 'f', EPH_RAD, 4),
+    ('smax', 'f', EPH_RAD, 4),
+    ('smin', 'f', EPH_RAD, 4),
+    ('angl', 'f', EPH_RAD, 4),
+    ('morp', 's', 0, 32),
+    ('snam', 's', 0, 64),
+    ('ids', 's', 0, 256),
+]
+
+KINDS = {
+    'star': ('STAR', STAR_LAYOUT),
+    'dso': ('DSO ', DSO_LAYOUT),
+}
+
+DSO_TYPES = ['G', 'GiC', 'OpC', 'GlC', 'PN', 'HII', 'RNe', 'Cl*']
+CATALOG_PREFIXES = ['HD', 'HIP', 'TYC', 'NGC', 'IC', 'PGC', 'UGC', 'M']
+
+def parse_columns(spec):
+    """Parse 'name:type[size],...' (e.g. 'hip:i,ra:f,ids:s64') into a layout"""
+    layout = []
+    for item in spec.split(','):
+        name, col_type = item.split(':')
+        size = int(col_type[1:]) if col_type[0] == 's' else 4
+        if col_type[0] not in 'fiQs' or len(name) > 4:
+            raise ValueError(f"Invalid column: {item}")
+        if col_type[0] == 'Q':
+            size = 8
+        layout.append((name, col_type[0], EPH_RAD if name in ('ra', 'de') else 0, size))
+    return layout
+
+def make_columns(layout):
+    """Column descriptors and row size of a layout, columns packed in order"""
+    columns = []
+    start = 0
+    for name, col_type, unit, size in layout:
+        columns.append({'name': name, 'type': col_type, 'unit': unit,
+                        'start': start, 'size': size})
+        start += size
+    return columns, start
+
+def random_strings(rng, n_row, size, column):
+    """Catalog-like identifiers ('HD 1234|HIP 56'), at most size bytes"""
+    if column == 'type':
+        return [DSO_TYPES[i] for i in rng.integers(0, len(DSO_TYPES), n_row)]
+    n_ids = rng.integers(0, 4, n_row)
+    prefixes = rng.integers(0, len(CATALOG_PREFIXES), (n_row, 3))
+    numbers = rng.integers(1, 300000, (n_row, 3))
+    values = []
+    for i in range(n_row):
+        ids = [f"{CATALOG_PREFIXES[prefixes[i, j]]} {numbers[i, j]}"
+               for j in range(n_ids[i])]
+        values.append('|'.join(ids)[:size])
+    return values
+
+def random_table(rng, columns, n_row):
+    """Random columnar table with plausible values for each column"""
+    table = {}
+    for col in columns:
+        name, col_type = col['name'], col['type']
+        if col_type == 's':
+            table[name] = random_strings(rng, n_row, col['size'], name)
+        elif col_type in 'iQ':
+            values = rng.integers(0, 1 << 20, n_row)
+            values[rng.random(n_row) < 0.3] = 0
+            table[name] = values.astype('<i4' if col_type == 'i' else '<u8')
+        elif name == 'ra':
+            table[name] = rng.uniform(0, 2 * np.pi, n_row)
+        elif name == 'de':
+            table[name] = np.arcsin(rng.uniform(-1, 1, n_row))
+        elif col['unit'] == EPH_VMAG:
+            # Magnitudes are stored with a coarse resolution.
+            table[name] = np.round(rng.uniform(-1.5, 12, n_row) * 128) / 128
+        else:
+            table[name] = rng.normal(0, 1, n_row).astype(np.float32)
+    return table
+
+def generate_tile(path, kind, layout, n_row, shuffle=True, seed=0, level=DEFAULT_LEVEL):
+    """Write a synthetic tile (Norder0 Npix0) with n_row random rows"""
+    chunk_type = KINDS[kind][0] if kind in KINDS else 'STAR'
+    columns, row_size = make_columns(layout)
+    table = random_table(np.random.default_rng(seed), columns, n_row)
+    chunk = encode_table_chunk(table, columns, row_size, nuniq=4,
+                               flags=1 if shuffle else 0, level=level)
+    write_eph_file(path, [(chunk_type, chunk)])
+    return row_size
+
+def bench_tile(path, output_dir, repeat):
+    """Time every stage on one tile, return {stage: seconds} and sizes"""
+    times = {}
+
+    def read():
+        with EphFile(path) as eph:
+            chunk = eph.chunks[-1]
+            return chunk.type, bytes(eph.chunk_data(chunk))
+    times['read'], (chunk_type, chunk_data) = best_time(read, repeat)
+
+    header = read_table_info(chunk_data)
+    row_size, n_row = header['row_size'], header['n_row']
+    compressed = chunk_data[header['data_offset']:]
+    times['inflate'], table_data = best_time(
+        lambda: read_compressed_block(compressed), repeat)
+
+    if header['flags'] & 1:
+        times['unshuffle'], table_data = best_time(
+            lambda: unshuffle_bytes(table_data, row_size, n_row), repeat)
+
+    degree_columns = CHUNK_DEGREE_COLUMNS.get(chunk_type, ())
+
+    def decode():
+        table = decode_records(table_data, header, degree_columns)
+        for values in table.values():
+            if isinstance(values, StringColumn):
+                values.tolist()
+        return table
+    times['decode'], table = best_time(decode, repeat)
+
+    sinks = {
+        'jsonl': lambda: JsonlSink(output_dir / 'bench.jsonl'),
+        'csv': lambda: CsvSink(output_dir / 'bench.csv'),
+        'columnar': lambda: ColumnarSink(output_dir / 'bench.cols'),
+    }
+    for name, make_sink in sinks.items():
+        def write():
+            with CatalogWriter([make_sink()]) as writer:
+                writer.write_table(table)
+        times[name], _ = best_time(write, repeat)
+
+    return times, {
+        'file_size': os.path.getsize(path),
+        'data_size': header['data_size'],
+        'comp_size': header['comp_size'],
+        'row_size': row_size,
+        'rows': n_row,
+    }
+
+def run(kinds, row_counts, shuffles, layout, repeat, level, work_dir):
+    results = []
+    print(f"{'kind':>5s} {'rows':>9s} {'shuf':>4s} {'stage':>10s} {'ms':>10s} "
+          f"{'rows/s':>12s} {'MB/s':>9s}")
+    print(f"{'-'*65}")
+    for kind in kinds:
+        kind_layout = layout or KINDS[kind][1]
+        for n_row in row_counts:
+            for shuffle in shuffles:
+                path = work_dir / f'{kind}_{n_row}_{int(shuffle)}' / 'Norder0' / 'Dir0' / 'Npix0.eph'
+                generate_tile(path, kind, kind_layout, n_row, shuffle, level=level)
+                times, sizes = bench_tile(path, path.parent, repeat)
+                stages = {}
+                for stage, seconds in times.items():
+                    size = sizes['file_size'] if stage == 'read' else sizes['data_size']
+                    stages[stage] = {
+                        'seconds': seconds,
+                        'rows_per_s': n_row / seconds if seconds else None,
+                        'mb_per_s': size / 1e6 / seconds if seconds else None,
+                    }
+                    print(f"{kind:>5s} {n_row:9d} {int(shuffle):4d} {stage:>10s} "
+                          f"{seconds * 1000:10.2f} {n_row / max(seconds, 1e-9):12.0f} "
+                          f"{size / 1e6 / max(seconds, 1e-9):9.1f}")
+                results.append({
+                    'kind': kind,
+                    'shuffle': shuffle,
+                    'columns': [list(col) for col in kind_layout],
+                    **sizes,
+                    'stages': stages,
+                })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--kind', default='star,dso',
+                        help='Comma separated tile kinds: star, dso')
+    parser.add_argument('--rows', default='1000,10000,100000',
+                        help='Comma separated list of row counts')
+    parser.add_argument('--shuffle', default='1,0',
+                        help='Comma separated shuffle flags to test')
+    parser.add_argument('--columns', default=None,
+                        help="Custom layout, e.g. 'hip:i,vmag:f,ra:f,de:f,ids:s64'")
+    parser.add_argument('--level', type=int, default=DEFAULT_LEVEL,
+                        help=f'zlib level of the generated tiles (default: {DEFAULT_LEVEL})')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs per stage, the best one is reported')
+    parser.add_argument('--json', default=None, help='Save the results as JSON')
+    parser.add_argument('--keep-dir', default=None,
+                        help='Generate the tiles and outputs there and keep them')
+    args = parser.parse_args()
+
+    kinds = [kind for kind in args.kind.split(',') if kind]
+    for kind in kinds:
+        if kind not in KINDS:
+            parser.error(f"Unknown kind: {kind}")
+    row_counts = [int(n) for n in args.rows.split(',') if n]
+    shuffles = [bool(int(flag)) for flag in args.shuffle.split(',') if flag]
+    layout = parse_columns(args.columns) if args.columns else None
+
+    if args.keep_dir:
+        work_dir = Path(args.keep_dir)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        results = run(kinds, row_counts, shuffles, layout, args.repeat, args.level, work_dir)
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            results = run(kinds, row_counts, shuffles, layout, args.repeat, args.level,
+                          Path(tmp_dir))
+
+    if args.json:
+        report = {
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'machine': {
+                'platform': platform.platform(),
+                'processor': platform.processor(),
+                'cpu_count': os.cpu_count(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'zlib': zlib.ZLIB_RUNTIME_VERSION,
+            },
+            'settings': {
+                'repeat': args.repeat,
+                'level': args.level,
+            },
+            'results': results,
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+if __name__ == "__main__":
+    main()
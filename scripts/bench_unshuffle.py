@@ -0,0 +1,75 @@
+"""
+Benchmark the NumPy byte unshuffle against the old pure Python loop.
+
+Usage: python scripts/bench_unshuffle.py [--row-size N] [--rows 1000,100000,1000000]
+
+The pure Python loop takes minutes on large tiles, so it is only run up to
+--legacy-max-rows rows.
+"""
+
+import argparse
+import os
+
+from eph_file import shuffle_bytes, unshuffle_bytes
+from timing import best_time
+
+def unshuffle_bytes_loop(data, row_size, num_rows):
+    """Reference implementation: the per-byte loop the extractors used"""
+    total_size = row_size * num_rows
+    if len(data) < total_size:
+        return data
+
+    unshuffled = bytearray(total_size)
+    for i in range(num_rows):
+        for j in range(row_size):
+            unshuffled[i * row_size + j] = data[j * num_rows + i]
+
+    return bytes(unshuffled)
+
+def run(row_size, row_counts, legacy_max_rows, repeat):
+    print(f"Row size: {row_size} bytes\n")
+    print(f"{'rows':>10s} {'MB':>8s} {'loop (s)':>10s} {'numpy (s)':>10s} "
+          f"{'numpy MB/s':>11s} {'speedup':>8s}")
+    print(f"{'-'*62}")
+
+    for num_rows in row_counts:
+        rows = os.urandom(row_size * num_rows)
+        shuffled = shuffle_bytes(rows, row_size, num_rows)
+        size_mb = len(rows) / 1e6
+
+        np_time, result = best_time(
+            lambda: unshuffle_bytes(shuffled, row_size, num_rows), repeat)
+        if result != rows:
+            raise AssertionError(f"unshuffle(shuffle(x)) != x for {num_rows} rows")
+
+        if num_rows <= legacy_max_rows:
+            loop_time, result = best_time(
+                lambda: unshuffle_bytes_loop(shuffled, row_size, num_rows), 1)
+            if result != rows:
+                raise AssertionError(f"Loop and NumPy disagree for {num_rows} rows")
+            loop_str = f"{loop_time:10.4f}"
+            speedup_str = f"{loop_time / np_time:7.0f}x"
+        else:
+            loop_str = f"{'skipped':>10s}"
+            speedup_str = f"{'-':>8s}"
+
+        print(f"{num_rows:10d} {size_mb:8.1f} {loop_str} {np_time:10.4f} "
+              f"{size_mb / np_time:11.1f} {speedup_str}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--row-size', type=int, default=64,
+                        help='Row size in bytes (default: 64)')
+    parser.add_argument('--rows', default='1000,100000,1000000',
+                        help='Comma separated list of row counts')
+    parser.add_argument('--legacy-max-rows', type=int, default=100000,
+                        help='Largest tile to run the pure Python loop on')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of NumPy runs, the best one is reported')
+    args = parser.parse_args()
+
+    row_counts = [int(n) for n in args.rows.split(',') if n]
+    run(args.row_size, row_counts, args.legacy_max_rows, args.repeat)
+
+if __name__ == "__main__":
+    main()
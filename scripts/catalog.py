@@ -0,0 +1,312 @@
+"""
+Array-backed star and DSO catalogs shared by the pipeline scripts.
+
+A table keeps one typed column per field: NumPy arrays for numbers (memory
+mapped when the table is loaded from a columnar export) and StringArray
+for strings, i.e. uint32 ids into the list of distinct values.  Iterating
+over a table yields row views that only hold the table and a row number,
+so a catalog costs a few bytes per row and column instead of a dict per
+row.
+
+Rows support the read-only dict interface the scripts used on catalog
+rows (row['hip'], row.get('ids', ''), keys(), items()), plus attributes
+for the known columns (star.hip, dso.snam).  to_dict() builds a real dict
+when a row is written out.
+"""
+
+import json
+
+import numpy as np
+
+from catalog_io import ColumnarCatalog, iter_jsonl, resolve_catalog_path
+from eph_file import StringColumn
+
+# NumPy type of each column kind.
+KIND_DTYPES = {
+    'f': np.float64,
+    'i': np.int32,
+    'Q': np.uint64,
+}
+
+class StringArray:
+    """String column stored as uint32 ids into a list of distinct values"""
+
+    __slots__ = ('ids', 'strings')
+
+    def __init__(self, ids, strings):
+        self.ids = ids
+        self.strings = strings
+
+    @classmethod
+    def from_values(cls, values):
+        """Intern a sequence of str (or a StringColumn, without decoding every cell)"""
+        if isinstance(values, StringArray):
+            return values
+        if isinstance(values, StringColumn):
+            unique, ids = np.unique(values.raw, return_inverse=True)
+            return cls(ids.astype(np.uint32), StringColumn(unique).tolist())
+        pool = {}
+        ids = np.fromiter((pool.setdefault(value, len(pool)) for value in values),
+                          dtype=np.uint32, count=len(values))
+        return cls(ids, list(pool))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.strings[self.ids[index]]
+        return StringArray(self.ids[index], self.strings)
+
+    def __iter__(self):
+        strings = self.strings
+        for start in range(0, len(self.ids), 65536):
+            for i in self.ids[start:start + 65536].tolist():
+                yield strings[i]
+
+    def tolist(self):
+        strings = self.strings
+        return [strings[i] for i in self.ids.tolist()]
+
+def _typed_column(values, kind=None):
+    # Turn column values into a NumPy array or a StringArray.
+    if isinstance(values, StringArray):
+        return values
+    if isinstance(values, StringColumn) or kind == 's':
+        return StringArray.from_values(values)
+    if kind in KIND_DTYPES:
+        try:
+            return np.asarray(values, dtype=KIND_DTYPES[kind])
+        except TypeError:
+            # Missing values (None) in rows read from JSON.
+            fill = np.nan if kind == 'f' else 0
+            return np.asarray([fill if v is None else v for v in values],
+                              dtype=KIND_DTYPES[kind])
+    array = values if isinstance(values, np.ndarray) else np.asarray(values)
+    if array.dtype.kind in 'OUS':
+        return StringArray.from_values(list(values))
+    return array
+
+class CatalogRow:
+    """Read-only view of one row of a CatalogTable"""
+
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, name):
+        return self.table.value(name, self.index)
+
+    def get(self, name, default=None):
+        if name not in self.table.column_names:
+            return default
+        return self.table.value(name, self.index)
+
+    def __contains__(self, name):
+        return name in self.table.column_names
+
+    def keys(self):
+        return list(self.table.column_names)
+
+    def values(self):
+        return [self.table.value(name, self.index) for name in self.table.column_names]
+
+    def items(self):
+        return [(name, self.table.value(name, self.index))
+                for name in self.table.column_names]
+
+    def to_dict(self):
+        """The row as a plain dict, for output"""
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+def _column_property(name):
+    return property(lambda row: row.table.value(name, row.index),
+                    doc=f"Value of the '{name}' column")
+
+def make_row_class(class_name, columns):
+    """CatalogRow subclass with one attribute per known column"""
+    attrs = {'__slots__': ()}
+    attrs.update((name, _column_property(name)) for name in columns)
+    return type(class_name, (CatalogRow,), attrs)
+
+class CatalogTable:
+    """
+    Columns of a catalog, see the module docstring.  Subclasses give the
+    kind of the known columns ('f', 'i', 'Q' or 's'); other columns keep
+    the type of the values they are built from.
+    """
+
+    KIND = None
+    COLUMNS = {}
+    ROW_CLASS = CatalogRow
+
+    def __init__(self, columns):
+        self._columns = {}
+        self._len = 0
+        for name, values in columns.items():
+            if values is None:
+                continue
+            values = _typed_column(values, self.COLUMNS.get(name))
+            if self._columns and len(values) != self._len:
+                raise ValueError(f"Column '{name}' has {len(values)} rows, "
+                                 f"expected {self._len}")
+            self._columns[name] = values
+            self._len = len(values)
+
+    @classmethod
+    def from_rows(cls, rows, columns=None):
+        """
+        Table from dicts (e.g. read from JSON), keeping the given columns
+        (default: those of the first row).  Rows are read one at a time,
+        so a generator never has to be held in memory as dicts.
+        """
+        table = None if columns is None else {name: [] for name in columns}
+        present = set()
+        for row in rows:
+            if table is None:
+                table = {name: [] for name in row}
+            for name, values in table.items():
+                if name in row:
+                    present.add(name)
+                values.append(row.get(name))
+        table = table or {}
+        return cls({name: values for name, values in table.items() if name in present})
+
+    @classmethod
+    def from_tables(cls, tables):
+        """Table from decoded tile tables (see eph_file.decode_table)"""
+        tables = list(tables)
+        columns = {}
+        for name, first in (tables[0].items() if tables else ()):
+            parts = [table[name] for table in tables]
+            if first is None:
+                continue
+            if isinstance(first, np.ndarray):
+                columns[name] = np.concatenate(parts)
+            elif all(isinstance(part, StringColumn) for part in parts):
+                columns[name] = StringColumn(np.concatenate([part.raw for part in parts]))
+            else:
+                columns[name] = [value for part in parts for value in part]
+        return cls(columns)
+
+    @classmethod
+    def load(cls, path, columns=None):
+        """
+        Load an extracted catalog (see catalog_io.resolve_catalog_path).
+        From a columnar export the numeric columns stay memory mapped and
+        string columns share the string table; only the requested columns
+        are read.  Requested columns the catalog does not have are skipped.
+        """
+        path = resolve_catalog_path(path)
+        if path.suffix == '.cols':
+            catalog = ColumnarCatalog(path)
+            names = [name for name in (columns or catalog.columns) if name in catalog.columns]
+            table = {}
+            for name in names:
+                if catalog.column_type(name) == 's':
+                    table[name] = StringArray(catalog.column(name), catalog.strings())
+                else:
+                    table[name] = catalog.column(name)
+            return cls(table)
+        if path.suffix == '.jsonl':
+            return cls.from_rows(iter_jsonl(path), columns)
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_rows(json.load(f), columns)
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def column_names(self):
+        return self._columns.keys()
+
+    def column(self, name):
+        """Column values: a NumPy array or a StringArray"""
+        return self._columns[name]
+
+    def value(self, name, index):
+        """One value, as a Python object"""
+        value = self._columns[name][index]
+        return value.item() if isinstance(value, np.generic) else value
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            if index < 0:
+                index += self._len
+            if not 0 <= index < self._len:
+                raise IndexError(index)
+            return self.ROW_CLASS(self, int(index))
+        return self.take(index)
+
+    def __iter__(self):
+        row_class = self.ROW_CLASS
+        for i in range(self._len):
+            yield row_class(self, i)
+
+    def take(self, index):
+        """New table with the rows selected by a slice, integer or boolean index"""
+        return type(self)({name: values[index] for name, values in self._columns.items()})
+
+    def to_columns(self):
+        """Columnar table (name -> NumPy array or list of str), as decode_table returns"""
+        return {name: values.tolist() if isinstance(values, StringArray) else values
+                for name, values in self._columns.items()}
+
+    def to_dicts(self):
+        """Every row as a plain dict, for output"""
+        return [row.to_dict() for row in self]
+
+STAR_COLUMNS = {
+    'hip': 'i',
+    'hd': 'i',
+    'vmag': 'f',
+    'ra': 'f',
+    'de': 'f',
+    'plx': 'f',
+    'pra': 'f',
+    'pde': 'f',
+    'bv': 'f',
+    'ids': 's',
+}
+
+DSO_COLUMNS = {
+    'type': 's',
+    'vmag': 'f',
+    'bmag': 'f',
+    'ra': 'f',
+    'de': 'f',
+    'smax': 'f',
+    'smin': 'f',
+    'angl': 'f',
+    'morp': 's',
+    'snam': 's',
+    'ids': 's',
+}
+
+StarRow = make_row_class('StarRow', STAR_COLUMNS)
+DsoRow = make_row_class('DsoRow', DSO_COLUMNS)
+
+class StarTable(CatalogTable):
+    """Stars, with the columns of the STAR chunks (angles in degrees)"""
+    KIND = 'star'
+    COLUMNS = STAR_COLUMNS
+    ROW_CLASS = StarRow
+
+class DsoTable(CatalogTable):
+    """Deep sky objects, with the columns of the DSO chunks (angles in degrees)"""
+    KIND = 'dso'
+    COLUMNS = DSO_COLUMNS
+    ROW_CLASS = DsoRow
+
+def load_star_table(path='stars_extracted/star_data', columns=None):
+    """StarTable of an extracted star catalog"""
+    return StarTable.load(path, columns)
+
+def load_dso_table(path='dso_extracted/dso_data', columns=None):
+    """DsoTable of an extracted DSO catalog"""
+    return DsoTable.load(path, columns)
@@ -0,0 +1,406 @@
+"""
+Streaming output sinks for the extracted star and DSO catalogs.
+
+Rows are written tile by tile as they are decoded, so memory stays bounded
+by the size of one tile whatever the size of the catalog.  JSON Lines is the
+primary output; the pretty printed JSON array of the old extractors can
+still be produced from it with jsonl_to_json().
+
+Catalogs are also exported in a columnar format that downstream scripts can
+map without parsing anything.  A columnar catalog is a directory
+(e.g. stars_extracted/star_data.cols) with:
+
+    meta.json               row count and the list of columns with their type
+    <column>.npy            one array per numeric column ('f' columns as
+                            float64, 'i' as int32, 'Q' as uint64)
+    <column>.npy            for string columns: uint32 ids in the string table
+    strings.bin             UTF-8 bytes of every distinct string
+    strings.offsets.npy     uint64 offsets of each string in strings.bin,
+                            plus a final end offset
+"""
+
+import csv
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from eph_file import table_num_rows, table_to_rows
+
+COLUMNAR_VERSION = 1
+
+class JsonlSink:
+    """Write rows as JSON Lines, one object per line"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.count = 0
+        self._file = None
+
+    def write_rows(self, rows):
+        for row in rows:
+            if self._file is None:
+                self._file = open(self.path, 'w', encoding='utf-8')
+            self._file.write(json.dumps(row))
+            self._file.write('\n')
+            self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class CsvSink:
+    """Write rows as CSV, the columns are taken from the first row"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def write_rows(self, rows):
+        for row in rows:
+            if self._writer is None:
+                self._file = open(self.path, 'w', newline='', encoding='utf-8')
+                self._writer = csv.DictWriter(self._file, fieldnames=row.keys())
+                self._writer.writeheader()
+            self._writer.writerow(row)
+            self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+class TxtSink:
+    """
+    Human readable dump, one block per object.
+
+    The header holds the total number of objects, which is only known at
+    the end: the blocks are streamed to a temporary file that is appended
+    after the header on close.
+    """
+
+    def __init__(self, path, title, total_label, item_label, limit=None):
+        self.path = Path(path)
+        self.title = title
+        self.total_label = total_label
+        self.item_label = item_label
+        self.limit = limit
+        self.count = 0
+        self._body_path = self.path.with_name(self.path.name + '.tmp')
+        self._body = None
+
+    def write_rows(self, rows):
+        for row in rows:
+            if self._body is None:
+                self._body = open(self._body_path, 'w', encoding='utf-8')
+            self.count += 1
+            if self.limit is not None and self.count > self.limit:
+                continue
+            self._body.write(f"{self.item_label} #{self.count}\n")
+            self._body.write(f"{'-'*40}\n")
+            for key, value in row.items():
+                if value is not None:
+                    self._body.write(f"  {key:10s}: {value}\n")
+            self._body.write(f"\n")
+
+    def close(self):
+        if self._body is None:
+            return
+        self._body.close()
+        self._body = None
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(f"{self.title}\n")
+            f.write(f"{'='*80}\n\n")
+            if self.limit is not None:
+                f.write(f"Total {self.total_label}: {self.count}\n")
+                f.write(f"(Showing first {self.limit} in text format)\n\n")
+            else:
+                f.write(f"Total {self.total_label}: {self.count}\n\n")
+            with open(self._body_path, 'r', encoding='utf-8') as body:
+                shutil.copyfileobj(body, f)
+        os.remove(self._body_path)
+
+def _write_npy(path, raw_path, dtype, count):
+    # Turn a raw dump of `count` values into a .npy file without loading it.
+    with open(path, 'wb') as f:
+        np.lib.format.write_array_header_1_0(f, {
+            'descr': np.dtype(dtype).str,
+            'fortran_order': False,
+            'shape': (count,),
+        })
+        with open(raw_path, 'rb') as raw:
+            shutil.copyfileobj(raw, f)
+    os.remove(raw_path)
+
+class ColumnarSink:
+    """
+    Columnar export, see the module docstring for the layout.
+
+    Takes decoded tables (write_table) rather than rows.  Values are
+    appended to raw files as they arrive and only wrapped into .npy files
+    on close, so memory stays bounded by one tile plus the distinct strings.
+    The columns are those of the first table; a later table without one
+    of them gets null values (NaN, 0 or '').
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.count = 0
+        self._columns = None
+        self._strings = {}
+        self._strings_size = 0
+        self._strings_file = None
+        self._offsets_file = None
+
+    def _open(self, table):
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._columns = {}
+        for name, values in table.items():
+            if values is None:
+                continue
+            if isinstance(values, np.ndarray):
+                col_type, dtype = values.dtype.kind, values.dtype.str
+            else:
+                col_type, dtype = 's', '<u4'
+            self._columns[name] = {
+                'type': col_type,
+                'dtype': dtype,
+                'file': open(self.path / f'{name}.raw', 'wb'),
+            }
+        self._strings_file = open(self.path / 'strings.bin', 'wb')
+        self._offsets_file = open(self.path / 'strings.offsets.raw', 'wb')
+        self._offsets_file.write(np.uint64(0).tobytes())
+
+    def _intern(self, value):
+        string_id = self._strings.get(value)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._strings[value] = string_id
+            data = value.encode('utf-8')
+            self._strings_file.write(data)
+            self._strings_size += len(data)
+            self._offsets_file.write(np.uint64(self._strings_size).tobytes())
+        return string_id
+
+    def _null_values(self, col, n_row):
+        if col['type'] == 's':
+            return np.full(n_row, self._intern(''), dtype=col['dtype'])
+        return np.full(n_row, np.nan if col['type'] == 'f' else 0, dtype=col['dtype'])
+
+    def write_table(self, table):
+        n_row = table_num_rows(table)
+        if not n_row:
+            return
+        if self._columns is None:
+            self._open(table)
+        for name, col in self._columns.items():
+            values = table.get(name)
+            if values is None:
+                # Column missing from this tile: null values (NaN, 0 or
+                # ''), as the row sinks write it empty
+                values = self._null_values(col, n_row)
+            elif col['type'] == 's':
+                values = np.fromiter((self._intern(v) for v in values),
+                                     dtype=col['dtype'], count=n_row)
+            np.asarray(values, dtype=col['dtype']).tofile(col['file'])
+        self.count += n_row
+
+    def close(self):
+        if self._columns is None:
+            return
+        for name, col in self._columns.items():
+            col['file'].close()
+            _write_npy(self.path / f'{name}.npy', self.path / f'{name}.raw',
+                       col['dtype'], self.count)
+        self._strings_file.close()
+        self._offsets_file.close()
+        _write_npy(self.path / 'strings.offsets.npy',
+                   self.path / 'strings.offsets.raw', '<u8',
+                   len(self._strings) + 1)
+        meta = {
+            'version': COLUMNAR_VERSION,
+            'count': self.count,
+            'columns': [{'name': name, 'type': col['type'], 'dtype': col['dtype']}
+                        for name, col in self._columns.items()],
+        }
+        with open(self.path / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        self._columns = None
+        self._strings = {}
+
+class CatalogWriter:
+    """
+    Fan decoded tables out to several sinks.  Use as a context manager so
+    that every sink is finalised even if the extraction fails half way.
+    Sinks only create their file when the first row arrives.  Per-row dicts
+    are only built if one of the sinks needs them.
+    """
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+        self.count = 0
+        self.sample = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write_table(self, table):
+        n_row = table_num_rows(table)
+        if not n_row:
+            return
+        rows = None
+        for sink in self.sinks:
+            if hasattr(sink, 'write_table'):
+                sink.write_table(table)
+                continue
+            if rows is None:
+                rows = table_to_rows(table)
+            sink.write_rows(rows)
+        if self.sample is None:
+            self.sample = rows[0] if rows else table_to_rows(table)[0]
+        self.count += n_row
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    @property
+    def paths(self):
+        return [sink.path for sink in self.sinks if sink.count]
+
+def iter_jsonl(path):
+    """Iterate over the objects of a JSON Lines file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def jsonl_to_json(jsonl_path, json_path, indent=2):
+    """
+    Convert a JSON Lines file into a pretty printed JSON array, one object
+    at a time.  The output is identical to json.dump(rows, f, indent=indent).
+    """
+    pad = ' ' * indent
+    with open(json_path, 'w', encoding='utf-8') as f:
+        first = True
+        for row in iter_jsonl(jsonl_path):
+            f.write('[\n' if first else ',\n')
+            first = False
+            text = json.dumps(row, indent=indent)
+            f.write(pad + text.replace('\n', '\n' + pad))
+        f.write('[]' if first else '\n]')
+    return Path(json_path)
+
+class ColumnarCatalog:
+    """
+    Read access to a columnar catalog directory.  Numeric columns are
+    memory mapped, so opening a catalog and reading a few columns costs
+    almost nothing whatever its size.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / 'meta.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != COLUMNAR_VERSION:
+            raise ValueError(f"Unsupported columnar catalog version: {meta.get('version')}")
+        self.count = meta['count']
+        self.columns = [col['name'] for col in meta['columns']]
+        self._types = {col['name']: col['type'] for col in meta['columns']}
+        self._strings = None
+
+    def __len__(self):
+        return self.count
+
+    def _load(self, filename):
+        # np.load cannot map empty arrays.
+        return np.load(self.path / filename, mmap_mode='r' if self.count else None)
+
+    def strings(self):
+        """The string table as a list of str, loaded on first use"""
+        if self._strings is None:
+            offsets = np.load(self.path / 'strings.offsets.npy').tolist()
+            data = (self.path / 'strings.bin').read_bytes()
+            self._strings = [data[start:end].decode('utf-8')
+                             for start, end in zip(offsets[:-1], offsets[1:])]
+        return self._strings
+
+    def column_type(self, name):
+        """Type of a column: a NumPy dtype kind, or 's' for strings"""
+        return self._types[name]
+
+    def column(self, name):
+        """
+        Raw column array: the values for numeric columns, the ids in the
+        string table for string columns.
+        """
+        if name not in self._types:
+            raise KeyError(name)
+        return self._load(f'{name}.npy')
+
+    def values(self, name):
+        """Column values: a NumPy array, or a list of str for string columns"""
+        values = self.column(name)
+        if self._types[name] == 's':
+            strings = self.strings()
+            return [strings[i] for i in values.tolist()]
+        return values
+
+    def table(self, columns=None):
+        """Columnar table (name -> values) with only the requested columns"""
+        names = [name for name in (columns or self.columns) if name in self._types]
+        return {name: self.values(name) for name in names}
+
+    def rows(self, columns=None):
+        """List of per-row dicts with only the requested columns"""
+        return table_to_rows(self.table(columns))
+
+def columnar_path(path):
+    """Columnar directory of a catalog given without extension"""
+    path = Path(path)
+    return path.with_name(path.name + '.cols')
+
+def resolve_catalog_path(path):
+    """
+    File of an extracted catalog.  path may point to the .cols directory,
+    the .jsonl or the .json file, or have no extension, in which case the
+    columnar export is preferred, then JSON Lines, then JSON.
+    """
+    path = Path(path)
+    if path.suffix not in ('.cols', '.jsonl', '.json'):
+        for suffix in ('.cols', '.jsonl', '.json'):
+            candidate = path.with_name(path.name + suffix)
+            if candidate.exists():
+                return candidate
+    return path
+
+def load_catalog(path, columns=None):
+    """
+    Load an extracted catalog as a list of dicts, see resolve_catalog_path()
+    for path.  With the columnar export only the requested columns are
+    read.  Prefer catalog.py tables, which do not build a dict per row.
+    """
+    path = resolve_catalog_path(path)
+    if path.suffix == '.cols':
+        return ColumnarCatalog(path).rows(columns)
+    if path.suffix == '.jsonl':
+        return list(iter_jsonl(path))
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def catalog_exists(path):
+    """True if load_catalog(path) would find a file"""
+    path = Path(path)
+    if path.suffix in ('.cols', '.jsonl', '.json'):
+        return path.exists()
+    return any(path.with_name(path.name + suffix).exists()
+               for suffix in ('.cols', '.jsonl', '.json'))
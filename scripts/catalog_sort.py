@@ -0,0 +1,348 @@
+"""
+External sort of extracted catalogs, in bounded memory.
+
+Usage: python scripts/catalog_sort.py [--rows 10000000] [--sort hip|healpix]
+                                      [--memory-mb 256] [--max-rss-mb 640]
+
+extract_star_data.py --sort streams the decoded tiles into a ShardWriter:
+tables are buffered until they reach the memory budget, sorted and saved
+as a shard, a directory with one .npy file per column (strings as raw
+fixed-width bytes, as in the tiles) plus the sort keys.  merge() then
+reads one block of each shard at a time with plain file reads (not
+memory maps, whose pages would stay in the RSS) and yields the rows in
+order as decoded tables, ready for the CatalogWriter sinks.  Memory
+therefore depends on the budget, not on the catalog size.
+
+Sort keys:
+
+    hip       HIP number, stars without one (hip 0) last
+    healpix   nested HEALPix pixel at order HEALPIX_SORT_ORDER, so that
+              neighbouring stars end up close together
+
+Rows with the same key keep the order they were written in.
+
+Run directly, the script sorts a synthetic star catalog and checks that
+the output is sorted and complete and that the peak RSS of the process
+stays under --max-rss-mb.
+"""
+
+import argparse
+import json
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from eph_file import StringColumn, table_num_rows
+from eph_query import ang2pix_nest
+from catalog_io import ColumnarSink, ColumnarCatalog
+
+SORT_KEYS = ('hip', 'healpix')
+HEALPIX_SORT_ORDER = 12
+DEFAULT_MEMORY_MB = 256
+MISSING_KEY = np.uint64(1 << 63)
+KEY_COLUMN = 'sort_key'
+
+def sort_keys(table, by):
+    """uint64 sort key of every row of a table"""
+    if by == 'hip':
+        hip = np.asarray(table['hip'], dtype=np.int64)
+        return np.where(hip > 0, hip, MISSING_KEY).astype(np.uint64)
+    if by == 'healpix':
+        return ang2pix_nest(HEALPIX_SORT_ORDER, table['ra'], table['de']).astype(np.uint64)
+    raise ValueError(f"Unknown sort key: {by}")
+
+def _column_array(values):
+    # Array that can be saved to a shard: strings become raw bytes.
+    if isinstance(values, StringColumn):
+        raw = values.raw
+    elif isinstance(values, np.ndarray):
+        return values
+    else:
+        raw = np.array([value.encode('utf-8') for value in values], dtype=np.bytes_)
+    # Only keep the bytes actually used by the longest string.
+    width = int(np.char.str_len(raw).max()) if len(raw) else 0
+    return raw.astype(f'S{max(width, 1)}')
+
+class ShardWriter:
+    """
+    Sorted shards of a catalog, see the module docstring.  Use as a context
+    manager or call close() before merge().
+    """
+
+    def __init__(self, path, by, memory_mb=DEFAULT_MEMORY_MB):
+        if by not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {by}")
+        self.path = Path(path)
+        self.by = by
+        self.memory_bytes = int(memory_mb * 1024 * 1024)
+        self.count = 0
+        self.shards = []
+        self.columns = None
+        self._tables = []
+        self._buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write_table(self, table):
+        n_row = table_num_rows(table)
+        if not n_row:
+            return
+        if self.columns is None:
+            self.columns = [name for name, values in table.items() if values is not None]
+            if self.path.exists():
+                shutil.rmtree(self.path)
+            self.path.mkdir(parents=True)
+        keys = sort_keys(table, self.by)
+        table = {name: _column_array(table[name]) for name in self.columns}
+        table[KEY_COLUMN] = keys
+        self._tables.append(table)
+        self._buffered += sum(values.nbytes for values in table.values())
+        self.count += n_row
+        # Sorting needs a second copy of the buffer.
+        if self._buffered * 2 >= self.memory_bytes:
+            self._flush()
+
+    def _flush(self):
+        if not self._tables:
+            return
+        tables, self._tables, self._buffered = self._tables, [], 0
+        order = np.argsort(np.concatenate([table[KEY_COLUMN] for table in tables]),
+                           kind='stable')
+        shard = self.path / f'shard{len(self.shards):05d}'
+        shard.mkdir()
+        for name in [KEY_COLUMN] + self.columns:
+            column = np.concatenate([table.pop(name) for table in tables])
+            np.save(shard / f'{name}.npy', column[order])
+            del column
+        self.shards.append(shard)
+
+    def close(self):
+        self._flush()
+
+    def merge(self):
+        """Yield the rows of every shard in key order, as decoded tables"""
+        shards = [_ShardReader(shard, self.columns) for shard in self.shards]
+        if not shards:
+            return
+        try:
+            yield from self._merge(shards)
+        finally:
+            for shard in shards:
+                shard.close()
+
+    def _merge(self, shards):
+        row_bytes = max(shard.row_bytes for shard in shards)
+        block_rows = max(1024, self.memory_bytes // (2 * len(shards) * row_bytes))
+        while True:
+            active = [shard for shard in shards if shard.pos < shard.count]
+            if not active:
+                return
+            for shard in active:
+                shard.load_keys(block_rows)
+            # A loaded row is final if no shard can still read a smaller key,
+            # or the same key from an earlier shard (rows of earlier shards
+            # were written first).  The rows of the shard with the smallest
+            # last loaded key
+            # (the earliest one on ties) are always final.
+            pending = [(i, shard.keys[-1]) for i, shard in enumerate(shards)
+                       if shard.pos < shard.count and shard.end < shard.count]
+            parts = []
+            for j, shard in enumerate(shards):
+                if shard.pos == shard.count:
+                    continue
+                n = len(shard.keys)
+                for i, last in pending:
+                    if i != j:
+                        side = 'right' if j < i else 'left'
+                        n = min(n, int(np.searchsorted(shard.keys, last, side=side)))
+                if n:
+                    parts.append((shard, shard.pos, shard.pos + n, shard.keys[:n]))
+                    shard.advance(n)
+
+            order = np.argsort(np.concatenate([keys for _, _, _, keys in parts]),
+                               kind='stable')
+            table = {}
+            for name in self.columns:
+                column = np.concatenate([shard.read(name, start, end)
+                                         for shard, start, end, _ in parts])[order]
+                table[name] = StringColumn(column) if column.dtype.kind == 'S' else column
+            yield table
+
+    def remove(self):
+        """Delete the shards"""
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self.shards = []
+
+class _ShardReader:
+    # Position of the merge in one shard.  Blocks are read with plain file
+    # reads: pages of a memory map would stay in the RSS of the process.
+
+    def __init__(self, path, columns):
+        self.files = {}
+        self.dtypes = {}
+        self.offsets = {}
+        for name in [KEY_COLUMN] + columns:
+            f = open(path / f'{name}.npy', 'rb')
+            if np.lib.format.read_magic(f) == (1, 0):
+                shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+            self.files[name] = f
+            self.dtypes[name] = dtype
+            self.offsets[name] = f.tell()
+        self.count = shape[0]
+        self.row_bytes = sum(dtype.itemsize for dtype in self.dtypes.values())
+        self.pos = 0
+        self.end = 0
+        self.keys = None
+
+    def read(self, name, start, end):
+        f = self.files[name]
+        dtype = self.dtypes[name]
+        f.seek(self.offsets[name] + start * dtype.itemsize)
+        return np.fromfile(f, dtype=dtype, count=end - start)
+
+    def load_keys(self, block_rows):
+        """Keys of the next block (kept from the last round if not consumed)"""
+        if self.keys is None or not len(self.keys):
+            self.end = min(self.pos + block_rows, self.count)
+            self.keys = self.read(KEY_COLUMN, self.pos, self.end)
+
+    def advance(self, n):
+        self.pos += n
+        self.keys = self.keys[n:]
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KB elsewhere.
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+def synthetic_star_tables(n_rows, tile_rows=100000, seed=0):
+    """Star tables like the decoded tiles, about 1 star in 20 with ids"""
+    rng = np.random.default_rng(seed)
+    next_hip = 1
+    for start in range(0, n_rows, tile_rows):
+        n = min(tile_rows, n_rows - start)
+        hip = np.zeros(n, dtype=np.int32)
+        has_hip = rng.random(n) < 0.2
+        hip[has_hip] = rng.permutation(np.arange(next_hip, next_hip + has_hip.sum()))
+        next_hip += int(has_hip.sum())
+        named = rng.random(n) < 0.05
+        ids = np.zeros(n, dtype='S256')
+        ids[named] = np.char.add(b'TYC ', rng.integers(1, 10000, named.sum()).astype('S'))
+        yield {
+            'hip': hip,
+            'hd': np.where(rng.random(n) < 0.1, rng.integers(1, 360000, n), 0).astype(np.int32),
+            'vmag': np.round(rng.uniform(-1.5, 21, n) * 128) / 128,
+            'ra': rng.uniform(0, 360, n),
+            'de': np.degrees(np.arcsin(rng.uniform(-1, 1, n))),
+            'plx': rng.normal(1, 0.5, n),
+            'pra': rng.normal(0, 10, n),
+            'pde': rng.normal(0, 10, n),
+            'bv': rng.normal(0.6, 0.3, n),
+            'ids': StringColumn(ids),
+        }
+
+def check_sorted_catalog(path, by):
+    """Check a columnar catalog is sorted by a key.  Returns its row count"""
+    catalog = ColumnarCatalog(path)
+    count = len(catalog)
+    step = 1 << 18
+    last = None
+    for start in range(0, count, step):
+        table = {name: catalog.column(name)[start:start + step] for name in ('hip', 'ra', 'de')}
+        keys = sort_keys(table, by)
+        if np.any(keys[1:] < keys[:-1]) or (last is not None and len(keys) and keys[0] < last):
+            raise ValueError(f"Catalog not sorted by {by} around row {start}")
+        if len(keys):
+            last = keys[-1]
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the memory of the external catalog sort")
+    parser.add_argument('--rows', type=int, default=10000000,
+                        help='Number of synthetic stars')
+    parser.add_argument('--sort', choices=SORT_KEYS, default='healpix')
+    parser.add_argument('--memory-mb', type=float, default=DEFAULT_MEMORY_MB,
+                        help='Memory budget of the sort')
+    parser.add_argument('--max-rss-mb', type=float, default=None,
+                        help='Fail if the peak RSS goes over this (default: twice '
+                             'the memory budget plus 128 MB for Python and one tile)')
+    parser.add_argument('--keep-dir', default=None,
+                        help='Work in this directory and keep the outputs')
+    parser.add_argument('--json', default=None, help='Save the results as JSON')
+    args = parser.parse_args()
+
+    max_rss = args.max_rss_mb if args.max_rss_mb is not None else 2 * args.memory_mb + 128
+    work_dir = Path(args.keep_dir or tempfile.mkdtemp(prefix='catalog_sort_'))
+    work_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        start = time.perf_counter()
+        with ShardWriter(work_dir / 'star_data.shards', args.sort, args.memory_mb) as shards:
+            for table in synthetic_star_tables(args.rows):
+                shards.write_table(table)
+        shard_s = time.perf_counter() - start
+        shard_rss = peak_rss_mb()
+
+        start = time.perf_counter()
+        sink = ColumnarSink(work_dir / 'star_data.cols')
+        for table in shards.merge():
+            sink.write_table(table)
+        sink.close()
+        merge_s = time.perf_counter() - start
+        n_shards = len(shards.shards)
+        shards.remove()
+
+        count = check_sorted_catalog(work_dir / 'star_data.cols', args.sort)
+        rss = peak_rss_mb()
+        results = {
+            'rows': args.rows,
+            'sort': args.sort,
+            'memory_mb': args.memory_mb,
+            'shards': n_shards,
+            'shard_s': shard_s,
+            'merge_s': merge_s,
+            'peak_rss_shard_mb': shard_rss,
+            'peak_rss_mb': rss,
+            'max_rss_mb': max_rss,
+        }
+    finally:
+        if not args.keep_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{args.rows:,} synthetic stars sorted by {args.sort} "
+          f"with a {args.memory_mb:g} MB budget")
+    print(f"  shards: {shard_s:.1f} s, merge: {merge_s:.1f} s")
+    print(f"  peak RSS: {shard_rss:.0f} MB after sharding, {rss:.0f} MB in total "
+          f"(limit {max_rss:g} MB)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    failures = []
+    if count != args.rows:
+        failures.append(f"{count} rows in the output, expected {args.rows}")
+    if rss > max_rss:
+        failures.append(f"peak RSS {rss:.0f} MB over {max_rss:g} MB")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
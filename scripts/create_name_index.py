@@ -1,8 +1,19 @@
+import argparse
 import json
 import csv
+import math
+import re
+from functools import lru_cache
 from pathlib import Path
 from collections import defaultdict
 
+from catalog import load_star_table, load_dso_table
+from catalog_io import catalog_exists
+from name_grams import write_name_grams
+from name_pool import NameIndex
+from name_suffix import write_name_suffixes
+from name_trie import write_name_trie
+
 # Greek letter mapping: symbol -> (english name, abbreviation)
 GREEK_LETTERS = {
     'α': ('alpha', 'alf'),
@@ -85,6 +96,42 @@ GREEK_ABBREV_TO_FULL = {
     'ome': 'omega',
 }
 
+# Greek symbols -> English names or abbreviations, for str.translate
+GREEK_TO_FULL = str.maketrans({char: full for char, (full, _) in GREEK_LETTERS.items()})
+GREEK_TO_ABBREV = str.maketrans({char: abbrev for char, (_, abbrev) in GREEK_LETTERS.items()})
+
+# Greek abbreviation at the start of a lowercased name, followed by a
+# space or a component number ('alf And', 'the1 Ori')
+GREEK_ABBREV_RE = re.compile(
+    '^(' + '|'.join(sorted(GREEK_ABBREV_TO_FULL, key=len, reverse=True)) + ')(?=[ 012])')
+
+@lru_cache(maxsize=None)
+def greek_aliases(name):
+    """
+    English spellings of a name with Greek letters, as a tuple:
+    'α And' -> ('alpha And', 'alf And'), 'alf And' -> ('alpha And',).
+    Memoized, the same designations appear in many catalogs.
+    """
+    alternatives = []
+    
+    # Greek symbols (α, β, etc.)
+    full_english = name.translate(GREEK_TO_FULL)
+    if full_english != name:
+        alternatives.append(full_english)
+        abbrev_english = name.translate(GREEK_TO_ABBREV)
+        if abbrev_english != full_english:
+            alternatives.append(abbrev_english)
+    
+    # Greek abbreviations (alf, bet, etc.) in names like "alf And", "bet CMa"
+    match = GREEK_ABBREV_RE.match(name.lower())
+    if match:
+        abbrev = match.group(1)
+        full_english = GREEK_ABBREV_TO_FULL[abbrev] + name[len(abbrev):]
+        if full_english not in alternatives and full_english != name:
+            alternatives.append(full_english)
+    
+    return tuple(alternatives)
+
 def convert_greek_to_english(name):
     """
     Convert Greek letter abbreviations in a name to full English names.
@@ -92,63 +139,109 @@ def convert_greek_to_english(name):
     Also handles Greek symbols if present.
     Returns a list of alternative names.
     """
-    alternatives = []
-    
-    # Check for Greek symbols first (α, β, etc.)
-    has_greek_symbol = False
-    for greek_char in GREEK_LETTERS:
-        if greek_char in name:
-            has_greek_symbol = True
-            break
-    
-    if has_greek_symbol:
-        full_english = name
-        abbrev_english = name
-        for greek_char, (full_name, abbrev) in GREEK_LETTERS.items():
-            if greek_char in name:
-                full_english = full_english.replace(greek_char, full_name)
-                abbrev_english = abbrev_english.replace(greek_char, abbrev)
-        if full_english != name:
-            alternatives.append(full_english)
-        if abbrev_english != name and abbrev_english != full_english:
-            alternatives.append(abbrev_english)
-    
-    # Check for Greek abbreviations (alf, bet, etc.)
-    # Names like "alf And", "bet CMa", "gam Ori"
-    name_lower = name.lower()
-    for abbrev, full_name in GREEK_ABBREV_TO_FULL.items():
-        # Check if name starts with Greek abbrev followed by space or digit
-        if name_lower.startswith(abbrev + ' ') or name_lower.startswith(abbrev + '0') or name_lower.startswith(abbrev + '1') or name_lower.startswith(abbrev + '2'):
-            # Create full English version
-            full_english = full_name + name[len(abbrev):]
-            if full_english not in alternatives and full_english != name:
-                alternatives.append(full_english)
-            break
-    
-    return alternatives
+    return list(greek_aliases(name))
+
+def add_greek_aliases(names, name):
+    """Append the Greek letter aliases of name missing from names.  Returns how many"""
+    added = 0
+    for alt in greek_aliases(name):
+        if alt not in names:
+            names.append(alt)
+            added += 1
+    return added
+
+# Ranking score of an object (see object_score): points per magnitude
+# brighter than SCORE_FAINT_MAG, bonuses for well known objects, and
+# log2 of the size in arcminutes
+SCORE_FAINT_MAG = 15.0
+SCORE_PROPER_NAME = 10.0
+SCORE_MESSIER = 10.0
+SCORE_COMMON_NAME = 5.0
+
+MESSIER_RE = re.compile(r'^M \d+$')
+
+def object_score(vmag, proper_name=False, messier=False, common_name=False, size=None):
+    """
+    Ranking score of a star or DSO, computed once at build time: higher
+    for brighter (vmag), better known (proper star name, Messier number,
+    common DSO name) and larger objects (size: major axis in degrees)
+    """
+    score = 0.0
+    if vmag is not None and not math.isnan(vmag):
+        score += max(0.0, SCORE_FAINT_MAG - vmag)
+    if proper_name:
+        score += SCORE_PROPER_NAME
+    if messier:
+        score += SCORE_MESSIER
+    if common_name:
+        score += SCORE_COMMON_NAME
+    if size and not math.isnan(size):
+        score += math.log2(1 + size * 60)
+    return round(score, 3)
+
+class NameEntry:
+    """
+    One name of the index: the name and a view of the catalog row it
+    belongs to (see catalog.py), turned into a dict only for output.
+    """
+
+    __slots__ = ('name', 'row', 'primary_name', 'score')
+
+    def __init__(self, name, row, primary_name, score=0.0):
+        self.name = name
+        self.row = row
+        self.primary_name = primary_name
+        self.score = score
+
+    @property
+    def type(self):
+        return self.row.table.KIND
+
+    @property
+    def dso_type(self):
+        return self.row.get('type', 'Unknown')
+
+    def to_dict(self):
+        row = self.row
+        if self.type == 'star':
+            return {
+                'name': self.name,
+                'type': 'star',
+                'hip': row.get('hip'),
+                'hd': row.get('hd'),
+                'vmag': row.get('vmag'),
+                'ra': row.get('ra'),
+                'de': row.get('de'),
+                'primary_name': self.primary_name
+            }
+        return {
+            'name': self.name,
+            'type': 'dso',
+            'dso_type': self.dso_type,
+            'vmag': row.get('vmag'),
+            'ra': row.get('ra'),
+            'de': row.get('de'),
+            'primary_name': self.primary_name
+        }
 
 def extract_star_names(star_data_file):
-    """Extract all star names from the star data JSON file"""
+    """Extract all star names from the extracted star catalog (.cols, .jsonl or .json)"""
     print("Loading star data...")
-    with open(star_data_file, 'r', encoding='utf-8') as f:
-        stars = json.load(f)
+    stars = load_star_table(star_data_file, columns=['hip', 'hd', 'vmag', 'ra', 'de', 'ids'])
     
     print(f"Processing {len(stars)} stars...")
     
-    star_names = []
     name_to_info = {}
     greek_alternatives_added = 0
     
     for star in stars:
         hip = star.get('hip')
         hd = star.get('hd')
-        vmag = star.get('vmag')
-        ra = star.get('ra')
-        de = star.get('de')
         ids = star.get('ids', '').strip()
         
         # Collect all names for this star
         names = []
+        proper_name = False
         
         # If star has named IDs, parse them
         if ids:
@@ -158,16 +251,14 @@ def extract_star_names(star_data_file):
             for part in id_parts:
                 part = part.strip()
                 if part and not part.startswith('HIP') and not part.startswith('HD'):
+                    # Designations start with '* ', proper names don't
+                    proper_name = proper_name or not part.startswith('*')
                     # Remove common prefixes for cleaner names
                     clean_name = part.replace('* ', '').strip()
                     if clean_name:
                         names.append(clean_name)
                         # Add Greek letter alternatives
-                        greek_alts = convert_greek_to_english(clean_name)
-                        for alt in greek_alts:
-                            if alt not in names:
-                                names.append(alt)
-                                greek_alternatives_added += 1
+                        greek_alternatives_added += add_greek_aliases(names, clean_name)
         
         # Always add HIP number as fallback name
         if hip:
@@ -181,28 +272,20 @@ def extract_star_names(star_data_file):
         
         # Store each name with its info
         primary_name = names[0] if names else (f"HIP {hip}" if hip else "Unknown")
+        score = object_score(star.get('vmag'), proper_name=proper_name)
         for name in names:
             if name not in name_to_info:
-                name_to_info[name] = {
-                    'name': name,
-                    'type': 'star',
-                    'hip': hip,
-                    'hd': hd,
-                    'vmag': vmag,
-                    'ra': ra,
-                    'de': de,
-                    'primary_name': primary_name
-                }
+                name_to_info[name] = NameEntry(name, star, primary_name, score)
     
     print(f"  Extracted {len(name_to_info)} unique star names")
     print(f"  Added {greek_alternatives_added} Greek letter alternatives")
     return name_to_info
 
 def extract_dso_names(dso_data_file):
-    """Extract all DSO names from the DSO data JSON file"""
+    """Extract all DSO names from the extracted DSO catalog (.cols, .jsonl or .json)"""
     print("\nLoading DSO data...")
-    with open(dso_data_file, 'r', encoding='utf-8') as f:
-        dsos = json.load(f)
+    dsos = load_dso_table(dso_data_file,
+                          columns=['type', 'vmag', 'ra', 'de', 'smax', 'short_name', 'ids'])
     
     print(f"Processing {len(dsos)} DSOs...")
     
@@ -210,10 +293,6 @@ def extract_dso_names(dso_data_file):
     greek_alternatives_added = 0
     
     for dso in dsos:
-        obj_type = dso.get('type', 'Unknown')
-        vmag = dso.get('vmag')
-        ra = dso.get('ra')
-        de = dso.get('de')
         short_name = dso.get('short_name', '').strip()
         ids = dso.get('ids', '').strip()
         
@@ -224,11 +303,7 @@ def extract_dso_names(dso_data_file):
         if short_name:
             names.append(short_name)
             # Add Greek alternatives for short name
-            greek_alts = convert_greek_to_english(short_name)
-            for alt in greek_alts:
-                if alt not in names:
-                    names.append(alt)
-                    greek_alternatives_added += 1
+            greek_alternatives_added += add_greek_aliases(names, short_name)
         
         # Parse IDs field
         if ids:
@@ -240,116 +315,139 @@ def extract_dso_names(dso_data_file):
                 if part and part not in names:
                     names.append(part)
                     # Add Greek alternatives
-                    greek_alts = convert_greek_to_english(part)
-                    for alt in greek_alts:
-                        if alt not in names:
-                            names.append(alt)
-                            greek_alternatives_added += 1
+                    greek_alternatives_added += add_greek_aliases(names, part)
         
         # Store each name with its info
         primary_name = names[0] if names else 'Unnamed DSO'
+        score = object_score(dso.get('vmag'),
+                             messier=any(MESSIER_RE.match(name) for name in names),
+                             common_name=any(name.startswith('NAME ') for name in names),
+                             size=dso.get('smax'))
         for name in names:
             if name not in name_to_info:
-                name_to_info[name] = {
-                    'name': name,
-                    'type': 'dso',
-                    'dso_type': obj_type,
-                    'vmag': vmag,
-                    'ra': ra,
-                    'de': de,
-                    'primary_name': primary_name
-                }
+                name_to_info[name] = NameEntry(name, dso, primary_name, score)
     
     print(f"  Extracted {len(name_to_info)} unique DSO names")
     print(f"  Added {greek_alternatives_added} Greek letter alternatives")
     return name_to_info
 
-def create_name_index(star_names, dso_names, output_dir):
-    """Create index files for name suggestions"""
+def write_legacy_outputs(index, output_path):
+    """
+    Write name_index.json and name_index.csv: one row per name, with the
+    metadata of its object repeated for every alias
+    """
+    # Names sorted alphabetically for better search, as dicts
+    sorted_names = index.entries()
+
+    # Save to JSON (full index with all metadata)
+    json_file = output_path / 'name_index.json'
+    with open(json_file, 'w', encoding='utf-8') as f:
+        json.dump(sorted_names, f, indent=2, ensure_ascii=False)
+    print(f"✓ Saved full index to {json_file}")
+
+    # Save to CSV (for easy viewing/editing)
+    csv_file = output_path / 'name_index.csv'
+    with open(csv_file, 'w', newline='', encoding='utf-8') as f:
+        fieldnames = ['name', 'type', 'primary_name', 'vmag', 'ra', 'de', 'hip', 'hd', 'dso_type']
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(sorted_names)
+    print(f"✓ Saved CSV index to {csv_file}")
+    del sorted_names
+
+def create_name_index(star_names, dso_names, output_dir, legacy=False):
+    """
+    Create index files for name suggestions.  Every file is generated
+    from one NameIndex (see name_pool.py), which is also saved and returned.
+    name_index.json and .csv repeat the metadata of an object for each
+    of its names, so they are only written if legacy.
+    """
     output_path = Path(output_dir)
     output_path.mkdir(exist_ok=True)
     
-    # Combine all names
-    all_names = {**star_names, **dso_names}
+    # Deduplicated model: string pool, objects stored once, aliases as ids
+    index = NameIndex.build(star_names, dso_names)
+    star_list = index.names('star')
+    dso_list = index.names('dso')
     
     print(f"\n{'='*80}")
-    print(f"Total unique names: {len(all_names)}")
-    print(f"  Stars: {len(star_names)}")
-    print(f"  DSOs: {len(dso_names)}")
+    print(f"Total unique names: {len(index)}")
+    print(f"  Stars: {len(star_list)}")
+    print(f"  DSOs: {len(dso_list)}")
+    print(f"  Objects: {index.object_count}")
     print(f"{'='*80}\n")
     
-    # Sort names alphabetically for better search
-    sorted_names = sorted(all_names.values(), key=lambda x: x['name'].lower())
-    
-    # Save to JSON (full index with all metadata)
-    json_file = output_path / 'name_index.json'
-    with open(json_file, 'w', encoding='utf-8') as f:
-        json.dump(sorted_names, f, indent=2, ensure_ascii=False)
-    print(f"✓ Saved full index to {json_file}")
+    pool_file = output_path / 'name_index_pool.json'
+    index.save(pool_file)
+    print(f"✓ Saved string pool index to {pool_file}")
     
     # Save to JSON (compact - just names for autocomplete)
     compact_json_file = output_path / 'name_index_compact.json'
     compact_data = {
-        'stars': sorted([n['name'] for n in star_names.values()]),
-        'dsos': sorted([n['name'] for n in dso_names.values()]),
-        'all': sorted([n['name'] for n in all_names.values()])
+        'stars': star_list,
+        'dsos': dso_list,
+        'all': index.names()
     }
     with open(compact_json_file, 'w', encoding='utf-8') as f:
         json.dump(compact_data, f, indent=2, ensure_ascii=False)
     print(f"✓ Saved compact index to {compact_json_file}")
     
-    # Save to CSV (for easy viewing/editing)
-    csv_file = output_path / 'name_index.csv'
-    with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-        fieldnames = ['name', 'type', 'primary_name', 'vmag', 'ra', 'de', 'hip', 'hd', 'dso_type']
-        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
-        writer.writeheader()
-        writer.writerows(sorted_names)
-    print(f"✓ Saved CSV index to {csv_file}")
+    # Same names as a binary prefix trie, queried without parsing (see name_trie.py)
+    trie_file = output_path / 'name_index.trie'
+    trie_size = write_name_trie(trie_file, star_list, dso_list)
+    print(f"✓ Saved autocomplete trie to {trie_file} ({trie_size:,} bytes, "
+          f"compact JSON {compact_json_file.stat().st_size:,} bytes)")
+    
+    # Ranking score of each name (that of its object) for the search indexes
+    name_scores = index.name_scores()
+    
+    # Trigram index of the names for substring and typo-tolerant search (see name_grams.py)
+    grams_file = output_path / 'name_index.grams'
+    grams_size = write_name_grams(grams_file, star_list, dso_list, name_scores)
+    print(f"✓ Saved trigram index to {grams_file} ({grams_size:,} bytes)")
+    
+    # Suffix array of the lowercased names for infix search (see name_suffix.py)
+    suffix_file = output_path / 'name_index.sa'
+    suffix_size = write_name_suffixes(suffix_file, star_list, dso_list, name_scores)
+    print(f"✓ Saved suffix array to {suffix_file} ({suffix_size:,} bytes)")
+    
+    if legacy:
+        write_legacy_outputs(index, output_path)
     
     # Save to plain text (simple list for quick reference)
     txt_file = output_path / 'name_index.txt'
     with open(txt_file, 'w', encoding='utf-8') as f:
         f.write("Sky Object Name Index\n")
         f.write(f"{'='*80}\n\n")
-        f.write(f"Total names: {len(all_names)}\n")
-        f.write(f"Stars: {len(star_names)}\n")
-        f.write(f"DSOs: {len(dso_names)}\n\n")
+        f.write(f"Total names: {len(index)}\n")
+        f.write(f"Stars: {len(star_list)}\n")
+        f.write(f"DSOs: {len(dso_list)}\n\n")
         f.write(f"{'='*80}\n\n")
         
-        # Group by type
+        # Group by type, in index order
         f.write("STARS\n")
         f.write(f"{'-'*80}\n")
-        star_list = sorted([n for n in all_names.values() if n['type'] == 'star'], 
-                          key=lambda x: x['name'].lower())
-        for item in star_list:
-            f.write(f"{item['name']}\n")
+        for name_id in index.name_ids('star'):
+            f.write(f"{index.name(name_id)}\n")
         
         f.write(f"\n{'='*80}\n\n")
         f.write("DEEP SKY OBJECTS\n")
         f.write(f"{'-'*80}\n")
-        dso_list = sorted([n for n in all_names.values() if n['type'] == 'dso'], 
-                         key=lambda x: x['name'].lower())
-        for item in dso_list:
-            f.write(f"{item['name']}\n")
+        for name_id in index.name_ids('dso'):
+            f.write(f"{index.name(name_id)}\n")
     
     print(f"✓ Saved text list to {txt_file}")
     
     # Create statistics
     stats = {
-        'total_names': len(all_names),
-        'total_stars': len(star_names),
-        'total_dsos': len(dso_names),
-        'named_stars': len([n for n in star_names.values() if not n['name'].startswith('HIP') and not n['name'].startswith('HD')]),
-        'hip_only_stars': len([n for n in star_names.values() if n['name'].startswith('HIP')]),
-        'dso_types': {}
+        'total_names': len(index),
+        'total_stars': len(star_list),
+        'total_dsos': len(dso_list),
+        'named_stars': len([n for n in star_list if not n.startswith('HIP') and not n.startswith('HD')]),
+        'hip_only_stars': len([n for n in star_list if n.startswith('HIP')]),
+        'dso_types': index.dso_type_counts()
     }
     
-    # Count DSO types
-    for dso in dso_names.values():
-        dso_type = dso.get('dso_type', 'Unknown')
-        stats['dso_types'][dso_type] = stats['dso_types'].get(dso_type, 0) + 1
-    
     stats_file = output_path / 'name_index_stats.json'
     with open(stats_file, 'w', encoding='utf-8') as f:
         json.dump(stats, f, indent=2)
@@ -371,21 +469,28 @@ def create_name_index(star_names, dso_names, output_dir):
         print(f"    {dso_type}: {count:,}")
     print(f"{'='*80}\n")
     
-    return sorted_names
+    return index
 
 def main():
+    parser = argparse.ArgumentParser(description="Create the name index files")
+    parser.add_argument('--legacy', action='store_true',
+                        help='Also write name_index.json and name_index.csv, which repeat '
+                             'the metadata of an object for each of its names')
+    args = parser.parse_args()
+    
     # File paths
-    star_data_file = Path('stars_extracted/star_data.json')
-    dso_data_file = Path('dso_extracted/dso_data.json')
+    # star_data.cols, star_data.jsonl, or star_data.json from older runs
+    star_data_file = Path('stars_extracted/star_data')
+    dso_data_file = Path('dso_extracted/dso_data')
     output_dir = Path('name_index')
     
     # Check if input files exist
-    if not star_data_file.exists():
+    if not catalog_exists(star_data_file):
         print(f"ERROR: Star data file not found: {star_data_file}")
         print("Please run extract_star_data.py first")
         return
     
-    if not dso_data_file.exists():
+    if not catalog_exists(dso_data_file):
         print(f"ERROR: DSO data file not found: {dso_data_file}")
         print("Please run extract_dso_data.py first")
         return
@@ -398,28 +503,29 @@ def main():
     dso_names = extract_dso_names(dso_data_file)
     
     # Create index files
-    index = create_name_index(star_names, dso_names, output_dir)
+    index = create_name_index(star_names, dso_names, output_dir, legacy=args.legacy)
     
     # Show some examples
     print("\nSample entries:")
     print(f"{'-'*80}")
     
     # Show some named stars
-    named_stars = [n for n in index if n['type'] == 'star' and not n['name'].startswith('HIP')][:5]
+    star_ids = index.name_ids('star')
+    named_stars = [index.entry(i) for i in star_ids if not index.name(i).startswith('HIP')][:5]
     if named_stars:
         print("\nNamed Stars:")
         for star in named_stars:
             print(f"  {star['name']} (HIP {star.get('hip', 'N/A')}, mag {star.get('vmag', 'N/A'):.2f})")
     
     # Show some HIP stars
-    hip_stars = [n for n in index if n['type'] == 'star' and n['name'].startswith('HIP')][:5]
+    hip_stars = [index.entry(i) for i in star_ids if index.name(i).startswith('HIP')][:5]
     if hip_stars:
         print("\nHIP Stars:")
         for star in hip_stars:
             print(f"  {star['name']} (mag {star.get('vmag', 'N/A'):.2f})")
     
     # Show some DSOs
-    dsos = [n for n in index if n['type'] == 'dso'][:5]
+    dsos = [index.entry(i) for i in index.name_ids('dso')[:5]]
     if dsos:
         print("\nDSOs:")
         for dso in dsos:
@@ -429,11 +535,16 @@ def main():
     print("SUCCESS! Name index created.")
     print(f"{'='*80}")
     print(f"\nOutput files in '{output_dir}/':")
-    print(f"  - name_index.json (full index with metadata)")
     print(f"  - name_index_compact.json (compact for autocomplete)")
-    print(f"  - name_index.csv (spreadsheet format)")
+    print(f"  - name_index.trie (binary prefix trie for autocomplete)")
+    print(f"  - name_index.grams (trigram index for typo-tolerant search)")
+    print(f"  - name_index.sa (suffix array for infix search)")
+    print(f"  - name_index_pool.json (string pool, objects and aliases)")
     print(f"  - name_index.txt (plain text list)")
     print(f"  - name_index_stats.json (statistics)")
+    if args.legacy:
+        print(f"  - name_index.json (full index with metadata)")
+        print(f"  - name_index.csv (spreadsheet format)")
 
 if __name__ == "__main__":
     main()
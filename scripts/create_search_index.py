@@ -4,16 +4,18 @@ This creates SQLite databases for fast searching
 """
 
 import sqlite3
-import json
 from pathlib import Path
 
+from catalog import load_star_table, load_dso_table
+from catalog_io import catalog_exists
+
 def create_dso_index(json_file, db_file):
     """Create searchable DSO database"""
     print(f"Creating DSO search index from {json_file}...")
     
     # Load DSO data
-    with open(json_file, 'r', encoding='utf-8') as f:
-        dsos = json.load(f)
+    dsos = load_dso_table(json_file, columns=['type', 'vmag', 'bmag', 'ra', 'de', 'smax',
+                                               'smin', 'angl', 'morp', 'snam', 'ids'])
     
     # Create database
     conn = sqlite3.connect(db_file)
@@ -82,8 +84,8 @@ def create_star_index(json_file, db_file):
     print(f"Creating star search index from {json_file}...")
     
     # Load star data
-    with open(json_file, 'r', encoding='utf-8') as f:
-        stars = json.load(f)
+    stars = load_star_table(json_file, columns=['hip', 'hd', 'vmag', 'ra', 'de', 'plx',
+                                                'pra', 'pde', 'bv', 'ids'])
     
     # Create database
     conn = sqlite3.connect(db_file)
@@ -154,17 +156,18 @@ if __name__ == "__main__":
     print("="*80 + "\n")
     
     # Create DSO index
-    dso_json = Path('dso_extracted/dso_data.json')
+    # dso_data.cols, dso_data.jsonl, or dso_data.json from older runs
+    dso_json = Path('dso_extracted/dso_data')
     dso_db = Path('dso_extracted/dso_search.db')
-    if dso_json.exists():
+    if catalog_exists(dso_json):
         create_dso_index(dso_json, dso_db)
     else:
         print(f"⚠ DSO data not found: {dso_json}")
     
     # Create star index
-    star_json = Path('stars_extracted/star_data.json')
+    star_json = Path('stars_extracted/star_data')
     star_db = Path('stars_extracted/star_search.db')
-    if star_json.exists():
+    if catalog_exists(star_json):
         create_star_index(star_json, star_db)
     else:
         print(f"⚠ Star data not found: {star_json}")
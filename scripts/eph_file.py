@@ -0,0 +1,448 @@
+"""
+Shared reader for Stellarium .eph tile files.
+
+The binary layout is documented at the top of src/eph-file.c.  Tables are
+decoded column-wise: the 20 bytes column descriptors are turned into a NumPy
+structured dtype and the whole table is read with a single frombuffer call.
+"""
+
+import json
+import mmap
+import struct
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+# Float columns stored in radians that we export in degrees.
+STAR_DEGREE_COLUMNS = ('ra', 'de', 'pra', 'pde')
+DSO_DEGREE_COLUMNS = ('ra', 'de', 'smax', 'smin', 'angl')
+
+# Degree columns of each kind of table chunk.
+CHUNK_DEGREE_COLUMNS = {
+    'STAR': STAR_DEGREE_COLUMNS,
+    'STRS': STAR_DEGREE_COLUMNS,
+    'DSO ': DSO_DEGREE_COLUMNS,
+}
+
+# NumPy type for each eph column type ('s' columns use their own size).
+COLUMN_DTYPES = {
+    'f': '<f4',
+    'i': '<i4',
+    'Q': '<u8',
+}
+
+FILE_VERSION = 2
+
+TILE_HEADER_SIZE = 12
+TABLE_HEADER_SIZE = 16
+COLUMN_DESC_SIZE = 20
+
+COMPRESSED_BLOCK_HEADER_SIZE = 8
+
+# Entry of the EphFile chunk index.  offset is the position of the chunk
+# data in the file, crc the value stored after the data.
+EphChunk = namedtuple('EphChunk', ['type', 'offset', 'size', 'crc'])
+
+class EphFile:
+    """
+    Memory-mapped .eph file.
+
+    Opening a file only walks the chunk headers to build an index of
+    EphChunk entries; nothing is copied or decompressed.  Chunk data is
+    returned as memoryviews into the mapping, and tables are only inflated
+    when decode_table() is called, so tools can scan headers (nuniq, row
+    count, columns) of many tiles cheaply.
+
+    Memoryviews returned by chunk_data() should be released (or dropped)
+    before the file is closed.
+    """
+
+    def __init__(self, filepath):
+        self.path = filepath
+        with open(filepath, 'rb') as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Empty file
+                raise ValueError(f"Not a valid EPH file: {filepath}")
+        self._view = memoryview(self._mm)
+
+        if self._mm[:4] != b'EPHE':
+            self.close()
+            raise ValueError(f"Not a valid EPH file: {filepath}")
+        self.version = struct.unpack_from('<I', self._mm, 4)[0]
+        self.chunks = self._index_chunks()
+
+    def _index_chunks(self):
+        chunks = []
+        offset = 8
+        size = len(self._mm)
+        while offset + 8 <= size:
+            chunk_type = self._mm[offset:offset+4].decode('ascii', errors='ignore')
+            chunk_size = struct.unpack_from('<I', self._mm, offset + 4)[0]
+            if offset + 8 + chunk_size > size:
+                break
+            crc = 0
+            if offset + 12 + chunk_size <= size:
+                crc = struct.unpack_from('<I', self._mm, offset + 8 + chunk_size)[0]
+            chunks.append(EphChunk(chunk_type, offset + 8, chunk_size, crc))
+            offset += chunk_size + 12
+        return chunks
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Unmap the file"""
+        if self._mm is None:
+            return
+        mm, self._mm = self._mm, None
+        try:
+            self._view.release()
+            mm.close()
+        except BufferError:
+            # Some chunk views are still alive, the mapping will be
+            # released with them.
+            pass
+
+    def find_chunks(self, *types):
+        """Return the index entries of the chunks of the given types"""
+        return [chunk for chunk in self.chunks if chunk.type in types]
+
+    def chunk_data(self, chunk):
+        """Zero-copy memoryview of a chunk data"""
+        return self._view[chunk.offset:chunk.offset + chunk.size]
+
+    def read_json(self):
+        """Parse the JSON chunk if there is one (e.g. children_mask)"""
+        for chunk in self.find_chunks('JSON'):
+            return json.loads(bytes(self.chunk_data(chunk)))
+        return None
+
+    def table_info(self, chunk):
+        """Tile and table headers of a chunk, without decompression"""
+        return read_table_info(self.chunk_data(chunk))
+
+    def read_table_data(self, chunk, max_size=None):
+        """Inflate (the first max_size bytes of) the table data of a chunk"""
+        data = self.chunk_data(chunk)
+        offset = read_table_info(data)['data_offset']
+        return read_compressed_block(data[offset:], max_size)
+
+    def decode_table(self, chunk, degree_columns=()):
+        """Inflate and decode the table of a chunk, see decode_table()"""
+        return decode_table(self.chunk_data(chunk), degree_columns)
+
+def read_eph_file(filepath):
+    """
+    Read and parse an .eph file, copying every chunk data in memory.
+    Prefer EphFile, which maps the file and only decodes on demand.
+    """
+    with EphFile(filepath) as eph:
+        chunks = [{
+            'type': chunk.type,
+            'size': chunk.size,
+            'data': bytes(eph.chunk_data(chunk))
+        } for chunk in eph.chunks]
+        return eph.version, chunks
+
+def read_compressed_block_header(data, offset=0):
+    """Return the (data size, compressed size) declared by a compressed block"""
+    return struct.unpack_from('<II', data, offset)
+
+def read_compressed_block(data, max_size=None):
+    """
+    Read and decompress a data block, as eph_read_compressed_block does:
+    4 bytes data size, 4 bytes compressed size, then the zlib stream.
+
+    The output buffer is allocated once at the declared size.  With
+    max_size only the first max_size bytes are inflated, which is enough
+    for scans that only look at the start of a table.
+    """
+    size, comp_size = read_compressed_block_header(data)
+    start = COMPRESSED_BLOCK_HEADER_SIZE
+    if start + comp_size > len(data):
+        raise ValueError(f"Truncated compressed block: {comp_size} bytes declared, "
+                         f"{len(data) - start} available")
+    compressed_data = memoryview(data)[start:start + comp_size]
+
+    if max_size is not None and max_size < size:
+        inflater = zlib.decompressobj()
+        return inflater.decompress(compressed_data, max_size)
+
+    uncompressed_data = zlib.decompress(compressed_data, bufsize=max(size, 1))
+    if len(uncompressed_data) != size:
+        raise ValueError(f"Compressed block inflated to {len(uncompressed_data)} bytes, "
+                         f"{size} declared")
+    return uncompressed_data
+
+def unshuffle_bytes(data, row_size, num_rows):
+    """
+    Reverse byte shuffling.
+
+    Shuffled tables store byte j of every row together, so the data is a
+    (row_size, num_rows) byte matrix that we transpose back into rows.
+    This is what eph_shuffle_bytes(data, row_size, num_rows) does in
+    src/eph-file.c when a tile is loaded.
+    """
+    total_size = row_size * num_rows
+    if len(data) < total_size:
+        return data
+
+    shuffled = np.frombuffer(data, dtype=np.uint8, count=total_size)
+    return shuffled.reshape(row_size, num_rows).T.tobytes()
+
+def shuffle_bytes(data, row_size, num_rows):
+    """
+    Shuffle row bytes for better compression, the inverse of
+    unshuffle_bytes().  Matches eph_shuffle_bytes(data, num_rows, row_size)
+    in src/eph-file.c.
+    """
+    total_size = row_size * num_rows
+    if len(data) < total_size:
+        raise ValueError(f"Need {total_size} bytes to shuffle, got {len(data)}")
+
+    rows = np.frombuffer(data, dtype=np.uint8, count=total_size)
+    return rows.reshape(num_rows, row_size).T.tobytes()
+
+def nuniq_to_order_pix(nuniq):
+    """Split a HiPS nuniq value into (order, pix)"""
+    if nuniq <= 0:
+        return 0, 0
+    # Same as log2(nuniq / 4) / 2 in eph_read_tile_header, in integers.
+    order = ((nuniq // 4).bit_length() - 1) // 2
+    pix = nuniq - 4 * (1 << (2 * order))
+    return order, pix
+
+def parse_tile_header(chunk_data):
+    """Parse the 12 bytes tile header at the start of a chunk"""
+    version, nuniq = struct.unpack_from('<IQ', chunk_data, 0)
+    order, pix = nuniq_to_order_pix(nuniq)
+    return {
+        'version': version,
+        'nuniq': nuniq,
+        'order': order,
+        'pix': pix,
+    }
+
+def parse_table_header(chunk_data, offset=TILE_HEADER_SIZE):
+    """
+    Parse a table header and its column descriptors.
+    Returns the header dict and the offset of the compressed data block.
+    """
+    flags, row_size, n_col, n_row = struct.unpack_from('<4I', chunk_data, offset)
+    offset += TABLE_HEADER_SIZE
+
+    columns = []
+    for i in range(n_col):
+        col_name = bytes(chunk_data[offset:offset+4]).decode('ascii', errors='ignore').rstrip('\x00')
+        col_type_str = bytes(chunk_data[offset+4:offset+8]).decode('ascii', errors='ignore').rstrip('\x00')
+        col_type = col_type_str[0] if col_type_str else ''  # Type is single character
+        col_unit, col_start, col_size = struct.unpack_from('<3I', chunk_data, offset + 8)
+
+        columns.append({
+            'name': col_name,
+            'type': col_type,
+            'unit': col_unit,
+            'start': col_start,
+            'size': col_size
+        })
+        offset += COLUMN_DESC_SIZE
+
+    header = {
+        'flags': flags,
+        'row_size': row_size,
+        'n_col': n_col,
+        'n_row': n_row,
+        'columns': columns,
+    }
+    return header, offset
+
+def decode_strings(raw):
+    """
+    Decode a NumPy 'S' array into a list of str (UTF-8, invalid bytes
+    dropped, as the per-cell decode did).  The cells are joined with NUL
+    separators and decoded in a single call; NUL never takes part in a
+    multi-byte sequence, so only a cell holding a NUL itself (detected by
+    the number of parts) needs the per-cell fallback.
+    """
+    cells = raw.tolist()
+    if not cells:
+        return []
+    values = b'\x00'.join(cells).decode('utf-8', errors='ignore').split('\x00')
+    if len(values) != len(cells):
+        values = [v.decode('utf-8', errors='ignore') for v in cells]
+    return values
+
+class StringColumn:
+    """
+    Fixed-width string column of a decoded table.
+
+    Behaves as a read-only sequence of str, but nothing is decoded until
+    the values are used, and then the whole column is decoded at once.
+    The raw bytes stay available as .raw (a NumPy 'S' array, trailing
+    NULs stripped on access) for consumers that only compare prefixes or
+    hash the values.
+    """
+
+    __slots__ = ('raw', '_values')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._values = None
+
+    def __len__(self):
+        return len(self.raw)
+
+    def tolist(self):
+        """The decoded values, as a list of str"""
+        if self._values is None:
+            self._values = decode_strings(self.raw)
+        return self._values
+
+    def __getitem__(self, index):
+        if self._values is None and isinstance(index, (int, np.integer)):
+            return self.raw[index].decode('utf-8', errors='ignore')
+        return self.tolist()[index]
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array(self.tolist(), dtype=dtype if dtype is not None else str)
+
+    def __eq__(self, other):
+        if isinstance(other, StringColumn):
+            other = other.tolist()
+        return self.tolist() == list(other)
+
+    def __repr__(self):
+        return f"StringColumn({self.raw!r})"
+
+    def take(self, index):
+        """Rows selected by an integer or boolean index, still undecoded"""
+        return StringColumn(self.raw[index])
+
+    def startswith(self, prefix):
+        """Boolean mask of the values starting with prefix (str or bytes)"""
+        if isinstance(prefix, str):
+            prefix = prefix.encode('utf-8')
+        return np.char.startswith(self.raw, prefix)
+
+def concat_string_columns(columns):
+    """Concatenate StringColumns without decoding them"""
+    return StringColumn(np.concatenate([col.raw for col in columns]))
+
+def table_dtype(columns, row_size):
+    """
+    Build a NumPy structured dtype matching the row layout described by
+    the column descriptors.  Columns of unknown type are left out.
+    """
+    names, formats, offsets = [], [], []
+    for col in columns:
+        if col['type'] == 's':
+            fmt = f"S{col['size']}"
+        elif col['type'] in COLUMN_DTYPES:
+            fmt = COLUMN_DTYPES[col['type']]
+        else:
+            continue
+        if col['name'] in names:
+            continue
+        names.append(col['name'])
+        formats.append(fmt)
+        offsets.append(col['start'])
+    return np.dtype({
+        'names': names,
+        'formats': formats,
+        'offsets': offsets,
+        'itemsize': row_size,
+    })
+
+def read_table_info(chunk_data):
+    """
+    Parse the tile and table headers of a chunk without inflating the
+    data.  The returned dict also holds 'data_offset', the position of the
+    compressed block in the chunk, and the 'data_size' and 'comp_size'
+    it declares.
+    """
+    header = parse_tile_header(chunk_data)
+    table, offset = parse_table_header(chunk_data, TILE_HEADER_SIZE)
+    header.update(table)
+    header['data_offset'] = offset
+    header['data_size'], header['comp_size'] = read_compressed_block_header(chunk_data, offset)
+    return header
+
+def decode_records(table_data, header, degree_columns=()):
+    """
+    Turn the unshuffled row data of a table into a columnar table, see
+    decode_table().
+    """
+    columns = header['columns']
+    row_size = header['row_size']
+    n_row = header['n_row']
+    if len(table_data) < row_size * n_row:
+        raise ValueError(f"Table data too short: {len(table_data)} bytes "
+                         f"for {n_row} rows of {row_size} bytes")
+
+    records = np.frombuffer(table_data, dtype=table_dtype(columns, row_size),
+                            count=n_row)
+
+    table = {}
+    for col in columns:
+        name = col['name']
+        if name in table:
+            continue
+        if name not in records.dtype.names:
+            table[name] = None
+        elif col['type'] == 's':
+            table[name] = StringColumn(np.ascontiguousarray(records[name]))
+        elif col['type'] == 'f':
+            values = records[name].astype(np.float64)
+            if name in degree_columns:
+                values = values * 180.0 / 3.14159265359
+            table[name] = values
+        else:
+            table[name] = np.ascontiguousarray(records[name])
+    return table
+
+def decode_table(chunk_data, degree_columns=()):
+    """
+    Decode the table stored in a tile chunk.
+
+    Returns (header, columns, table) where table maps each column name to a
+    NumPy array (float columns as float64, in degrees for degree_columns).
+    String columns are returned as StringColumn, decoded on first use.
+    Columns of unknown type map to None.
+    """
+    header = read_table_info(chunk_data)
+    table_data = read_compressed_block(chunk_data[header['data_offset']:])
+    # Unshuffle if needed
+    if header['flags'] & 1:
+        table_data = unshuffle_bytes(table_data, header['row_size'], header['n_row'])
+    table = decode_records(table_data, header, degree_columns)
+    return header, header['columns'], table
+
+def table_num_rows(table):
+    """Number of rows in a decoded table"""
+    for values in table.values():
+        if values is not None:
+            return len(values)
+    return 0
+
+def table_to_rows(table):
+    """Convert a columnar table into a list of per-row dicts"""
+    n_row = table_num_rows(table)
+    names = list(table.keys())
+    values = []
+    for name in names:
+        col = table[name]
+        if col is None:
+            values.append([None] * n_row)
+        elif isinstance(col, np.ndarray):
+            values.append(col.tolist())
+        else:
+            values.append(col)
+    return [dict(zip(names, row)) for row in zip(*values)]
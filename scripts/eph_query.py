@@ -0,0 +1,351 @@
+"""
+Cone queries directly over the .eph tiles of a star or DSO survey.
+
+Usage: python scripts/eph_query.py <survey_dir> <ra> <dec> <radius> [--max-vmag M] [--min-vmag M]
+       python scripts/eph_query.py <survey_dir> --max-vmag M [--min-vmag M]
+
+All angles are in degrees.  For each Norder present in the survey we keep
+the tiles whose HEALPix pixel can intersect the cone (pixel center closer
+than radius + the maximum pixel radius at that order), only open those
+tiles, and filter their rows with vectorized angular distances.
+
+If the survey has a tile index (see tile_index.py), tiles that it proves
+empty or out of the magnitude range are skipped without being opened.
+"""
+
+import argparse
+import math
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from eph_file import EphFile, decode_table, table_num_rows, CHUNK_DEGREE_COLUMNS
+from eph_file import StringColumn, concat_string_columns
+from eph_survey import list_tiles, tile_order_pix
+from tile_index import load_tile_index
+
+# Nested HEALPix face layout (same tables as chealpix pix2ang_nest).
+JRLL = np.array([2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4], dtype=np.int64)
+JPLL = np.array([1, 3, 5, 7, 0, 2, 4, 6, 1, 3, 5, 7], dtype=np.int64)
+
+def _compress_bits(v):
+    # Keep the even bits of v, packed: inverse of the nested bit interleave.
+    v = v & 0x5555555555555555
+    v = (v | (v >> 1)) & 0x3333333333333333
+    v = (v | (v >> 2)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v >> 4)) & 0x00FF00FF00FF00FF
+    v = (v | (v >> 8)) & 0x0000FFFF0000FFFF
+    v = (v | (v >> 16)) & 0x00000000FFFFFFFF
+    return v
+
+def _spread_bits(v):
+    # Move the bits of v to the even positions: the nested bit interleave.
+    v = v & 0x00000000FFFFFFFF
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    v = (v | (v << 1)) & 0x5555555555555555
+    return v
+
+def _z_phi_to_vec(z, phi):
+    sin_theta = np.sqrt(np.maximum(0.0, 1.0 - z * z))
+    return np.stack([sin_theta * np.cos(phi), sin_theta * np.sin(phi), z], axis=-1)
+
+def pix2vec_nest(order, pix):
+    """Unit vectors of the centers of nested HEALPix pixels at an order"""
+    nside = 1 << order
+    npface = nside * nside
+    pix = np.asarray(pix, dtype=np.int64)
+    face = pix // npface
+    ipf = pix % npface
+    ix = _compress_bits(ipf)
+    iy = _compress_bits(ipf >> 1)
+
+    jr = JRLL[face] * nside - ix - iy - 1
+    north = jr < nside
+    south = jr > 3 * nside
+    nr = np.where(north, jr, np.where(south, 4 * nside - jr, nside))
+    z = np.where(north, 1.0 - nr * nr / (3.0 * npface),
+                 np.where(south, nr * nr / (3.0 * npface) - 1.0,
+                          (2 * nside - jr) * 2.0 / (3.0 * nside)))
+    kshift = np.where(north | south, 0, (jr - nside) & 1)
+
+    jp = (JPLL[face] * nr + ix - iy + 1 + kshift) // 2
+    jp = np.where(jp > 4 * nside, jp - 4 * nside, jp)
+    jp = np.where(jp < 1, jp + 4 * nside, jp)
+    phi = (jp - (kshift + 1) * 0.5) * (math.pi / 2 / nr)
+    return _z_phi_to_vec(z, phi)
+
+def ang2pix_nest(order, ra, dec):
+    """Nested HEALPix pixels at an order of equatorial coordinates in degrees"""
+    nside = 1 << order
+    z = np.sin(np.radians(dec))
+    za = np.abs(z)
+    tt = np.mod(np.radians(ra) * (2 / math.pi), 4.0)
+
+    # Equatorial region
+    temp1 = nside * (0.5 + tt)
+    temp2 = nside * (z * 0.75)
+    jp = (temp1 - temp2).astype(np.int64)
+    jm = (temp1 + temp2).astype(np.int64)
+    ifp = jp >> order
+    ifm = jm >> order
+    face = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ix = jm & (nside - 1)
+    iy = nside - (jp & (nside - 1)) - 1
+
+    # Polar caps
+    polar = za > 2.0 / 3.0
+    if polar.any():
+        ntt = np.minimum(3, tt[polar].astype(np.int64))
+        tp = tt[polar] - ntt
+        tmp = nside * np.sqrt(3 * (1 - za[polar]))
+        pjp = np.minimum((tp * tmp).astype(np.int64), nside - 1)
+        pjm = np.minimum(((1 - tp) * tmp).astype(np.int64), nside - 1)
+        north = z[polar] >= 0
+        face[polar] = np.where(north, ntt, ntt + 8)
+        ix[polar] = np.where(north, nside - pjm - 1, pjp)
+        iy[polar] = np.where(north, nside - pjp - 1, pjm)
+
+    return (face << (2 * order)) + _spread_bits(ix) + (_spread_bits(iy) << 1)
+
+def max_pixrad(order):
+    """
+    Maximum angular distance (radians) between a pixel center and any of
+    its corners at this order (as Healpix_Base::max_pixrad).
+    """
+    nside = 1 << order
+    va = _z_phi_to_vec(np.array(2.0 / 3.0), np.array(math.pi / (4 * nside)))
+    t1 = (1.0 - 1.0 / nside) ** 2
+    vb = _z_phi_to_vec(np.array(1.0 - t1 / 3.0), np.array(0.0))
+    return math.acos(min(1.0, float(np.dot(va, vb))))
+
+def radec_to_vec(ra, dec):
+    """Unit vector(s) of equatorial coordinates in degrees"""
+    ra = np.radians(ra)
+    dec = np.radians(dec)
+    cos_dec = np.cos(dec)
+    return np.stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)], axis=-1)
+
+def angular_distance(ra1, dec1, ra2, dec2):
+    """Angular distance in degrees (haversine, accurate at small angles)"""
+    ra1, dec1, ra2, dec2 = map(np.radians, (ra1, dec1, ra2, dec2))
+    a = (np.sin((dec2 - dec1) / 2) ** 2 +
+         np.cos(dec1) * np.cos(dec2) * np.sin((ra2 - ra1) / 2) ** 2)
+    return np.degrees(2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))))
+
+def concat_tables(tables):
+    """Concatenate columnar tables with the same columns"""
+    if not tables:
+        return {}
+    result = {}
+    for name, first in tables[0].items():
+        if first is None:
+            result[name] = None
+        elif isinstance(first, np.ndarray):
+            result[name] = np.concatenate([table[name] for table in tables])
+        elif all(isinstance(table[name], StringColumn) for table in tables):
+            result[name] = concat_string_columns([table[name] for table in tables])
+        else:
+            result[name] = [value for table in tables for value in table[name]]
+    return result
+
+def take_rows(table, index):
+    """Select rows of a columnar table with an integer or boolean index"""
+    index = np.asarray(index)
+    if index.dtype == bool:
+        index = np.flatnonzero(index)
+    result = {}
+    for name, values in table.items():
+        if values is None:
+            result[name] = None
+        elif isinstance(values, (np.ndarray, StringColumn)):
+            result[name] = values[index] if isinstance(values, np.ndarray) \
+                else values.take(index)
+        else:
+            result[name] = [values[i] for i in index.tolist()]
+    return result
+
+class SurveyQuery:
+    """
+    Spatial queries over one survey directory.  The tile list is read once;
+    decoded tiles are kept in a small LRU cache since successive queries
+    (e.g. a moving AR view) mostly hit the same tiles.
+
+    index is a TileIndex; by default the one of the survey is used if it
+    was built.  Pass index=False to always open every candidate tile.
+    """
+
+    def __init__(self, survey_dir, cache_size=64, index=None):
+        self.survey_dir = survey_dir
+        self.cache_size = cache_size
+        self.index = load_tile_index(survey_dir) if index is None else index
+        self._cache = OrderedDict()
+        self.orders = {}
+        for path in list_tiles(survey_dir):
+            try:
+                order, pix = tile_order_pix(path)
+            except ValueError:
+                continue
+            self.orders.setdefault(order, ([], []))
+            self.orders[order][0].append(pix)
+            self.orders[order][1].append(path)
+        self._centers = {
+            order: (np.array(pixs, dtype=np.int64), pix2vec_nest(order, pixs), paths)
+            for order, (pixs, paths) in self.orders.items()
+        }
+
+    def _may_contain(self, path, min_vmag=None, max_vmag=None):
+        if not self.index:
+            return True
+        return self.index.may_contain(path, min_vmag, max_vmag)
+
+    def tiles_in_cone(self, ra, dec, radius):
+        """
+        Tiles whose pixel can intersect the cone of radius degrees around
+        (ra, dec).  This is purely geometric, the index is not consulted.
+        """
+        center = radec_to_vec(ra, dec)
+        tiles = []
+        for order in sorted(self._centers):
+            pixs, vecs, paths = self._centers[order]
+            limit = math.radians(radius) + max_pixrad(order)
+            if limit >= math.pi:
+                tiles.extend(paths)
+                continue
+            keep = vecs @ center >= math.cos(limit)
+            tiles.extend(paths[i] for i in np.flatnonzero(keep))
+        return tiles
+
+    def read_tile(self, path):
+        """Decoded tables of a tile, through the LRU cache"""
+        key = (str(path), os.stat(path).st_mtime_ns)
+        tables = self._cache.get(key)
+        if tables is not None:
+            self._cache.move_to_end(key)
+            return tables
+        tables = []
+        with EphFile(path) as eph:
+            for chunk in eph.chunks:
+                if chunk.type not in CHUNK_DEGREE_COLUMNS:
+                    continue
+                header, columns, table = decode_table(
+                    eph.chunk_data(chunk), CHUNK_DEGREE_COLUMNS[chunk.type])
+                tables.append(table)
+        self._cache[key] = tables
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return tables
+
+    def tiles_to_read(self, ra, dec, radius, max_vmag=None, min_vmag=None):
+        """Tiles a cone query has to open, after consulting the index"""
+        return [path for path in self.tiles_in_cone(ra, dec, radius)
+                if self._may_contain(path, min_vmag, max_vmag)]
+
+    def cone(self, ra, dec, radius, max_vmag=None, min_vmag=None):
+        """
+        Objects within radius degrees of (ra, dec), optionally with
+        min_vmag <= vmag <= max_vmag.  Returns a columnar table (with an
+        extra 'dist' column in degrees) sorted by distance.
+        """
+        matches = []
+        for path in self.tiles_to_read(ra, dec, radius, max_vmag, min_vmag):
+            for table in self.read_tile(path):
+                if not table_num_rows(table):
+                    continue
+                keep = np.ones(table_num_rows(table), dtype=bool)
+                vmag = table.get('vmag')
+                if max_vmag is not None and vmag is not None:
+                    keep &= vmag <= max_vmag
+                if min_vmag is not None and vmag is not None:
+                    keep &= vmag >= min_vmag
+                dist = angular_distance(ra, dec, table['ra'], table['de'])
+                keep &= dist <= radius
+                if keep.any():
+                    match = take_rows(table, keep)
+                    match['dist'] = dist[keep]
+                    matches.append(match)
+        result = concat_tables(matches)
+        if result:
+            result = take_rows(result, np.argsort(result['dist'], kind='stable'))
+        return result
+
+    def tiles_in_range(self, min_vmag=None, max_vmag=None):
+        """Tiles a magnitude query has to open, after consulting the index"""
+        return [path for order in sorted(self.orders)
+                for path in self.orders[order][1]
+                if self._may_contain(path, min_vmag, max_vmag)]
+
+    def select(self, min_vmag=None, max_vmag=None):
+        """
+        Objects of the whole survey with min_vmag <= vmag <= max_vmag, as a
+        columnar table in tile order.
+        """
+        matches = []
+        for path in self.tiles_in_range(min_vmag, max_vmag):
+            for table in self.read_tile(path):
+                vmag = table.get('vmag')
+                if not table_num_rows(table) or vmag is None:
+                    continue
+                keep = np.ones(len(vmag), dtype=bool)
+                if min_vmag is not None:
+                    keep &= vmag >= min_vmag
+                if max_vmag is not None:
+                    keep &= vmag <= max_vmag
+                if keep.any():
+                    matches.append(take_rows(table, keep))
+        return concat_tables(matches)
+
+def cone_search(survey_dir, ra, dec, radius, max_vmag=None, min_vmag=None):
+    """One-off cone query, see SurveyQuery.cone"""
+    return SurveyQuery(survey_dir).cone(ra, dec, radius, max_vmag, min_vmag)
+
+def main():
+    parser = argparse.ArgumentParser(description="Cone search over .eph tiles")
+    parser.add_argument('survey_dir', help='e.g. apps/web-frontend/public/skydata/stars')
+    parser.add_argument('ra', type=float, nargs='?', help='Right ascension in degrees')
+    parser.add_argument('dec', type=float, nargs='?', help='Declination in degrees')
+    parser.add_argument('radius', type=float, nargs='?', help='Radius in degrees')
+    parser.add_argument('--min-vmag', type=float, default=None)
+    parser.add_argument('--max-vmag', type=float, default=None)
+    parser.add_argument('--no-index', action='store_true',
+                        help='Do not use the tile index of the survey')
+    parser.add_argument('--limit', type=int, default=20, help='Number of rows to print')
+    args = parser.parse_args()
+
+    is_cone = args.radius is not None
+    if not is_cone and args.min_vmag is None and args.max_vmag is None:
+        parser.error("give ra, dec and radius, or a magnitude range")
+
+    query = SurveyQuery(args.survey_dir, index=False if args.no_index else None)
+    start = time.perf_counter()
+    if is_cone:
+        tiles = query.tiles_to_read(args.ra, args.dec, args.radius,
+                                    args.max_vmag, args.min_vmag)
+        result = query.cone(args.ra, args.dec, args.radius, args.max_vmag, args.min_vmag)
+    else:
+        tiles = query.tiles_in_range(args.min_vmag, args.max_vmag)
+        result = query.select(args.min_vmag, args.max_vmag)
+    elapsed = time.perf_counter() - start
+
+    count = table_num_rows(result) if result else 0
+    print(f"{count} objects in {len(tiles)} tiles ({elapsed * 1000:.1f} ms)\n")
+    if not count:
+        return
+    names = [name for name, values in result.items() if values is not None]
+    print('  '.join(f"{name:>10s}" for name in names))
+    for i in range(min(count, args.limit)):
+        cells = []
+        for name in names:
+            value = result[name][i]
+            if isinstance(value, (float, np.floating)):
+                cells.append(f"{value:10.4f}")
+            else:
+                cells.append(f"{str(value)[:10]:>10s}")
+        print('  '.join(cells))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Helpers to work on a whole HiPS survey of .eph tiles
+(e.g. apps/web-frontend/public/skydata/stars).
+
+Tiles are always listed in HEALPix order (Norder, then Npix) so that
+outputs are deterministic whatever the file system order or the number of
+worker processes.
+"""
+
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from pathlib import Path
+
+from eph_file import EphFile, decode_table
+
+TILE_NAME_RE = re.compile(r'Norder(\d+)[\\/]Dir\d+[\\/]Npix(\d+)\.eph$')
+
+def tile_order_pix(path):
+    """Return (order, pix) from a tile path like Norder1/Dir0/Npix13.eph"""
+    match = TILE_NAME_RE.search(str(path))
+    if not match:
+        raise ValueError(f"Not a HiPS tile path: {path}")
+    return int(match.group(1)), int(match.group(2))
+
+def tile_sort_key(path):
+    """Sort key putting tiles in HEALPix order, other files last"""
+    try:
+        return (0,) + tile_order_pix(path) + (str(path),)
+    except ValueError:
+        return (1, 0, 0, str(path))
+
+def list_tiles(survey_dir, max_files=None):
+    """List the .eph files of a survey in HEALPix order"""
+    tiles = sorted(Path(survey_dir).rglob('*.eph'), key=tile_sort_key)
+    if max_files:
+        tiles = tiles[:max_files]
+    return tiles
+
+def default_workers():
+    """Number of worker processes to use when none is given"""
+    return os.cpu_count() or 1
+
+def read_tile_tables(path, chunk_types, degree_columns=()):
+    """
+    Decode all the tables of the given chunk types in one tile.
+    Returns (tables, errors): one columnar table per chunk that could be
+    decoded, and one message per chunk that could not.
+    """
+    tables = []
+    errors = []
+    with EphFile(path) as eph:
+        for chunk in eph.find_chunks(*chunk_types):
+            try:
+                header, columns, table = decode_table(eph.chunk_data(chunk),
+                                                      degree_columns)
+                tables.append(table)
+            except Exception as e:
+                errors.append(f"Error parsing {chunk.type.strip()} chunk: {e}")
+    return tables, errors
+
+def _call_tile(func, path):
+    # Run in the workers: never let one bad tile abort the whole pool.
+    try:
+        return func(path), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+def map_tiles(func, paths, workers=1):
+    """
+    Apply func(path) to every tile, spread over a pool of worker processes.
+
+    Yields (path, result, error) in the order of paths, whatever order the
+    workers finish in.  error is None on success, otherwise a message and
+    result is None.  func must be picklable (a module level function or a
+    functools.partial of one).  workers=1 runs everything in process.
+
+    Only a few tiles per worker are in flight at any time, so results that
+    are consumed as they come keep memory bounded.
+    """
+    paths = list(paths)
+    if workers is None:
+        workers = default_workers()
+    workers = max(1, min(workers, len(paths)))
+
+    if workers == 1:
+        for path in paths:
+            result, error = _call_tile(func, path)
+            yield path, result, error
+        return
+
+    path_iter = iter(paths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for path in islice(path_iter, workers * 2):
+            pending.append((path, pool.submit(_call_tile, func, path)))
+        while pending:
+            path, future = pending.popleft()
+            result, error = future.result()
+            for next_path in islice(path_iter, 1):
+                pending.append((next_path, pool.submit(_call_tile, func, next_path)))
+            yield path, result, error
+
+def iter_survey_tables(tiles, chunk_types, degree_columns=(), workers=1, cache=None):
+    """
+    Yield (path, tables, errors) for every tile, in the order of tiles.
+
+    Without cache every tile is decoded (by `workers` processes) and
+    streamed.  With a TileCache only new or changed tiles are decoded and
+    stored in the cache, then every tile is read back from the cache in
+    order, so unchanged tiles are never inflated again.
+    """
+    read_tile = partial(read_tile_tables, chunk_types=chunk_types,
+                        degree_columns=degree_columns)
+    if cache is None:
+        for path, result, error in map_tiles(read_tile, tiles, workers):
+            if error:
+                yield path, [], [f"Error: {error}"]
+            else:
+                yield path, result[0], result[1]
+        return
+
+    failed = {}
+    for path, result, error in map_tiles(read_tile, cache.changed_tiles(tiles), workers):
+        if error:
+            failed[path] = ([], [f"Error: {error}"])
+            continue
+        tables, errors = result
+        cache.store(path, tables, complete=not errors)
+        if errors:
+            failed[path] = (tables, errors)
+
+    for path in tiles:
+        if path in failed:
+            yield (path,) + failed[path]
+        else:
+            yield path, cache.load(path), []
+
+def format_tile_error(path, error):
+    """One line description of a tile failure, with its HEALPix position"""
+    try:
+        order, pix = tile_order_pix(path)
+        return f"Norder{order} Npix{pix} ({path}): {error}"
+    except ValueError:
+        return f"{path}: {error}"
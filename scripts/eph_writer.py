@@ -0,0 +1,332 @@
+"""
+Writer for Stellarium .eph tile files, the inverse of eph_file.py.
+
+Usage:
+    python scripts/eph_writer.py rewrite <survey_dir> <output_dir> [--level 6] [-j N]
+    python scripts/eph_writer.py levels <survey_dir> [--levels 1-9] [--json report.json]
+
+'rewrite' decodes every tile of a survey and encodes it again (file
+header, chunks with their CRC, tile header, table header, column
+descriptors and shuffled zlib payload), compressing the tiles in a pool of
+worker processes.  With --level 6 and --no-crc the bundled tiles are
+reproduced byte for byte.
+
+'levels' reports, for each tile, the compressed size and the time to
+inflate it at every zlib level, plus an estimate of the total load time
+(download + inflate) at a given bandwidth, to choose the level of a
+survey for mobile devices.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import struct
+import time
+import zlib
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+
+from eph_file import EphFile, decode_table, read_table_info, read_compressed_block
+from eph_file import shuffle_bytes, table_dtype, table_num_rows, StringColumn
+from eph_file import CHUNK_DEGREE_COLUMNS, FILE_VERSION
+from eph_survey import list_tiles, map_tiles, format_tile_error
+from timing import best_time
+
+# zlib level of the bundled tiles.
+DEFAULT_LEVEL = 6
+
+# Version written in the tile header of table chunks.
+TILE_VERSION = 3
+
+def encode_compressed_block(data, level=DEFAULT_LEVEL):
+    """Compressed data block: data size, compressed size, zlib stream"""
+    compressed = zlib.compress(data, level)
+    return struct.pack('<II', len(data), len(compressed)) + compressed
+
+def encode_tile_header(nuniq, version=TILE_VERSION):
+    return struct.pack('<IQ', version, nuniq)
+
+def encode_table_header(flags, row_size, n_row, columns):
+    """Table header followed by the 20 bytes column descriptors"""
+    parts = [struct.pack('<4I', flags, row_size, len(columns), n_row)]
+    for col in columns:
+        parts.append(struct.pack('<4s4s3I',
+                                 col['name'].encode('ascii'),
+                                 col['type'].encode('ascii'),
+                                 col['unit'], col['start'], col['size']))
+    return b''.join(parts)
+
+def encode_table_rows(table, columns, row_size, degree_columns=()):
+    """
+    Pack a columnar table (as returned by decode_table) into row-major
+    bytes.  Float columns listed in degree_columns are converted back from
+    degrees to radians.  Bytes not covered by any column are zero.
+    """
+    n_row = table_num_rows(table)
+    dtype = table_dtype(columns, row_size)
+    records = np.zeros(n_row, dtype=dtype)
+    for name in dtype.names:
+        values = table.get(name)
+        if values is None:
+            continue
+        if len(values) != n_row:
+            raise ValueError(f"Column '{name}' has {len(values)} rows, expected {n_row}")
+        if dtype[name].kind == 'S':
+            if isinstance(values, StringColumn):
+                # Undecoded column: keep the bytes as they were read.
+                values = values.raw.tolist()
+            else:
+                values = [v.encode('utf-8') if isinstance(v, str) else v for v in values]
+            longest = max((len(v) for v in values), default=0)
+            if longest > dtype[name].itemsize:
+                raise ValueError(f"Column '{name}' holds {dtype[name].itemsize} bytes, "
+                                 f"got a {longest} bytes value")
+            records[name] = values
+        elif name in degree_columns:
+            records[name] = np.asarray(values, dtype=np.float64) * 3.14159265359 / 180.0
+        else:
+            records[name] = values
+    return records.tobytes(), n_row
+
+def encode_table_chunk(table, columns, row_size, nuniq, flags=1,
+                       level=DEFAULT_LEVEL, degree_columns=(),
+                       tile_version=TILE_VERSION):
+    """
+    Data of a table chunk: tile header, table header and the compressed
+    rows, byte shuffled if flags & 1.
+    """
+    data, n_row = encode_table_rows(table, columns, row_size, degree_columns)
+    if flags & 1:
+        data = shuffle_bytes(data, row_size, n_row)
+    return (encode_tile_header(nuniq, tile_version) +
+            encode_table_header(flags, row_size, n_row, columns) +
+            encode_compressed_block(data, level))
+
+def encode_chunk(chunk_type, data, crc=True):
+    """
+    A file chunk: type, size, data and CRC.  The CRC is the zlib crc32 of
+    the data; the engine does not check it yet, so crc=False writes 0 as
+    the existing tiles do.
+    """
+    chunk_type = chunk_type.encode('ascii')
+    if len(chunk_type) != 4:
+        raise ValueError(f"Chunk type must be 4 characters: {chunk_type!r}")
+    value = zlib.crc32(data) if crc else 0
+    return chunk_type + struct.pack('<I', len(data)) + bytes(data) + struct.pack('<I', value)
+
+def encode_eph_file(chunks, version=FILE_VERSION, crc=True):
+    """Whole file from a list of (chunk type, chunk data)"""
+    parts = [b'EPHE', struct.pack('<I', version)]
+    for chunk_type, data in chunks:
+        parts.append(encode_chunk(chunk_type, data, crc))
+    return b''.join(parts)
+
+def write_eph_file(path, chunks, version=FILE_VERSION, crc=True):
+    """Write a file atomically, see encode_eph_file()"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(encode_eph_file(chunks, version, crc))
+    os.replace(tmp_path, path)
+
+def encode_tile(path, level=DEFAULT_LEVEL, crc=True):
+    """
+    Decode a tile and encode it again.  Table chunks are re-encoded with
+    the given zlib level, other chunks (JSON) are copied as is.
+    """
+    chunks = []
+    with EphFile(path) as eph:
+        version = eph.version
+        for chunk in eph.chunks:
+            data = eph.chunk_data(chunk)
+            if chunk.type in CHUNK_DEGREE_COLUMNS:
+                header, columns, table = decode_table(data)
+                data = encode_table_chunk(table, columns, header['row_size'],
+                                          header['nuniq'], header['flags'],
+                                          level, tile_version=header['version'])
+            else:
+                data = bytes(data)
+            chunks.append((chunk.type, data))
+    return encode_eph_file(chunks, version, crc)
+
+def _rewrite_tile(path, survey_dir, output_dir, level, crc):
+    # Worker: re-encode one tile into output_dir, return the sizes.
+    data = encode_tile(path, level, crc)
+    output_path = Path(output_dir) / Path(path).relative_to(survey_dir)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_bytes(data)
+    return os.path.getsize(path), len(data)
+
+def rewrite_survey(survey_dir, output_dir, level=DEFAULT_LEVEL, crc=True, workers=None):
+    """
+    Re-encode every tile of a survey into output_dir (in parallel) and copy
+    the other files (properties).  Returns (input size, output size, errors).
+    """
+    survey_dir = Path(survey_dir)
+    output_dir = Path(output_dir)
+    for path in survey_dir.rglob('*'):
+        if path.is_file() and path.suffix != '.eph':
+            target = output_dir / path.relative_to(survey_dir)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(path, target)
+
+    rewrite = partial(_rewrite_tile, survey_dir=survey_dir, output_dir=output_dir,
+                      level=level, crc=crc)
+    in_size = out_size = 0
+    errors = []
+    for path, sizes, error in map_tiles(rewrite, list_tiles(survey_dir), workers):
+        if error:
+            errors.append(format_tile_error(path, error))
+            continue
+        in_size += sizes[0]
+        out_size += sizes[1]
+    return in_size, out_size, errors
+
+def tile_level_report(path, levels, repeat=3):
+    """
+    Compressed size, deflate and inflate time of the table payloads of a
+    tile at each zlib level.  Payloads are compressed as they are stored,
+    i.e. already byte shuffled.
+    """
+    payloads = []
+    with EphFile(path) as eph:
+        for chunk in eph.find_chunks(*CHUNK_DEGREE_COLUMNS):
+            data = eph.chunk_data(chunk)
+            offset = read_table_info(data)['data_offset']
+            payloads.append(read_compressed_block(data[offset:]))
+            del data
+
+    report = {
+        'data_size': sum(len(payload) for payload in payloads),
+        'levels': {},
+    }
+    for level in levels:
+        size = deflate = inflate = 0
+        for payload in payloads:
+            start = time.perf_counter()
+            compressed = zlib.compress(payload, level)
+            deflate += time.perf_counter() - start
+            size += len(compressed)
+            inflate += best_time(
+                lambda: zlib.decompress(compressed, bufsize=len(payload)), repeat)[0]
+        report['levels'][level] = {
+            'size': size,
+            'deflate_ms': deflate * 1000,
+            'inflate_ms': inflate * 1000,
+        }
+    return report
+
+def level_report(survey_dir, levels, repeat=3, workers=1):
+    """
+    tile_level_report() for every tile of a survey.  Returns (reports,
+    errors), reports keyed by the tile path relative to the survey.
+    Inflate times are only comparable with workers=1.
+    """
+    survey_dir = Path(survey_dir)
+    func = partial(tile_level_report, levels=levels, repeat=repeat)
+    reports = {}
+    errors = []
+    for path, report, error in map_tiles(func, list_tiles(survey_dir), workers):
+        if error:
+            errors.append(format_tile_error(path, error))
+            continue
+        reports[Path(path).relative_to(survey_dir).as_posix()] = report
+    return reports, errors
+
+def parse_levels(text):
+    """Parse '1-9' or '1,6,9' into a list of zlib levels"""
+    levels = []
+    for part in text.split(','):
+        if '-' in part:
+            start, end = part.split('-')
+            levels.extend(range(int(start), int(end) + 1))
+        elif part:
+            levels.append(int(part))
+    for level in levels:
+        if not 0 <= level <= 9:
+            raise ValueError(f"Invalid zlib level: {level}")
+    return levels
+
+def print_level_report(reports, levels, bandwidth):
+    print(f"{'tile':28s} " + ' '.join(f"{'L' + str(level) + ' KB/ms':>13s}" for level in levels))
+    print(f"{'-'*(29 + 14 * len(levels))}")
+    for tile, report in reports.items():
+        cells = []
+        for level in levels:
+            stats = report['levels'][level]
+            cells.append(f"{stats['size'] / 1024:7.1f}/{stats['inflate_ms']:5.2f}")
+        print(f"{tile:28s} " + ' '.join(cells))
+
+    # bandwidth in Mbit/s, i.e. 125 bytes per ms per Mbit/s.
+    bytes_per_ms = bandwidth * 125
+    print(f"\nTotals, load time estimated at {bandwidth:g} Mbit/s:\n")
+    print(f"{'level':>5s} {'size KB':>9s} {'ratio':>6s} {'deflate ms':>11s} "
+          f"{'inflate ms':>11s} {'load ms':>9s}")
+    print(f"{'-'*56}")
+    data_size = sum(report['data_size'] for report in reports.values())
+    best = None
+    for level in levels:
+        size = sum(r['levels'][level]['size'] for r in reports.values())
+        deflate = sum(r['levels'][level]['deflate_ms'] for r in reports.values())
+        inflate = sum(r['levels'][level]['inflate_ms'] for r in reports.values())
+        load = size / bytes_per_ms + inflate
+        if best is None or load < best[1]:
+            best = (level, load)
+        print(f"{level:5d} {size / 1024:9.1f} {data_size / max(size, 1):6.1f} "
+              f"{deflate:11.1f} {inflate:11.1f} {load:9.1f}")
+    if best:
+        print(f"\nFastest load at {bandwidth:g} Mbit/s: level {best[0]}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Write .eph tiles")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rewrite_parser = subparsers.add_parser('rewrite', help='Re-encode a survey')
+    rewrite_parser.add_argument('survey_dir')
+    rewrite_parser.add_argument('output_dir')
+    rewrite_parser.add_argument('--level', type=int, default=DEFAULT_LEVEL,
+                                help=f'zlib level (default: {DEFAULT_LEVEL})')
+    rewrite_parser.add_argument('--no-crc', action='store_true',
+                                help='Write 0 instead of the chunk CRCs')
+    rewrite_parser.add_argument('-j', '--workers', type=int, default=None,
+                                help='Number of worker processes (default: all CPUs)')
+
+    levels_parser = subparsers.add_parser('levels', help='Compare zlib levels')
+    levels_parser.add_argument('survey_dir')
+    levels_parser.add_argument('--levels', default='1-9',
+                               help="zlib levels, e.g. '1-9' or '1,6,9'")
+    levels_parser.add_argument('--repeat', type=int, default=3,
+                               help='Inflate runs per tile, the best one is reported')
+    levels_parser.add_argument('--bandwidth', type=float, default=10.0,
+                               help='Bandwidth in Mbit/s for the load estimate')
+    levels_parser.add_argument('-j', '--workers', type=int, default=1,
+                               help='Number of worker processes (skews timings)')
+    levels_parser.add_argument('--json', default=None, help='Save the report as JSON')
+    args = parser.parse_args()
+
+    if args.command == 'rewrite':
+        print(f"Rewriting {args.survey_dir} into {args.output_dir} (level {args.level})...")
+        in_size, out_size, errors = rewrite_survey(args.survey_dir, args.output_dir,
+                                                   args.level, not args.no_crc,
+                                                   args.workers)
+        for error in errors:
+            print(f"  {error}")
+        print(f"Input: {in_size / 1024:.1f} KB, output: {out_size / 1024:.1f} KB")
+        return
+
+    levels = parse_levels(args.levels)
+    reports, errors = level_report(args.survey_dir, levels, args.repeat, args.workers)
+    for error in errors:
+        print(f"  {error}")
+    print_level_report(reports, levels, args.bandwidth)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2)
+        print(f"\nReport saved to: {args.json}")
+
+if __name__ == "__main__":
+    main()
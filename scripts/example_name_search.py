@@ -2,9 +2,33 @@
 Example: Using the name index for autocomplete/query suggestions
 """
 
+import heapq
 import json
 from pathlib import Path
 
+from catalog import CatalogTable, make_row_class
+from name_grams import GRAM_SIZE, NameGrams
+from name_pool import NameIndex
+from name_suffix import NameSuffixArray
+from name_trie import NameTrie
+
+NAME_INDEX_COLUMNS = {
+    'name': 's',
+    'type': 's',
+    'hip': 'i',
+    'hd': 'i',
+    'dso_type': 's',
+    'vmag': 'f',
+    'ra': 'f',
+    'de': 'f',
+    'primary_name': 's',
+}
+
+class NameIndexTable(CatalogTable):
+    """Entries of name_index.json (stars and DSOs), see catalog.py"""
+    COLUMNS = NAME_INDEX_COLUMNS
+    ROW_CLASS = make_row_class('NameIndexRow', NAME_INDEX_COLUMNS)
+
 class SkyObjectSearch:
     """Simple search engine for sky objects using the name index"""
     
@@ -12,22 +36,61 @@ class SkyObjectSearch:
         """Load the name index"""
         self.index_dir = Path(index_dir)
         
-        # Load compact index for fast autocomplete
-        compact_file = self.index_dir / 'name_index_compact.json'
-        with open(compact_file, 'r', encoding='utf-8') as f:
-            self.compact_index = json.load(f)
+        # Autocomplete from the binary trie if there is one (nothing to
+        # parse), else from the compact index
+        trie_file = self.index_dir / 'name_index.trie'
+        self.trie = NameTrie(trie_file) if trie_file.exists() else None
+        self._compact_index = None
+        
+        # Infix search from the suffix array and typo-tolerant search from
+        # the trigram index if there are ones, else a scan of the compact index
+        suffix_file = self.index_dir / 'name_index.sa'
+        self.suffix_array = NameSuffixArray(suffix_file) if suffix_file.exists() else None
+        grams_file = self.index_dir / 'name_index.grams'
+        self.grams = NameGrams(grams_file) if grams_file.exists() else None
         
-        # Load full index for detailed lookups
-        full_file = self.index_dir / 'name_index.json'
-        with open(full_file, 'r', encoding='utf-8') as f:
-            full_index = json.load(f)
+        # Load full index for detailed lookups: the string pool model if
+        # there is one (see name_pool.py), else name_index.json
+        pool_file = self.index_dir / 'name_index_pool.json'
+        if pool_file.exists():
+            self.index = NameIndex.load(pool_file)
+            names = self.index.strings[:len(self.index)]
+            self._entry = self.index.entry
+            self._score = self.index.score
+        else:
+            full_file = self.index_dir / 'name_index.json'
+            with open(full_file, 'r', encoding='utf-8') as f:
+                self.objects = NameIndexTable.from_rows(json.load(f), list(NAME_INDEX_COLUMNS))
+            names = self.objects.column('name')
+            self._entry = self.objects.__getitem__
+            self._score = lambda row: 0.0
         
-        # Create lookup dictionary (name -> object data)
-        self.lookup = {item['name'].lower(): item for item in full_index}
+        # Create lookup dictionary (name -> name id or row)
+        self.lookup = {name.lower(): i for i, name in enumerate(names)}
         
         print(f"✓ Loaded {len(self.lookup)} sky objects")
-        print(f"  - Stars: {len(self.compact_index['stars'])}")
-        print(f"  - DSOs: {len(self.compact_index['dsos'])}")
+        if self.trie:
+            print(f"  - Stars: {self.trie.star_count}")
+            print(f"  - DSOs: {self.trie.dso_count}")
+        else:
+            print(f"  - Stars: {len(self.compact_index['stars'])}")
+            print(f"  - DSOs: {len(self.compact_index['dsos'])}")
+    
+    @property
+    def compact_index(self):
+        """Sorted name lists ('stars', 'dsos', 'all'), loaded on first use"""
+        if self._compact_index is None:
+            if self.trie:
+                self._compact_index = {
+                    'stars': self.trie.names('star'),
+                    'dsos': self.trie.names('dso'),
+                    'all': self.trie.names(),
+                }
+            else:
+                compact_file = self.index_dir / 'name_index_compact.json'
+                with open(compact_file, 'r', encoding='utf-8') as f:
+                    self._compact_index = json.load(f)
+        return self._compact_index
     
     def suggest_names(self, query, limit=10, object_type=None):
         """
@@ -39,8 +102,20 @@ class SkyObjectSearch:
             object_type: Filter by type ('star', 'dso', or None for all)
         
         Returns:
-            List of matching names
+            List of matching names, best ranking score first: the names
+            containing query or, if there are none and the trigram index
+            is loaded, names within a few typos
         """
+        if self.suffix_array:
+            matches = self.suffix_array.find(query, limit, object_type)
+            if matches or not self.grams or len(query) < GRAM_SIZE:
+                return matches
+        
+        if self.grams and len(query) >= GRAM_SIZE:
+            matches = self.grams.search(query, limit, object_type)
+            exact = [name for name, distance in matches if distance == 0]
+            return exact or [name for name, _ in matches]
+        
         query_lower = query.lower()
         
         # Choose which list to search
@@ -51,15 +126,15 @@ class SkyObjectSearch:
         else:
             search_list = self.compact_index['all']
         
-        # Find matches (case-insensitive substring search)
-        matches = []
-        for name in search_list:
-            if query_lower in name.lower():
-                matches.append(name)
-                if len(matches) >= limit:
-                    break
-        
-        return matches
+        # Find matches (case-insensitive substring search), keeping the
+        # best scored in a bounded heap
+        matches = (name for name in search_list if query_lower in name.lower())
+        return heapq.nlargest(limit, matches, key=self.name_score)
+    
+    def name_score(self, name):
+        """Ranking score of the object of a name (0 if unknown or not in the index)"""
+        index = self.lookup.get(name.lower())
+        return 0.0 if index is None else self._score(index)
     
     def get_object_info(self, name):
         """
@@ -69,9 +144,10 @@ class SkyObjectSearch:
             name: Object name
         
         Returns:
-            Dictionary with object data, or None if not found
+            Dict (or row read like a dict) of the object, or None if not found
         """
-        return self.lookup.get(name.lower())
+        index = self.lookup.get(name.lower())
+        return None if index is None else self._entry(index)
     
     def search_by_prefix(self, prefix, limit=10):
         """
@@ -82,18 +158,18 @@ class SkyObjectSearch:
             limit: Maximum number of results
         
         Returns:
-            List of matching names
+            List of matching names, best ranking score first (in name
+            order from the trie, which has no scores)
         """
-        prefix_lower = prefix.lower()
-        matches = []
+        if self.suffix_array:
+            return self.suffix_array.complete(prefix, limit)
+        if self.trie:
+            return self.trie.complete(prefix, limit)
         
-        for name in self.compact_index['all']:
-            if name.lower().startswith(prefix_lower):
-                matches.append(name)
-                if len(matches) >= limit:
-                    break
-        
-        return matches
+        prefix_lower = prefix.lower()
+        matches = (name for name in self.compact_index['all']
+                   if name.lower().startswith(prefix_lower))
+        return heapq.nlargest(limit, matches, key=self.name_score)
     
     def format_object_info(self, obj):
         """Format object information for display"""
@@ -146,6 +222,14 @@ def demo():
         print(f"\nQuery: '{query}'")
         print(f"Suggestions: {', '.join(suggestions)}")
     
+    # Example 1b: Misspelled queries (trigram index only)
+    if search.grams:
+        print("\nMisspelled queries:")
+        for query in ["betelguese", "andromda", "pleiadis"]:
+            suggestions = search.suggest_names(query, limit=5)
+            print(f"\nQuery: '{query}'")
+            print(f"Suggestions: {', '.join(suggestions)}")
+    
     # Example 2: Search by object type
     print("\n" + "=" * 80)
     print("Example 2: Search by object type")
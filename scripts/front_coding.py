@@ -0,0 +1,129 @@
+"""
+Front coding of the sorted category arrays of search_index.json.
+
+With generate_search_index.py --front-coding, the index gets
+"version": FRONT_CODED_VERSION and "front_coding": true, and each
+category array (stars, galaxies, ...) of 'NORM|Name[|Type]' entries
+becomes an object:
+
+    {
+      "block_size": B,
+      "count":      number of entries,
+      "fields":     2 for stars, 3 for DSOs (with the type),
+      "heads":      the first entry of each block, in full: the block directory,
+      "blocks":     one string per block with its other B - 1 entries
+    }
+
+In a block string, every entry is written relative to the entry before
+it: the key, then the display name, each as one character giving the
+length shared with the previous one (chr(LCP_BASE + length), at most
+MAX_LCP) followed by the rest; the type is written as is.  Fields are
+'|'-separated as in the plain entries, so splitting a block on '|' gives
+its entries `fields` values at a time.  '100HER|100 Her' after
+'100AQR|100 Aqr' is '3HER|4Her'.
+
+Entries are sorted, so the block of the first match of a prefix is found
+by a binary search on the heads, and only the blocks holding matches are
+decoded.
+"""
+
+from bisect import bisect_left
+
+DEFAULT_BLOCK_SIZE = 16
+
+# search_index.json version of front coded files (plain ones are version 2)
+FRONT_CODED_VERSION = 3
+
+# Shared lengths are written as '0' (0) to '[' (43): printable, no JSON escape
+LCP_BASE = 0x30
+MAX_LCP = 43
+
+def is_front_coded(index):
+    """True if the categories of a search_index.json dict are front coded"""
+    return bool(index.get('front_coding'))
+
+def _shared(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        # Shared prefixes stop before characters outside the BMP, so that
+        # lengths are the same in code points and in UTF-16 units (JS)
+        if x != y or n == MAX_LCP or ord(x) > 0xFFFF:
+            break
+        n += 1
+    return n
+
+def front_encode(entries, block_size=DEFAULT_BLOCK_SIZE):
+    """Front coded form of a sorted list of entries"""
+    fields = max((entry.count('|') + 1 for entry in entries), default=2)
+    heads = []
+    blocks = []
+    for start in range(0, len(entries), block_size):
+        block = entries[start:start + block_size]
+        heads.append(block[0])
+        parts = []
+        prev = block[0].split('|')
+        for entry in block[1:]:
+            values = entry.split('|')
+            for i, value in enumerate(values):
+                if i < 2:
+                    n = _shared(prev[i], value)
+                    parts.append(chr(LCP_BASE + n) + value[n:])
+                else:
+                    parts.append(value)
+            prev = values
+        blocks.append('|'.join(parts))
+    return {
+        'block_size': block_size,
+        'count': len(entries),
+        'fields': fields,
+        'heads': heads,
+        'blocks': blocks,
+    }
+
+def decode_block(category, b):
+    """Entries of block b of a front coded category"""
+    fields = category['fields']
+    head = category['heads'][b]
+    entries = [head]
+    if category['blocks'][b]:
+        values = category['blocks'][b].split('|')
+        prev = head.split('|')
+        for start in range(0, len(values), fields):
+            current = []
+            for i, value in enumerate(values[start:start + fields]):
+                if i < 2:
+                    value = prev[i][:ord(value[0]) - LCP_BASE] + value[1:]
+                current.append(value)
+            entries.append('|'.join(current))
+            prev = current
+    return entries
+
+def front_decode(category):
+    """The sorted entries of a front coded category"""
+    entries = []
+    for b in range(len(category['heads'])):
+        entries.extend(decode_block(category, b))
+    return entries
+
+def prefix_matches(category, prefix, limit=None):
+    """
+    Entries of a front coded category whose normalized key starts with
+    prefix, in order, decoding only the blocks that hold them
+    """
+    if '|' in prefix:
+        return []
+    heads = category['heads']
+    size = len(prefix)
+    # First block whose head is not below prefix: the first match is in it
+    # or at the end of the block before
+    b = max(bisect_left(heads, prefix, key=lambda head: head[:size]) - 1, 0)
+    matches = []
+    for b in range(b, len(heads)):
+        for entry in decode_block(category, b):
+            if entry.startswith(prefix):
+                matches.append(entry)
+                if limit is not None and len(matches) >= limit:
+                    return matches
+            elif entry[:size] > prefix:
+                return matches
+    return matches
@@ -1,12 +1,29 @@
 
+import argparse
 import json
 import csv
+import heapq
 import re
+from pathlib import Path
+
+from catalog import DsoTable
+from front_coding import DEFAULT_BLOCK_SIZE, FRONT_CODED_VERSION, front_encode
+from name_pool import NameIndex
+from search_index_binary import write_search_index
 
 # File paths
 NAME_INDEX_PATH = 'apps/web-frontend/public/skydata/name_index_compact.json'
 DSO_DATA_PATH = 'dso_extracted/dso_data.csv'
+DSO_COLUMNAR_PATH = 'dso_extracted/dso_data.cols'
 OUTPUT_PATH = 'apps/web-frontend/public/skydata/search_index.json'
+# Same content as the JSON, searched in place (see search_index_binary.py)
+BINARY_OUTPUT_PATH = 'apps/web-frontend/public/skydata/search_index.bin'
+NAME_POOL_PATH = 'name_index/name_index_pool.json'
+
+# Ranked completions are precomputed for normalized prefixes up to this
+# length (the first keystrokes, with the largest candidate sets)
+COMPLETION_PREFIX_LENGTH = 3
+COMPLETION_LIMIT = 20
 
 def normalize(s):
     if not s:
@@ -18,28 +35,58 @@ def normalize(s):
         n = n[4:]
     return n
 
+def load_dso_rows():
+    # Only the columns we need, straight from the columnar export if the
+    # extractor produced one.
+    if Path(DSO_COLUMNAR_PATH).exists():
+        return DsoTable.load(DSO_COLUMNAR_PATH, ['type', 'ids', 'snam'])
+    with open(DSO_DATA_PATH, 'r', encoding='utf-8') as f:
+        return DsoTable.from_rows(csv.DictReader(f), ['type', 'ids', 'snam'])
+
 def load_dso_types():
     dso_types = {}
-    with open(DSO_DATA_PATH, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            # Map IDs to type
-            # IDs in name_index might be primary name or other designations
-            # We'll map all known IDs to the type
-            obj_type = row.get('type', 'dso')
-            ids_str = row.get('ids', '')
-            if ids_str:
-                ids = ids_str.split('|')
-                for i in ids:
-                    dso_types[i] = obj_type
+    for row in load_dso_rows():
+        # Map IDs to type
+        # IDs in name_index might be primary name or other designations
+        # We'll map all known IDs to the type
+        obj_type = row.get('type', 'dso')
+        ids_str = row.get('ids', '')
+        if ids_str:
+            ids = ids_str.split('|')
+            for i in ids:
+                dso_types[i] = obj_type
+        
+        # Also map the primary 'snam'
+        snam = row.get('snam', '')
+        if snam:
+            dso_types[snam] = obj_type
             
-            # Also map the primary 'snam'
-            snam = row.get('snam', '')
-            if snam:
-                dso_types[snam] = obj_type
-                
     return dso_types
 
+def load_name_scores():
+    # Ranking scores of create_name_index.py, from the name pool if there
+    # is one; without it every name scores 0.
+    if not Path(NAME_POOL_PATH).exists():
+        return {}
+    return NameIndex.load(NAME_POOL_PATH).name_scores()
+
+def build_completions(entries, scores):
+    """
+    Ranked completions of the short prefixes of a sorted category: for
+    every normalized prefix of 1 to COMPLETION_PREFIX_LENGTH characters,
+    the indexes in entries of the COMPLETION_LIMIT best matches, by
+    score, then shortest key, then position
+    """
+    keys = []
+    prefixes = {}
+    for i, entry in enumerate(entries):
+        norm, name = entry.split('|')[:2]
+        keys.append((-scores.get(name, 0.0), len(norm), i))
+        for n in range(1, min(len(norm), COMPLETION_PREFIX_LENGTH) + 1):
+            prefixes.setdefault(norm[:n], []).append(i)
+    return {prefix: [key[2] for key in heapq.nsmallest(COMPLETION_LIMIT, (keys[i] for i in ids))]
+            for prefix, ids in prefixes.items()}
+
 def categorize_dso(dso_type):
     # Mapping based on previous analysis
     galaxies = ['G', 'GiG', 'GiP', 'LIN', 'EmG', 'rG', 'GiC', 'IG', 'AGN', 'BiC', 'LSB', 'H2G', 'Sy1', 'Sy2', 'SyG', 'SBG', 'PaG', 'bCG', 'PoG', 'GrG', 'Gal']
@@ -56,6 +103,14 @@ def categorize_dso(dso_type):
         return 'other'
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate the search index of the web app")
+    parser.add_argument('--front-coding', action='store_true',
+                        help='Store the category arrays of the JSON as front coded blocks '
+                             '(see front_coding.py)')
+    parser.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE,
+                        help='Entries per front coded block')
+    args = parser.parse_args()
+    
     print("Loading DSO data...")
     dso_type_map = load_dso_types()
     
@@ -137,12 +192,39 @@ def main():
     for cat in processed_dsos:
         processed_dsos[cat].sort()
         new_index['dsos'][cat] = processed_dsos[cat]
+    
+    # Side table answering the first keystrokes with one lookup:
+    # completions[category][prefix] = indexes in the category array
+    print("Precomputing short prefix completions...")
+    scores = load_name_scores()
+    completions = {
+        "prefix_length": COMPLETION_PREFIX_LENGTH,
+        "limit": COMPLETION_LIMIT,
+        "stars": build_completions(new_index['stars'], scores)
+    }
+    for cat, entries in new_index['dsos'].items():
+        completions[cat] = build_completions(entries, scores)
+    new_index['completions'] = completions
         
     print(f"Stats:")
     print(f"Stars: {len(new_index['stars'])}")
     for cat in new_index['dsos']:
         print(f"DSO {cat}: {len(new_index['dsos'][cat])}")
+    print(f"Completion prefixes: {sum(len(completions[cat]) for cat in ['stars', *new_index['dsos']])}")
         
+    size = write_search_index(BINARY_OUTPUT_PATH, new_index)
+    print(f"Wrote {BINARY_OUTPUT_PATH} ({size:,} bytes)")
+    
+    if args.front_coding:
+        # Blocks of block_size entries: a full head, then suffix deltas.
+        # Readers check the flag; older ones see an unknown version
+        print(f"Front coding the categories ({args.block_size} entries per block)...")
+        new_index['version'] = FRONT_CODED_VERSION
+        new_index['front_coding'] = True
+        new_index['stars'] = front_encode(new_index['stars'], args.block_size)
+        for cat in new_index['dsos']:
+            new_index['dsos'][cat] = front_encode(new_index['dsos'][cat], args.block_size)
+    
     print(f"Writing to {OUTPUT_PATH}...")
     with open(OUTPUT_PATH, 'w', encoding='utf-8') as f:
         json.dump(new_index, f)
@@ -0,0 +1,279 @@
+"""
+Inspect skydata surveys of .eph tiles.
+
+Usage:
+    python scripts/inspect_skydata.py [path ...] [-j N] [--top 10] [--max-kb 64] [--json FILE]
+    python scripts/inspect_skydata.py --tile path/to/Npix0.eph
+
+Each path is a survey (e.g. apps/web-frontend/public/skydata/stars) or a
+directory of surveys (default: apps/web-frontend/public/skydata).  Tiles
+are decoded in parallel and the report gives, per survey and order, the
+tile and row counts, compressed and decompressed bytes and the column
+schemas, then flags schema drift, tiles whose header disagrees with their
+path, and lists the largest and slowest tiles to decode, which are the
+ones that stall loading on low-end phones.
+
+--tile dumps the structure of a single tile: chunks, headers, column
+descriptors with their raw bytes and the first rows.
+"""
+
+import argparse
+import json
+import time
+from collections import Counter
+from pathlib import Path
+
+from eph_file import EphFile, read_table_info, decode_table, table_to_rows
+from eph_file import StringColumn, CHUNK_DEGREE_COLUMNS
+from eph_survey import list_tiles, map_tiles, tile_order_pix, format_tile_error
+from tile_index import schema_hash
+
+DEFAULT_SKYDATA_DIR = 'apps/web-frontend/public/skydata'
+
+def schema_string(header):
+    """Readable row layout: flags, row size and name:type@start+size columns"""
+    columns = ' '.join(f"{col['name']}:{col['type']}@{col['start']}+{col['size']}"
+                       for col in header['columns'])
+    return f"flags={header['flags']} row={header['row_size']} {columns}"
+
+def inspect_tile(path):
+    """Headers, sizes, schema and decode time of one tile"""
+    order, pix = tile_order_pix(path)
+    result = {
+        'order': order,
+        'pix': pix,
+        'file_size': Path(path).stat().st_size,
+        'chunks': [],
+        'rows': 0,
+        'comp_size': 0,
+        'data_size': 0,
+        'decode_s': 0.0,
+        'schemas': [],
+        'problems': [],
+    }
+    with EphFile(path) as eph:
+        for chunk in eph.chunks:
+            result['chunks'].append(chunk.type)
+            if chunk.type not in CHUNK_DEGREE_COLUMNS:
+                continue
+            data = eph.chunk_data(chunk)
+            header = read_table_info(data)
+
+            start = time.perf_counter()
+            _, _, table = decode_table(data, CHUNK_DEGREE_COLUMNS[chunk.type])
+            for values in table.values():
+                if isinstance(values, StringColumn):
+                    values.tolist()
+            result['decode_s'] += time.perf_counter() - start
+            del data
+
+            result['rows'] += header['n_row']
+            result['comp_size'] += header['comp_size']
+            result['data_size'] += header['data_size']
+            result['schemas'].append((schema_hash([header]), schema_string(header)))
+            if (header['order'], header['pix']) != (order, pix):
+                result['problems'].append(
+                    f"{chunk.type.strip()} header is Norder{header['order']} "
+                    f"Npix{header['pix']} (nuniq {header['nuniq']})")
+            if header['data_size'] != header['row_size'] * header['n_row']:
+                result['problems'].append(
+                    f"{chunk.type.strip()} holds {header['data_size']} bytes for "
+                    f"{header['n_row']} rows of {header['row_size']} bytes")
+    return result
+
+def find_surveys(path):
+    """The .eph survey directories under path (path itself if it has tiles)"""
+    path = Path(path)
+
+    def has_tiles(survey_dir):
+        return any(survey_dir.glob('Norder*/Dir*/Npix*.eph'))
+
+    if has_tiles(path):
+        return [path]
+    return sorted(p for p in path.iterdir() if p.is_dir() and has_tiles(p))
+
+def inspect_survey(survey_dir, workers=None):
+    """inspect_tile() for every tile.  Returns (tiles, errors)"""
+    tiles = []
+    errors = []
+    for path, result, error in map_tiles(inspect_tile, list_tiles(survey_dir), workers):
+        if error:
+            errors.append(format_tile_error(path, error))
+            continue
+        result['path'] = Path(path).relative_to(survey_dir).as_posix()
+        tiles.append(result)
+    return tiles, errors
+
+def survey_report(survey_dir, tiles, errors, top=10, max_kb=None):
+    """Summary of an inspected survey, as a JSON-friendly dict"""
+    orders = {}
+    for order in sorted({tile['order'] for tile in tiles}):
+        group = [tile for tile in tiles if tile['order'] == order]
+        orders[order] = {
+            'tiles': len(group),
+            'rows': sum(tile['rows'] for tile in group),
+            'file_size': sum(tile['file_size'] for tile in group),
+            'comp_size': sum(tile['comp_size'] for tile in group),
+            'data_size': sum(tile['data_size'] for tile in group),
+            'max_file_size': max(tile['file_size'] for tile in group),
+            'decode_s': sum(tile['decode_s'] for tile in group),
+            'schemas': dict(Counter(h for tile in group for h, _ in tile['schemas'])),
+        }
+
+    schemas = {}
+    schema_tiles = {}
+    for tile in tiles:
+        for h, text in tile['schemas']:
+            schemas[h] = text
+            schema_tiles.setdefault(h, []).append(tile['path'])
+
+    def tile_summary(tile):
+        return {key: tile[key] for key in
+                ('path', 'rows', 'file_size', 'data_size', 'decode_s')}
+
+    oversized = []
+    if max_kb is not None:
+        oversized = [tile_summary(tile) for tile in tiles
+                     if tile['file_size'] > max_kb * 1024]
+
+    return {
+        'survey': str(survey_dir),
+        'orders': orders,
+        'schemas': {h: {'layout': schemas[h], 'tiles': len(paths),
+                        'examples': paths[:3]}
+                    for h, paths in schema_tiles.items()},
+        'schema_drift': len(schemas) > 1,
+        'problems': {tile['path']: tile['problems'] for tile in tiles if tile['problems']},
+        'slowest': [tile_summary(tile) for tile in
+                    sorted(tiles, key=lambda t: t['decode_s'], reverse=True)[:top]],
+        'largest': [tile_summary(tile) for tile in
+                    sorted(tiles, key=lambda t: t['file_size'], reverse=True)[:top]],
+        'oversized': oversized,
+        'errors': errors,
+    }
+
+def print_tile_list(title, tiles):
+    print(f"\n{title}:")
+    print(f"  {'tile':28s} {'rows':>7s} {'file KB':>8s} {'data KB':>8s} {'decode ms':>10s}")
+    for tile in tiles:
+        print(f"  {tile['path']:28s} {tile['rows']:7d} {tile['file_size'] / 1024:8.1f} "
+              f"{tile['data_size'] / 1024:8.1f} {tile['decode_s'] * 1000:10.2f}")
+
+def print_survey_report(report, max_kb=None):
+    print(f"\n{'='*80}")
+    print(f"SURVEY: {report['survey']}")
+    print(f"{'='*80}\n")
+
+    print(f"{'order':>5s} {'tiles':>6s} {'rows':>9s} {'comp KB':>9s} {'data KB':>9s} "
+          f"{'ratio':>6s} {'max KB':>7s} {'decode ms':>10s} {'schemas':>8s}")
+    print(f"{'-'*80}")
+    for order, stats in report['orders'].items():
+        ratio = stats['data_size'] / max(stats['comp_size'], 1)
+        print(f"{order:5d} {stats['tiles']:6d} {stats['rows']:9d} "
+              f"{stats['comp_size'] / 1024:9.1f} {stats['data_size'] / 1024:9.1f} "
+              f"{ratio:6.1f} {stats['max_file_size'] / 1024:7.1f} "
+              f"{stats['decode_s'] * 1000:10.1f} {len(stats['schemas']):8d}")
+
+    print(f"\nSchemas:")
+    for h, schema in report['schemas'].items():
+        print(f"  {h} ({schema['tiles']} tiles): {schema['layout']}")
+    if report['schema_drift']:
+        print(f"\n  WARNING: schema drift, {len(report['schemas'])} different layouts")
+        for h, schema in report['schemas'].items():
+            print(f"    {h}: e.g. {', '.join(schema['examples'])}")
+
+    if report['problems']:
+        print(f"\nHeader problems:")
+        for path, problems in report['problems'].items():
+            for problem in problems:
+                print(f"  {path}: {problem}")
+
+    print_tile_list("Slowest tiles to decode", report['slowest'])
+    print_tile_list("Largest tiles", report['largest'])
+    if max_kb is not None:
+        if report['oversized']:
+            print_tile_list(f"Tiles over {max_kb:g} KB", report['oversized'])
+        else:
+            print(f"\nNo tile over {max_kb:g} KB")
+
+    if report['errors']:
+        print(f"\nErrors:")
+        for error in report['errors']:
+            print(f"  {error}")
+
+def dump_tile(path, num_rows=1):
+    """Print the structure of one tile, as the old debug scripts did"""
+    with EphFile(path) as eph:
+        print(f"=== FILE STRUCTURE: {path} ===\n")
+        print(f"File version: {eph.version}")
+        for chunk in eph.chunks:
+            print(f"\nChunk '{chunk.type}': offset {chunk.offset}, size {chunk.size}, "
+                  f"crc {chunk.crc:#010x}")
+            data = eph.chunk_data(chunk)
+            if chunk.type == 'JSON':
+                print(f"  {bytes(data).decode('utf-8', errors='replace')}")
+                continue
+            if chunk.type not in CHUNK_DEGREE_COLUMNS:
+                continue
+
+            header = read_table_info(data)
+            print(f"  Tile header: version {header['version']}, nuniq {header['nuniq']} "
+                  f"(Norder{header['order']} Npix{header['pix']})")
+            print(f"  Table: flags {header['flags']}, row size {header['row_size']}, "
+                  f"{header['n_col']} columns, {header['n_row']} rows")
+            print(f"  Compressed block at {header['data_offset']}: "
+                  f"{header['comp_size']} -> {header['data_size']} bytes")
+            print(f"\n  Columns:")
+            for i, col in enumerate(header['columns']):
+                offset = 12 + 16 + i * 20
+                raw = bytes(data[offset:offset + 20])
+                print(f"    {i:2d} {col['name']:5s} type '{col['type']}' unit {col['unit']:#08x} "
+                      f"start {col['start']:4d} size {col['size']:4d}  [{raw.hex(' ', 4)}]")
+
+            _, _, table = decode_table(data, CHUNK_DEGREE_COLUMNS[chunk.type])
+            rows = table_to_rows(table)[:num_rows]
+            for i, row in enumerate(rows):
+                print(f"\n  Row {i}:")
+                for key, value in row.items():
+                    print(f"    {key:10s} = {value!r}")
+            del data
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect skydata surveys of .eph tiles")
+    parser.add_argument('paths', nargs='*', default=[DEFAULT_SKYDATA_DIR],
+                        help=f'Surveys or directories of surveys (default: {DEFAULT_SKYDATA_DIR})')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='Number of worker processes (default: all CPUs)')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of slowest and largest tiles to list')
+    parser.add_argument('--max-kb', type=float, default=None,
+                        help='Flag tiles whose file is larger than this')
+    parser.add_argument('--json', default=None, help='Save the reports as JSON')
+    parser.add_argument('--tile', default=None, help='Dump the structure of one tile')
+    parser.add_argument('--rows', type=int, default=1,
+                        help='Number of rows to print with --tile')
+    args = parser.parse_args()
+
+    if args.tile:
+        dump_tile(args.tile, args.rows)
+        return
+
+    surveys = [survey for path in args.paths for survey in find_surveys(path)]
+    if not surveys:
+        print(f"No survey found in: {', '.join(args.paths)}")
+        return
+
+    reports = []
+    for survey_dir in surveys:
+        tiles, errors = inspect_survey(survey_dir, args.workers)
+        report = survey_report(survey_dir, tiles, errors, args.top, args.max_kb)
+        print_survey_report(report, args.max_kb)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2)
+        print(f"\nReport saved to: {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Trigram inverted index of the names, for substring and typo-tolerant search.
+
+Usage: python scripts/name_grams.py <name_index.grams> [query ...] [--kind star|dso] [--limit N]
+
+create_name_index.py writes name_index/name_index.grams.  A query is
+lowercased and split into its distinct trigrams; the posting lists of
+those trigrams give, for every name, the number of query trigrams it
+contains.  Names that contain them all are checked for the exact
+substring, best ranking score first (scores are computed at build time,
+see create_name_index.object_score); the others are ranked by shared
+trigrams and the best ones are verified with a bounded edit distance (optimal string alignment,
+so 'betelguese' is one edit from 'betelgeuse'), computed for all the
+candidates at once with NumPy.  The work depends on the posting lists
+of the query, never on a scan of all the names.
+
+Format, all integers little-endian, varint = unsigned LEB128:
+
+    header, 32 bytes
+        magic           4 bytes 'NGRM'
+        version         u32     GRAMS_VERSION
+        names           u32     number of names (n)
+        grams           u32     number of distinct trigram hashes (g)
+        names_size      u32     size of the names blob
+        postings_size   u32     size of the postings blob
+        reserved        8 bytes
+    name_offsets    (n + 1) u32 offsets of each name in the names blob
+    gram_hashes     g u32       sorted CRC-32 of the UTF-8 trigrams
+    gram_offsets    (g + 1) u32 offsets of each posting list in the postings blob
+    name_scores     n f32       ranking score of each name
+    name_kinds      n u8        bit 0: star name, bit 1: DSO name
+    names           UTF-8 names, sorted (name id = position)
+    postings        per trigram hash, the increasing ids of the names
+                    containing it, as varint gaps (the first id as is)
+
+Trigrams are taken on the lowercased names, without padding.  Hash
+collisions only add candidates, which verification removes.
+"""
+
+import argparse
+import struct
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+GRAMS_MAGIC = b'NGRM'
+GRAMS_VERSION = 2
+HEADER = struct.Struct('<4s5I8x')
+GRAM_SIZE = 3
+
+STAR = 1
+DSO = 2
+KIND_FLAGS = {None: STAR | DSO, 'star': STAR, 'dso': DSO}
+
+# Candidates verified by edit distance per query
+MAX_CANDIDATES = 512
+
+# Query characters used by the edit distance (bits of a uint64)
+MAX_QUERY = 64
+
+def name_grams(text):
+    """Distinct trigrams of a lowercased string"""
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+def gram_hash(gram):
+    return zlib.crc32(gram.encode('utf-8'))
+
+def default_max_distance(query):
+    """Edits allowed for a query: 1 up to 6 characters, then 2"""
+    return 1 if len(query) <= 6 else 2
+
+def _encode_varints(values):
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return out
+
+def _decode_varints(data):
+    # All the varints of a byte array, vectorized.
+    data = np.frombuffer(data, dtype=np.uint8)
+    if not len(data):
+        return np.empty(0, dtype=np.int64)
+    ends = data < 0x80
+    starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+    group = np.cumsum(np.concatenate(([0], ends[:-1]))).astype(np.int64)
+    shift = 7 * (np.arange(len(data)) - starts[group])
+    values = np.bincount(group, weights=(data & 0x7F) * np.exp2(shift))
+    return values.astype(np.int64)
+
+def encode_name_grams(star_names, dso_names, scores=None):
+    """
+    Bytes of the index of two iterables of names, with their ranking
+    scores (a dict, names missing from it score 0)
+    """
+    scores = scores or {}
+    kinds = {}
+    for name in star_names:
+        kinds[name] = kinds.get(name, 0) | STAR
+    for name in dso_names:
+        kinds[name] = kinds.get(name, 0) | DSO
+    names = sorted(kinds)
+
+    postings = {}
+    for name_id, name in enumerate(names):
+        for h in {gram_hash(gram) for gram in name_grams(name.lower())}:
+            postings.setdefault(h, []).append(name_id)
+
+    hashes = sorted(postings)
+    blob = bytearray()
+    gram_offsets = [0]
+    for h in hashes:
+        ids = postings[h]
+        blob += _encode_varints([ids[0]] + [b - a for a, b in zip(ids, ids[1:])])
+        gram_offsets.append(len(blob))
+
+    encoded = [name.encode('utf-8') for name in names]
+    name_offsets = np.concatenate(([0], np.cumsum([len(e) for e in encoded]))).astype('<u4')
+    names_blob = b''.join(encoded)
+
+    return b''.join([
+        HEADER.pack(GRAMS_MAGIC, GRAMS_VERSION, len(names), len(hashes),
+                    len(names_blob), len(blob)),
+        name_offsets.tobytes(),
+        np.array(hashes, dtype='<u4').tobytes(),
+        np.array(gram_offsets, dtype='<u4').tobytes(),
+        np.array([scores.get(name, 0.0) for name in names], dtype='<f4').tobytes(),
+        np.array([kinds[name] for name in names], dtype=np.uint8).tobytes(),
+        names_blob,
+        bytes(blob),
+    ])
+
+def write_name_grams(path, star_names, dso_names, scores=None):
+    """Write the trigram index of the star and DSO names.  Returns its size in bytes"""
+    data = encode_name_grams(star_names, dso_names, scores)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+def substring_distances(query, texts, max_distance):
+    """
+    Smallest optimal string alignment distance between query and any
+    substring of each text, capped at max_distance + 1.  Bit-parallel
+    (Myers, with Hyyroe's transpositions): one bit per query character,
+    all the texts at once, one text position at a time.
+    """
+    query = query[:MAX_QUERY]
+    m = len(query)
+    if not texts or not m:
+        return np.zeros(len(texts), dtype=np.int32)
+    chars = np.array(texts, dtype='U')
+    width = max(chars.dtype.itemsize // 4, 1)
+    chars = chars.view(np.uint32).reshape(len(texts), width)
+    # Bit i of eq[r, j]: texts[r][j] == query[i]
+    eq = np.zeros(chars.shape, dtype=np.uint64)
+    for i, c in enumerate(query):
+        eq |= (chars == ord(c)).astype(np.uint64) << np.uint64(i)
+
+    one = np.uint64(1)
+    mask = np.uint64((1 << m) - 1)
+    high = np.uint64(1 << (m - 1))
+    vp = np.full(len(texts), mask, dtype=np.uint64)
+    vn = np.zeros(len(texts), dtype=np.uint64)
+    d0 = np.zeros(len(texts), dtype=np.uint64)
+    eq_prev = np.zeros(len(texts), dtype=np.uint64)
+    score = np.full(len(texts), m, dtype=np.int32)
+    best = score.copy()
+    for j in range(width):
+        x = eq[:, j]
+        transposed = (((~d0) & x) << one) & eq_prev
+        d0 = ((((x & vp) + vp) ^ vp) | x | vn | transposed) & mask
+        hp = vn | (~(d0 | vp) & mask)
+        hn = d0 & vp
+        score += (hp & high) != 0
+        score -= (hn & high) != 0
+        np.minimum(best, score, out=best)
+        # A match can start anywhere: no carry into the first row
+        hp = (hp << one) & mask
+        hn = (hn << one) & mask
+        vp = hn | (~(d0 | hp) & mask)
+        vn = hp & d0
+        eq_prev = x
+    return np.minimum(best, max_distance + 1)
+
+class NameGrams:
+    """Trigram index of a name set, see the module docstring"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        data = self.path.read_bytes()
+        magic, version, n, g, names_size, postings_size = HEADER.unpack_from(data, 0)
+        if magic != GRAMS_MAGIC:
+            raise ValueError(f"Not a trigram index: {self.path}")
+        if version != GRAMS_VERSION:
+            raise ValueError(f"Unsupported trigram index version: {version}")
+        pos = HEADER.size
+
+        def take(dtype, count):
+            nonlocal pos
+            array = np.frombuffer(data, dtype=dtype, count=count, offset=pos)
+            pos += array.nbytes
+            return array
+
+        self.count = n
+        self._name_offsets = take('<u4', n + 1)
+        self._gram_hashes = take('<u4', g)
+        self._gram_offsets = take('<u4', g + 1)
+        self.scores = take('<f4', n)
+        self.name_kinds = take(np.uint8, n)
+        self._names = data[pos:pos + names_size]
+        self._postings = data[pos + names_size:pos + names_size + postings_size]
+        self._name_cache = {}
+
+    def __len__(self):
+        return self.count
+
+    def name(self, name_id):
+        name = self._name_cache.get(name_id)
+        if name is None:
+            start, end = self._name_offsets[name_id], self._name_offsets[name_id + 1]
+            name = self._name_cache[name_id] = self._names[start:end].decode('utf-8')
+        return name
+
+    def postings(self, gram):
+        """Ids of the names containing a trigram (or a hash collision of it)"""
+        h = gram_hash(gram)
+        i = int(np.searchsorted(self._gram_hashes, h))
+        if i == len(self._gram_hashes) or self._gram_hashes[i] != h:
+            return np.empty(0, dtype=np.int64)
+        start, end = self._gram_offsets[i], self._gram_offsets[i + 1]
+        return np.cumsum(_decode_varints(self._postings[start:end]))
+
+    def search(self, query, limit=10, kind=None, max_distance=None):
+        """
+        Names containing query, then names containing it with at most
+        max_distance edits (default_max_distance() by default), as a list
+        of (name, distance).  Exact matches come best score first, the
+        others by distance, then score, then shared trigrams, then length.
+        Queries shorter than a trigram return nothing.
+        """
+        text = query.lower()
+        grams = name_grams(text)
+        if not grams:
+            return []
+        if max_distance is None:
+            max_distance = default_max_distance(text)
+
+        # Distinct hashes, so that a name is counted once per posting list.
+        # Only the names in the posting lists are looked at.
+        lists = {}
+        for gram in grams:
+            lists.setdefault(gram_hash(gram), gram)
+        ids, counts = np.unique(np.concatenate([self.postings(gram) for gram in lists.values()]),
+                                return_counts=True)
+        if kind is not None:
+            keep = (self.name_kinds[ids] & KIND_FLAGS[kind]) != 0
+            ids, counts = ids[keep], counts[keep]
+
+        # Names with every trigram, verified best score first until limit
+        results = []
+        exact = np.flatnonzero(counts == len(lists))
+        exact = exact[np.argsort(-self.scores[ids[exact]], kind='stable')]
+        for i in exact.tolist():
+            name = self.name(int(ids[i]))
+            if text in name.lower():
+                results.append((name, 0))
+                counts[i] = 0
+                if len(results) >= limit:
+                    return results
+
+        # Each edit changes at most 3 trigrams of the query
+        threshold = max(1, len(lists) - GRAM_SIZE * max_distance)
+        candidates = np.flatnonzero(counts >= threshold)
+        if len(candidates) > MAX_CANDIDATES:
+            best = np.argsort(-counts[candidates], kind='stable')[:MAX_CANDIDATES]
+            candidates = np.sort(candidates[best])
+        if not len(candidates):
+            return results
+        names = [self.name(name_id) for name_id in ids[candidates].tolist()]
+        distances = substring_distances(text, [name.lower() for name in names], max_distance)
+        keep = np.flatnonzero(distances <= max_distance)
+        scores = self.scores[ids[candidates]]
+        ranked = sorted(keep.tolist(), key=lambda i: (distances[i], -scores[i],
+                                                      -counts[candidates[i]],
+                                                      len(names[i]), candidates[i]))
+        results.extend((names[i], int(distances[i])) for i in ranked[:limit - len(results)])
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Query a name trigram index")
+    parser.add_argument('grams', help='e.g. name_index/name_index.grams')
+    parser.add_argument('queries', nargs='*', help='Names to look up, typos allowed')
+    parser.add_argument('--kind', choices=['star', 'dso'], default=None)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--max-distance', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = NameGrams(args.grams)
+    open_ms = (time.perf_counter() - start) * 1000
+    print(f"{args.grams}: {index.path.stat().st_size:,} bytes, {len(index):,} names, "
+          f"{len(index._gram_hashes):,} trigrams, opened in {open_ms:.2f} ms")
+
+    for query in args.queries:
+        start = time.perf_counter()
+        results = index.search(query, args.limit, args.kind, args.max_distance)
+        ms = (time.perf_counter() - start) * 1000
+        print(f"\n'{query}' ({ms:.2f} ms):")
+        for name, distance in results:
+            print(f"  {name}" + (f"  ({distance} edit{'s' if distance > 1 else ''})"
+                                 if distance else ''))
+
+if __name__ == "__main__":
+    main()
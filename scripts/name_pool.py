@@ -0,0 +1,211 @@
+"""
+Deduplicated model of the name index: a string pool, objects and aliases.
+
+create_name_index.py builds a NameIndex and generates every output from
+it (name_index_compact.json, .trie, the stats and, with --legacy,
+name_index.json, .csv and .txt), and saves the model itself as
+name_index_pool.json:
+
+    strings       every string once: the names first, in the order of
+                  name_index.json (sorted case-insensitively), then the
+                  other strings (DSO types)
+    name_object   object id of each name: name i is strings[i]
+    name_kinds    bit 0: the name is in the star list, bit 1: in the DSO list
+    objects       one entry per star or DSO, as columns:
+                    kind          0 star, 1 DSO
+                    row           row in the extracted catalog
+                    primary_name  string id
+                    hip, hd       HIP and HD numbers (0 for DSOs)
+                    dso_type      string id (-1 for stars)
+                    vmag, ra, de
+                    score         ranking score (see create_name_index.object_score)
+
+So metadata is stored once per object whatever its number of aliases,
+and resolving a name to its object is an array index.  NameIndex.entry()
+rebuilds the dicts of name_index.json.
+"""
+
+import json
+
+import numpy as np
+
+POOL_VERSION = 2
+
+STAR = 1
+DSO = 2
+KIND_NAMES = ('star', 'dso')
+
+OBJECT_DTYPES = {
+    'kind': np.uint8,
+    'row': np.int32,
+    'primary_name': np.int32,
+    'hip': np.int32,
+    'hd': np.int32,
+    'dso_type': np.int32,
+    'vmag': np.float64,
+    'ra': np.float64,
+    'de': np.float64,
+    'score': np.float32,
+}
+
+def _json_values(values):
+    """List of a column for JSON; float32 values as their shortest repr, not as float64"""
+    if values.dtype == np.float32:
+        return [float(str(value)) for value in values]
+    return values.tolist()
+
+class NameIndex:
+    """String pool, objects and aliases of the name index, see the module docstring"""
+
+    def __init__(self, strings, name_object, name_kinds, objects):
+        self.strings = strings
+        self.name_object = np.asarray(name_object, dtype=np.int32)
+        self.name_kinds = np.asarray(name_kinds, dtype=np.uint8)
+        self.objects = {name: np.asarray(objects[name], dtype=dtype)
+                        for name, dtype in OBJECT_DTYPES.items()}
+
+    @classmethod
+    def build(cls, star_names, dso_names):
+        """
+        Model of the name -> entry dicts of create_name_index.py.  Entries
+        have name, type ('star' or 'dso'), row (a catalog row view),
+        primary_name, score and, for DSOs, dso_type.  A name in both dicts
+        belongs to the DSO, as in the merged name_index.json.
+        """
+        all_names = {**star_names, **dso_names}
+        entries = sorted(all_names.values(), key=lambda x: x.name.lower())
+        strings = [entry.name for entry in entries]
+        string_ids = {}
+        for i, name in enumerate(strings):
+            string_ids.setdefault(name, i)
+
+        def intern(value):
+            string_id = string_ids.get(value)
+            if string_id is None:
+                string_id = string_ids[value] = len(strings)
+                strings.append(value)
+            return string_id
+
+        objects = {name: [] for name in OBJECT_DTYPES}
+        object_ids = {}
+        name_object = []
+        for entry in entries:
+            key = (entry.type, entry.row.index)
+            object_id = object_ids.get(key)
+            if object_id is None:
+                object_id = object_ids[key] = len(object_ids)
+                row = entry.row
+                objects['row'].append(row.index)
+                objects['primary_name'].append(intern(entry.primary_name))
+                if entry.type == 'star':
+                    objects['kind'].append(0)
+                    objects['hip'].append(row.get('hip') or 0)
+                    objects['hd'].append(row.get('hd') or 0)
+                    objects['dso_type'].append(-1)
+                else:
+                    objects['kind'].append(1)
+                    objects['hip'].append(0)
+                    objects['hd'].append(0)
+                    objects['dso_type'].append(intern(entry.dso_type))
+                for name in ('vmag', 'ra', 'de'):
+                    objects[name].append(row.get(name))
+                objects['score'].append(entry.score)
+            name_object.append(object_id)
+
+        name_kinds = [(STAR if entry.name in star_names else 0) |
+                      (DSO if entry.name in dso_names else 0) for entry in entries]
+        return cls(strings, name_object, name_kinds, objects)
+
+    def __len__(self):
+        """Number of names"""
+        return len(self.name_object)
+
+    @property
+    def object_count(self):
+        return len(self.objects['kind'])
+
+    def name(self, name_id):
+        return self.strings[name_id]
+
+    def object_of(self, name_id):
+        """Object id of a name"""
+        return int(self.name_object[name_id])
+
+    def kind(self, name_id):
+        """'star' or 'dso': type of the object of a name"""
+        return KIND_NAMES[self.objects['kind'][self.name_object[name_id]]]
+
+    def score(self, name_id):
+        """Ranking score of the object of a name"""
+        return float(self.objects['score'][self.name_object[name_id]])
+
+    def name_scores(self):
+        """Name -> ranking score of its object, for the search indexes"""
+        scores = self.objects['score'][self.name_object].tolist()
+        return dict(zip(self.strings[:len(self)], scores))
+
+    def names(self, kind=None):
+        """Names in the star or DSO list (all names if kind is None), sorted"""
+        if kind is None:
+            return sorted(self.strings[:len(self)])
+        bit = STAR if kind == 'star' else DSO
+        return sorted(self.strings[i] for i in np.flatnonzero(self.name_kinds & bit).tolist())
+
+    def name_ids(self, kind=None):
+        """Ids of the names whose object is a star or a DSO, in index order"""
+        if kind is None:
+            return range(len(self))
+        kinds = self.objects['kind'][self.name_object]
+        return np.flatnonzero(kinds == KIND_NAMES.index(kind)).tolist()
+
+    def dso_type_counts(self):
+        """Number of names in the DSO list per DSO type, types in catalog order"""
+        name_objects = self.name_object[np.flatnonzero(self.name_kinds & DSO)]
+        objects = np.unique(name_objects)
+        objects = objects[np.argsort(self.objects['row'][objects], kind='stable')]
+        counts = dict.fromkeys(self.objects['dso_type'][objects].tolist(), 0)
+        for type_id in self.objects['dso_type'][name_objects].tolist():
+            counts[type_id] += 1
+        return {self.strings[type_id]: count for type_id, count in counts.items()}
+
+    def entry(self, name_id):
+        """Dict of a name as in name_index.json"""
+        objects = self.objects
+        obj = int(self.name_object[name_id])
+        entry = {'name': self.strings[name_id]}
+        if objects['kind'][obj] == 0:
+            entry['type'] = 'star'
+            entry['hip'] = objects['hip'][obj].item()
+            entry['hd'] = objects['hd'][obj].item()
+        else:
+            entry['type'] = 'dso'
+            entry['dso_type'] = self.strings[objects['dso_type'][obj]]
+        for name in ('vmag', 'ra', 'de'):
+            entry[name] = objects[name][obj].item()
+        entry['primary_name'] = self.strings[objects['primary_name'][obj]]
+        return entry
+
+    def entries(self):
+        """Every entry of name_index.json, in order"""
+        return [self.entry(i) for i in range(len(self))]
+
+    def save(self, path):
+        """Write the model as JSON (see the module docstring)"""
+        data = {
+            'version': POOL_VERSION,
+            'strings': self.strings,
+            'name_object': self.name_object.tolist(),
+            'name_kinds': self.name_kinds.tolist(),
+            'objects': {name: _json_values(values) for name, values in self.objects.items()},
+        }
+        # dumps() uses the C encoder, dump() the pure Python one
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != POOL_VERSION:
+            raise ValueError(f"Unsupported name pool version: {data.get('version')}")
+        return cls(data['strings'], data['name_object'], data['name_kinds'], data['objects'])
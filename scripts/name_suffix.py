@@ -0,0 +1,218 @@
+"""
+Suffix array of the lowercased names, for infix ("contains") search.
+
+Usage: python scripts/name_suffix.py <name_index.sa> [query ...] [--kind star|dso] [--limit N]
+
+create_name_index.py writes name_index/name_index.sa.  Every suffix of
+every lowercased name is sorted once at build time, so the names
+containing a query are one contiguous range of the array, found with two
+binary searches; only the suffixes in that range are read.  Matches are
+returned best ranking score first (scores are computed at build time,
+see create_name_index.object_score): the best limit are selected with a
+partition, without sorting the matches.
+
+Format, all integers little-endian:
+
+    header, 32 bytes
+        magic           4 bytes 'NSUF'
+        version         u32     SUFFIX_VERSION
+        names           u32     number of names (n)
+        suffixes        u32     number of suffixes (s)
+        names_size      u32     size of the names blob
+        text_size       u32     size of the text blob
+        reserved        8 bytes
+    name_offsets    (n + 1) u32 offsets of each name in the names blob
+    text_offsets    (n + 1) u32 offsets of each lowercased name in the text blob
+    suffixes        s u32       text offsets of the suffixes, sorted
+    suffix_names    s u32       name id of each suffix
+    name_scores     n f32       ranking score of each name
+    name_kinds      n u8        bit 0: star name, bit 1: DSO name
+    names           UTF-8 names, sorted (name id = position)
+    text            UTF-8 lowercased names, each followed by a 0 byte
+
+A suffix starts at every character of a lowercased name (not inside a
+multi-byte character) and runs to the end of that name.  Suffixes are
+sorted by their bytes, then by name, so the matches of a query come in
+name order within each distinct suffix.  The 0 byte ends each name and
+sorts before any character, so a query never matches across two names.
+"""
+
+import argparse
+import struct
+import time
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+
+import numpy as np
+
+SUFFIX_MAGIC = b'NSUF'
+SUFFIX_VERSION = 2
+HEADER = struct.Struct('<4s5I8x')
+
+STAR = 1
+DSO = 2
+KIND_FLAGS = {None: STAR | DSO, 'star': STAR, 'dso': DSO}
+
+def normalize_name(name):
+    """Text searched for a name or a query: the lowercased UTF-8 bytes"""
+    return name.lower().encode('utf-8')
+
+def top_ids(ids, scores, limit):
+    """
+    The limit ids (None for all) of best score, best first, ties in id
+    order.  ids are sorted; only the ones that can make the cut are sorted.
+    """
+    keys = -scores[ids]
+    if limit is not None and len(ids) > limit:
+        cut = np.partition(keys, limit - 1)[limit - 1]
+        ids, keys = ids[keys <= cut], keys[keys <= cut]
+    return ids[np.argsort(keys, kind='stable')[:limit]]
+
+def encode_name_suffixes(star_names, dso_names, scores=None):
+    """
+    Bytes of the suffix array of two iterables of names, with their
+    ranking scores (a dict, names missing from it score 0)
+    """
+    scores = scores or {}
+    kinds = {}
+    for name in star_names:
+        kinds[name] = kinds.get(name, 0) | STAR
+    for name in dso_names:
+        kinds[name] = kinds.get(name, 0) | DSO
+    names = sorted(kinds)
+
+    text = bytearray()
+    text_offsets = [0]
+    suffixes = []
+    for name_id, name in enumerate(names):
+        start = len(text)
+        key = normalize_name(name)
+        text += key + b'\0'
+        text_offsets.append(len(text))
+        # Suffixes start on characters, not on UTF-8 continuation bytes
+        suffixes.extend((key[i:], start + i, name_id) for i in range(len(key))
+                        if key[i] & 0xC0 != 0x80)
+    suffixes.sort()
+
+    encoded = [name.encode('utf-8') for name in names]
+    name_offsets = np.concatenate(([0], np.cumsum([len(e) for e in encoded]))).astype('<u4')
+    names_blob = b''.join(encoded)
+
+    return b''.join([
+        HEADER.pack(SUFFIX_MAGIC, SUFFIX_VERSION, len(names), len(suffixes),
+                    len(names_blob), len(text)),
+        name_offsets.tobytes(),
+        np.array(text_offsets, dtype='<u4').tobytes(),
+        np.array([pos for _, pos, _ in suffixes], dtype='<u4').tobytes(),
+        np.array([name_id for _, _, name_id in suffixes], dtype='<u4').tobytes(),
+        np.array([scores.get(name, 0.0) for name in names], dtype='<f4').tobytes(),
+        np.array([kinds[name] for name in names], dtype=np.uint8).tobytes(),
+        names_blob,
+        bytes(text),
+    ])
+
+def write_name_suffixes(path, star_names, dso_names, scores=None):
+    """Write the suffix array of the star and DSO names.  Returns its size in bytes"""
+    data = encode_name_suffixes(star_names, dso_names, scores)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+class NameSuffixArray:
+    """Suffix array of a name set, see the module docstring"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        data = self.path.read_bytes()
+        magic, version, n, s, names_size, text_size = HEADER.unpack_from(data, 0)
+        if magic != SUFFIX_MAGIC:
+            raise ValueError(f"Not a name suffix array: {self.path}")
+        if version != SUFFIX_VERSION:
+            raise ValueError(f"Unsupported name suffix array version: {version}")
+        pos = HEADER.size
+
+        def take(dtype, count):
+            nonlocal pos
+            array = np.frombuffer(data, dtype=dtype, count=count, offset=pos)
+            pos += array.nbytes
+            return array
+
+        self.count = n
+        self._name_offsets = take('<u4', n + 1)
+        self._text_offsets = take('<u4', n + 1)
+        self.suffixes = take('<u4', s)
+        self.suffix_names = take('<u4', s)
+        self.scores = take('<f4', n)
+        self.name_kinds = take(np.uint8, n)
+        self._names = data[pos:pos + names_size]
+        self._text = data[pos + names_size:pos + names_size + text_size]
+
+    def __len__(self):
+        return self.count
+
+    def name(self, name_id):
+        start, end = self._name_offsets[name_id], self._name_offsets[name_id + 1]
+        return self._names[start:end].decode('utf-8')
+
+    def suffix_range(self, query):
+        """(lo, hi): the suffixes starting with the normalized query are suffixes[lo:hi]"""
+        key = normalize_name(query)
+        text = self._text
+        size = len(key)
+        lo = bisect_left(self.suffixes, key, key=lambda pos: text[pos:pos + size])
+        hi = bisect_right(self.suffixes, key, lo=lo, key=lambda pos: text[pos:pos + size])
+        return lo, hi
+
+    def match_ids(self, query, kind=None, prefix=False):
+        """
+        Ids of the names containing query (starting with it if prefix),
+        sorted, only stars or DSOs if kind is 'star' or 'dso'
+        """
+        lo, hi = self.suffix_range(query)
+        ids = self.suffix_names[lo:hi]
+        if prefix:
+            ids = ids[self._text_offsets[ids] == self.suffixes[lo:hi]]
+        if kind is not None:
+            ids = ids[(self.name_kinds[ids] & KIND_FLAGS[kind]) != 0]
+        # One suffix per occurrence of the query: sort and dedupe the
+        # matches only, never a pass over all the names
+        return np.unique(ids)
+
+    def find(self, query, limit=10, kind=None, ranked=True):
+        """
+        Names containing query, ignoring case (at most limit, None for all),
+        best score first, or in name order if not ranked
+        """
+        ids = self.match_ids(query, kind)
+        ids = top_ids(ids, self.scores, limit) if ranked else ids[:limit]
+        return [self.name(name_id) for name_id in ids.tolist()]
+
+    def complete(self, prefix, limit=10, kind=None, ranked=True):
+        """Names starting with prefix, ignoring case, as find()"""
+        ids = self.match_ids(prefix, kind, prefix=True)
+        ids = top_ids(ids, self.scores, limit) if ranked else ids[:limit]
+        return [self.name(name_id) for name_id in ids.tolist()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Query a name suffix array")
+    parser.add_argument('suffix_array', help='e.g. name_index/name_index.sa')
+    parser.add_argument('queries', nargs='*', help='Text to find anywhere in the names')
+    parser.add_argument('--kind', choices=['star', 'dso'], default=None)
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = NameSuffixArray(args.suffix_array)
+    open_ms = (time.perf_counter() - start) * 1000
+    print(f"{args.suffix_array}: {index.path.stat().st_size:,} bytes, {len(index):,} names, "
+          f"{len(index.suffixes):,} suffixes, opened in {open_ms:.2f} ms")
+
+    for query in args.queries:
+        start = time.perf_counter()
+        lo, hi = index.suffix_range(query)
+        names = index.find(query, args.limit, args.kind)
+        ms = (time.perf_counter() - start) * 1000
+        print(f"\n'{query}' ({hi - lo:,} suffixes, {ms:.2f} ms): {', '.join(names)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Binary prefix trie of the names of the name index, for autocomplete.
+
+Usage: python scripts/name_trie.py <name_index.trie> [prefix ...] [--kind star|dso] [--limit N]
+                                  [--verify name_index_compact.json]
+
+create_name_index.py writes name_index/name_index.trie next to
+name_index_compact.json.  It holds the same names (the 'stars', 'dsos'
+and 'all' lists) once each, as a radix trie that is read in place: a
+client maps or fetches the file and walks from the root node, so the
+first prefix lookup costs a few node reads instead of a JSON parse.
+
+Format, all integers little-endian, varint = unsigned LEB128:
+
+    header, 24 bytes
+        magic       4 bytes 'NTRI'
+        version     u32     TRIE_VERSION
+        names       u32     number of names
+        stars       u32     number of star names
+        dsos        u32     number of DSO names
+        root        u32     offset of the root node
+
+    node
+        flags       u8      bit 0: a star has this name
+                            bit 1: a DSO has this name
+                            bit 2: the subtree (node included) has a star name
+                            bit 3: the subtree has a DSO name
+        n_children  varint
+        then n_children times, sorted by label:
+            label_len   varint  >= 1
+            label       label_len bytes
+            delta       varint  offset of this node - offset of the child
+
+The name of a node is the concatenation of the labels from the root,
+as UTF-8 (a multi-byte character can be split over two labels).  The
+first bytes of the labels of a node are all different, and nodes are
+written after their children so deltas are always positive.  Visiting
+children in order yields the names in byte order, which is the order of
+sorted() on the Python strings and of the compact JSON lists.
+
+Lookups ignore the case of ASCII letters by default.
+"""
+
+import argparse
+import json
+import mmap
+import struct
+import time
+from pathlib import Path
+
+TRIE_MAGIC = b'NTRI'
+TRIE_VERSION = 1
+HEADER = struct.Struct('<4s5I')
+
+STAR = 1
+DSO = 2
+KIND_FLAGS = {None: STAR | DSO, 'star': STAR, 'dso': DSO}
+
+def _varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return out
+
+def encode_name_trie(star_names, dso_names):
+    """Bytes of the trie of two iterables of names"""
+    kinds = {}
+    for name in star_names:
+        kinds[name] = kinds.get(name, 0) | STAR
+    for name in dso_names:
+        kinds[name] = kinds.get(name, 0) | DSO
+    keys = sorted(name.encode('utf-8') for name in kinds)
+    key_kinds = [kinds[key.decode('utf-8')] for key in keys]
+
+    out = bytearray(HEADER.size)
+
+    def write_node(lo, hi, depth):
+        # Node of keys[lo:hi], which all start with the same depth bytes.
+        # Returns (offset, flags).
+        flags = 0
+        if lo < hi and len(keys[lo]) == depth:
+            flags = key_kinds[lo]
+            lo += 1
+        children = []
+        while lo < hi:
+            byte = keys[lo][depth]
+            end = lo + 1
+            while end < hi and keys[end][depth] == byte:
+                end += 1
+            # Sorted keys: the common prefix of the group is that of its
+            # first and last keys.
+            first, last = keys[lo], keys[end - 1]
+            n = depth + 1
+            while n < len(first) and n < len(last) and first[n] == last[n]:
+                n += 1
+            offset, child_flags = write_node(lo, end, n)
+            children.append((first[depth:n], offset))
+            flags |= child_flags & ((STAR | DSO) << 2)
+            lo = end
+        flags |= (flags & (STAR | DSO)) << 2
+
+        offset = len(out)
+        out.append(flags)
+        out.extend(_varint(len(children)))
+        for label, child in children:
+            out.extend(_varint(len(label)))
+            out.extend(label)
+            out.extend(_varint(offset - child))
+        return offset, flags
+
+    root, _ = write_node(0, len(keys), 0)
+    n_star = sum(1 for kind in key_kinds if kind & STAR)
+    n_dso = sum(1 for kind in key_kinds if kind & DSO)
+    out[:HEADER.size] = HEADER.pack(TRIE_MAGIC, TRIE_VERSION, len(keys), n_star, n_dso, root)
+    return bytes(out)
+
+def write_name_trie(path, star_names, dso_names):
+    """Write the trie of the star and DSO names.  Returns its size in bytes"""
+    data = encode_name_trie(star_names, dso_names)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+class NameTrie:
+    """Memory mapped name trie, see the module docstring"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self.star_count, self.dso_count, self._root = \
+            HEADER.unpack_from(self._data, 0)
+        if magic != TRIE_MAGIC:
+            raise ValueError(f"Not a name trie: {self.path}")
+        if version != TRIE_VERSION:
+            raise ValueError(f"Unsupported name trie version: {version}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._data.close()
+
+    def __len__(self):
+        return self.count
+
+    def _varint(self, pos):
+        data = self._data
+        value = shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value, pos
+            shift += 7
+
+    def _node(self, offset):
+        # (flags, [(label, child offset), ...]) of a node.
+        data = self._data
+        flags = data[offset]
+        n_children, pos = self._varint(offset + 1)
+        children = []
+        for _ in range(n_children):
+            size, pos = self._varint(pos)
+            label = data[pos:pos + size]
+            delta, pos = self._varint(pos + size)
+            children.append((label, offset - delta))
+        return flags, children
+
+    def _find(self, prefix, ignore_case, exact=False):
+        # Nodes whose name starts with prefix, with their name: (offset, bytes).
+        # Several nodes match when the case is ignored ('m' and 'M').  If
+        # exact, only the node whose name is prefix: the prefix must end on
+        # a label boundary, not inside the label of a longer name.
+        if ignore_case:
+            prefix = prefix.lower()
+        found = []
+        stack = [(self._root, b'', prefix)]
+        while stack:
+            offset, path, rest = stack.pop()
+            if not rest:
+                found.append((offset, path))
+                continue
+            for label, child in self._node(offset)[1]:
+                if exact and len(label) > len(rest):
+                    continue
+                n = min(len(label), len(rest))
+                head = label[:n].lower() if ignore_case else label[:n]
+                if head != rest[:n]:
+                    continue
+                stack.append((child, path + label, rest[n:]))
+        return found
+
+    def _walk(self, offset, path, mask, limit=None):
+        # Names of a subtree in order, only those of the kinds in mask.
+        names = []
+        stack = [(offset, path)]
+        while stack:
+            offset, path = stack.pop()
+            flags, children = self._node(offset)
+            if flags & mask:
+                names.append(path.decode('utf-8'))
+                if limit is not None and len(names) >= limit:
+                    break
+            for label, child in reversed(children):
+                if self._data[child] & (mask << 2):
+                    stack.append((child, path + label))
+        return names
+
+    def kinds(self, name):
+        """Kinds of a name: a subset of {'star', 'dso'}, empty if unknown"""
+        found = self._find(name.encode('utf-8'), ignore_case=False, exact=True)
+        if not found:
+            return set()
+        flags = self._data[found[0][0]]
+        return {kind for kind, bit in (('star', STAR), ('dso', DSO)) if flags & bit}
+
+    def __contains__(self, name):
+        return bool(self.kinds(name))
+
+    def complete(self, prefix, limit=10, kind=None, ignore_case=True):
+        """
+        Names starting with prefix, in sorted order (at most limit, None for
+        all), only stars or DSOs if kind is 'star' or 'dso'.
+        """
+        mask = KIND_FLAGS[kind]
+        names = []
+        for offset, path in self._find(prefix.encode('utf-8'), ignore_case):
+            names.extend(self._walk(offset, path, mask, limit))
+        names.sort()
+        return names if limit is None else names[:limit]
+
+    def names(self, kind=None):
+        """Every name, or every star or DSO name, in sorted order"""
+        return self._walk(self._root, b'', KIND_FLAGS[kind])
+
+def verify_name_trie(path, compact_path):
+    """
+    Check a trie against name_index_compact.json: the same star and DSO
+    names, the kinds of every name, and no strict prefix of a name
+    reported as a name unless it is one.
+    Returns the number of lookups; raises ValueError on the first
+    difference.
+    """
+    with open(compact_path, 'r', encoding='utf-8') as f:
+        compact = json.load(f)
+    stars, dsos = set(compact['stars']), set(compact['dsos'])
+    checked = 0
+    with NameTrie(path) as trie:
+        if trie.names('star') != compact['stars'] or trie.names('dso') != compact['dsos']:
+            raise ValueError("Names differ")
+        for name in sorted(stars | dsos):
+            expected = {kind for kind, names in (('star', stars), ('dso', dsos))
+                        if name in names}
+            if trie.kinds(name) != expected:
+                raise ValueError(f"Kinds of '{name}' differ")
+            prefix = name[:-1]
+            if (prefix in trie) != (prefix in stars or prefix in dsos):
+                raise ValueError(f"'{prefix}' is wrongly reported as a name")
+            checked += 2
+    return checked
+
+def main():
+    parser = argparse.ArgumentParser(description="Query a name index trie")
+    parser.add_argument('trie', help='e.g. name_index/name_index.trie')
+    parser.add_argument('prefixes', nargs='*', help='Prefixes to complete')
+    parser.add_argument('--kind', choices=['star', 'dso'], default=None)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--verify', metavar='COMPACT_JSON', default=None,
+                        help='name_index_compact.json to verify the trie against')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    trie = NameTrie(args.trie)
+    open_ms = (time.perf_counter() - start) * 1000
+    print(f"{args.trie}: {trie.path.stat().st_size:,} bytes, {len(trie):,} names "
+          f"({trie.star_count:,} stars, {trie.dso_count:,} DSOs), opened in {open_ms:.2f} ms")
+
+    for prefix in args.prefixes:
+        start = time.perf_counter()
+        names = trie.complete(prefix, args.limit, args.kind)
+        ms = (time.perf_counter() - start) * 1000
+        print(f"\n'{prefix}' ({ms:.2f} ms): {', '.join(names)}")
+    trie.close()
+
+    if args.verify:
+        start = time.perf_counter()
+        checked = verify_name_trie(args.trie, args.verify)
+        print(f"\n✓ Same names and kinds as {args.verify} "
+              f"({checked:,} lookups, {time.perf_counter() - start:.1f} s)")
+
+if __name__ == "__main__":
+    main()
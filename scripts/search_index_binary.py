@@ -0,0 +1,277 @@
+"""
+Binary search index (version 3): search_index.json, read in place.
+
+Usage: python scripts/search_index_binary.py [search_index.bin] [search_index.json] [prefix ...]
+
+generate_search_index.py writes search_index.bin next to search_index.json,
+with the same sorted category arrays and completion tables.  A reader
+parses the header and the category table, then binary-searches one
+category where it lies: the other categories are never read.  With the
+JSON file as second argument, every entry and the results of every short
+prefix are checked against it.
+
+Format, all integers little-endian:
+
+    header, 16 bytes
+        magic               4 bytes 'SIDX'
+        version             u32     BINARY_VERSION
+        categories          u32     number of categories (c)
+        prefix_length       u8      longest prefix of the completion tables
+        completion_limit    u8      most completions per prefix
+        reserved            2 bytes
+    category table, c times 32 bytes, in the order of the JSON file
+        name                16 bytes ASCII, 0 padded ('stars', 'galaxies', ...)
+        entries             u32     number of entries (n)
+        entries_offset      u32     file offset of the entry offsets
+        completions         u32     number of completion prefixes (p)
+        completions_offset  u32     file offset of the completion offsets
+    per category
+        entry offsets       n u32   file offset of each entry
+        entries             u16 size, then the UTF-8 'NORM|Name[|Type]' string,
+                            sorted as in the JSON arrays
+        completion offsets  p u32   file offset of each completion record
+        completions         sorted by prefix: u16 size, u8 prefix size, the
+                            UTF-8 prefix, then u32 indexes of entries, best first
+
+Each offset array starts on a multiple of 4.  UTF-8 byte order is code
+point order, so the entries sorted as Python strings are sorted as bytes.
+"""
+
+import argparse
+import json
+import mmap
+import struct
+import time
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+
+import numpy as np
+
+from front_coding import front_decode, is_front_coded
+
+BINARY_MAGIC = b'SIDX'
+BINARY_VERSION = 3
+HEADER = struct.Struct('<4sIIBB2x')
+CATEGORY = struct.Struct('<16s4I')
+SIZE = struct.Struct('<H')
+
+def index_categories(index):
+    """
+    (name, entries) of the categories of a search_index.json dict, in file
+    order (front coded categories are decoded)
+    """
+    categories = [('stars', index['stars']), *index['dsos'].items()]
+    if is_front_coded(index):
+        return [(name, front_decode(entries)) for name, entries in categories]
+    return categories
+
+def _pad(out):
+    out.extend(b'\0' * (-len(out) % 4))
+
+def _records(out, records):
+    # Offsets array, then the length-prefixed records; returns the offset
+    # of the array.
+    _pad(out)
+    start = len(out)
+    out.extend(bytes(4 * len(records)))
+    offsets = []
+    for record in records:
+        offsets.append(len(out))
+        out.extend(SIZE.pack(len(record)))
+        out.extend(record)
+    out[start:start + 4 * len(records)] = np.array(offsets, dtype='<u4').tobytes()
+    return start
+
+def encode_search_index(index):
+    """Bytes of the binary index of a search_index.json dict"""
+    categories = index_categories(index)
+    completions = index.get('completions', {})
+    out = bytearray(HEADER.size + CATEGORY.size * len(categories))
+    table = []
+    for name, entries in categories:
+        entries_offset = _records(out, [entry.encode('utf-8') for entry in entries])
+        prefixes = sorted(completions.get(name, {}).items(),
+                          key=lambda item: item[0].encode('utf-8'))
+        records = []
+        for prefix, ids in prefixes:
+            key = prefix.encode('utf-8')
+            records.append(bytes([len(key)]) + key + np.array(ids, dtype='<u4').tobytes())
+        completions_offset = _records(out, records)
+        table.append(CATEGORY.pack(name.encode('ascii'), len(entries), entries_offset,
+                                   len(records), completions_offset))
+    out[:HEADER.size] = HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(categories),
+                                    completions.get('prefix_length', 0),
+                                    completions.get('limit', 0))
+    out[HEADER.size:HEADER.size + CATEGORY.size * len(categories)] = b''.join(table)
+    return bytes(out)
+
+def write_search_index(path, index):
+    """Write the binary index of a search_index.json dict.  Returns its size in bytes"""
+    data = encode_search_index(index)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+class SearchIndexFile:
+    """Memory mapped binary search index, see the module docstring"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n, self.prefix_length, self.completion_limit = \
+            HEADER.unpack_from(self._data, 0)
+        if magic != BINARY_MAGIC:
+            raise ValueError(f"Not a binary search index: {self.path}")
+        if version != BINARY_VERSION:
+            raise ValueError(f"Unsupported search index version: {version}")
+        self.categories = {}
+        for i in range(n):
+            name, *fields = CATEGORY.unpack_from(self._data, HEADER.size + i * CATEGORY.size)
+            self.categories[name.rstrip(b'\0').decode('ascii')] = fields
+        # Offset arrays, read on first use of a category
+        self._offsets = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._offsets.clear()
+        self._data.close()
+
+    def _array(self, category, completions=False):
+        key = (category, completions)
+        array = self._offsets.get(key)
+        if array is None:
+            n, entries_offset, p, completions_offset = self.categories[category]
+            count, offset = (p, completions_offset) if completions else (n, entries_offset)
+            array = self._offsets[key] = np.frombuffer(self._data, dtype='<u4',
+                                                       count=count, offset=offset)
+        return array
+
+    def _record(self, offset):
+        size, = SIZE.unpack_from(self._data, offset)
+        return self._data[offset + SIZE.size:offset + SIZE.size + size]
+
+    def __len__(self):
+        return sum(fields[0] for fields in self.categories.values())
+
+    def entry(self, category, i):
+        return self._record(int(self._array(category)[i])).decode('utf-8')
+
+    def entries(self, category):
+        return [self._record(offset).decode('utf-8') for offset in self._array(category).tolist()]
+
+    def prefix_range(self, category, prefix):
+        """(lo, hi): the entries of category whose key starts with prefix are lo to hi - 1"""
+        key = prefix.encode('utf-8')
+        offsets = self._array(category)
+        data = self._data
+        start = SIZE.size
+        end = SIZE.size + len(key)
+        # Sorted entries: those starting with prefix are contiguous
+        lo = bisect_left(offsets, key, key=lambda offset: data[offset + start:offset + end])
+        hi = bisect_right(offsets, key, lo=lo, key=lambda offset: data[offset + start:offset + end])
+        return lo, hi
+
+    def completions(self, category, prefix):
+        """Precomputed completions of a short prefix (None if prefix is longer than the table's)"""
+        if len(prefix) > self.prefix_length:
+            return None
+        key = prefix.encode('utf-8')
+        offsets = self._array(category, completions=True)
+        i = bisect_left(offsets, key, key=lambda offset: self._completion(offset)[0])
+        if i == len(offsets) or self._completion(int(offsets[i]))[0] != key:
+            return []
+        ids = self._completion(int(offsets[i]))[1]
+        return [self.entry(category, entry_id) for entry_id in ids.tolist()]
+
+    def _completion(self, offset):
+        record = self._record(offset)
+        size = record[0]
+        return record[1:1 + size], np.frombuffer(record, dtype='<u4', offset=1 + size)
+
+    def search(self, category, prefix, limit=None):
+        """
+        Entries of category whose normalized key starts with prefix: the
+        precomputed completions for short prefixes, else in sorted order
+        """
+        if '|' in prefix:
+            return []
+        found = self.completions(category, prefix)
+        if found is None:
+            lo, hi = self.prefix_range(category, prefix)
+            if limit is not None:
+                hi = min(hi, lo + limit)
+            found = [self.entry(category, i) for i in range(lo, hi)]
+        return found if limit is None else found[:limit]
+
+def verify_search_index(binary_path, json_path, prefix_length=4):
+    """
+    Check a binary index against its JSON: same categories, entries and
+    completions, and the same results for every prefix of up to
+    prefix_length characters of the keys (expected results are grouped
+    from the JSON arrays in one pass).  Returns the number of searches
+    compared; raises ValueError on the first difference.
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    completions = index.get('completions', {})
+    checked = 0
+    with SearchIndexFile(binary_path) as binary:
+        categories = index_categories(index)
+        if list(binary.categories) != [name for name, _ in categories]:
+            raise ValueError(f"Categories differ: {list(binary.categories)}")
+        for name, entries in categories:
+            if binary.entries(name) != entries:
+                raise ValueError(f"Entries of {name} differ")
+            expected = {}
+            for entry in entries:
+                norm = entry.split('|', 1)[0]
+                for n in range(1, min(len(norm), prefix_length) + 1):
+                    expected.setdefault(norm[:n], []).append(entry)
+            for prefix, ids in completions.get(name, {}).items():
+                expected[prefix] = [entries[i] for i in ids]
+            for prefix in ['~', 'ZZZZZZ', 'A|']:
+                expected.setdefault(prefix, [])
+            for prefix, found in expected.items():
+                if binary.search(name, prefix) != found:
+                    raise ValueError(f"Results of {name} '{prefix}' differ")
+                checked += 1
+    return checked
+
+def main():
+    parser = argparse.ArgumentParser(description="Query or verify a binary search index")
+    parser.add_argument('binary', nargs='?', default='apps/web-frontend/public/skydata/search_index.bin')
+    parser.add_argument('json', nargs='?', help='search_index.json to verify the binary against')
+    parser.add_argument('--prefix', action='append', default=[], help='Normalized prefix to look up')
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    binary = SearchIndexFile(args.binary)
+    open_ms = (time.perf_counter() - start) * 1000
+    print(f"{args.binary}: {binary.path.stat().st_size:,} bytes, {len(binary):,} entries, "
+          f"opened in {open_ms:.2f} ms")
+    for name, (n, _, p, _) in binary.categories.items():
+        print(f"  {name}: {n:,} entries, {p:,} completion prefixes")
+
+    for prefix in args.prefix:
+        for name in binary.categories:
+            start = time.perf_counter()
+            found = binary.search(name, prefix, args.limit)
+            ms = (time.perf_counter() - start) * 1000
+            print(f"\n{name} '{prefix}' ({ms:.2f} ms): {', '.join(found)}")
+    binary.close()
+
+    if args.json:
+        start = time.perf_counter()
+        checked = verify_search_index(args.binary, args.json)
+        print(f"\n✓ Same entries, completions and results as {args.json} "
+              f"({checked:,} searches, {time.perf_counter() - start:.1f} s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Per-tile manifest and decoded table cache for incremental extraction.
+
+The manifest records, for each .eph tile of a survey, its path relative to
+the survey, size, mtime and the CRCs stored after each chunk.  A tile whose
+size and mtime did not change is not decoded again; if only the mtime
+changed (e.g. the file was copied) the stored CRCs decide, when the file
+has any.
+
+TileCache keeps the decoded tables of each tile next to the manifest, one
+.npz shard per tile, so that the catalog outputs can be merged again
+without inflating any unchanged tile.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from eph_file import EphFile, StringColumn, table_num_rows
+from eph_survey import tile_order_pix
+
+MANIFEST_VERSION = 1
+
+def tile_crcs(path):
+    """CRCs stored after each chunk of a tile"""
+    with EphFile(path) as eph:
+        return [chunk.crc for chunk in eph.chunks]
+
+class TileManifest:
+    """Record of the tiles of a survey as they were last processed"""
+
+    def __init__(self, path, survey_dir, compact=False):
+        self.path = Path(path)
+        self.survey_dir = Path(survey_dir)
+        self.compact = compact
+        self.tiles = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.tiles = data['tiles']
+
+    def key(self, tile_path):
+        """Manifest key of a tile: its posix path relative to the survey"""
+        return Path(tile_path).relative_to(self.survey_dir).as_posix()
+
+    def get(self, tile_path):
+        return self.tiles.get(self.key(tile_path))
+
+    def is_unchanged(self, tile_path):
+        """True if the tile is the one recorded in the manifest"""
+        entry = self.get(tile_path)
+        if entry is None:
+            return False
+        st = os.stat(tile_path)
+        if st.st_size != entry['size']:
+            return False
+        if st.st_mtime_ns == entry['mtime_ns']:
+            return True
+        # Same size but touched: trust the chunk CRCs if the file has any.
+        if any(entry['crcs']) and tile_crcs(tile_path) == entry['crcs']:
+            entry['mtime_ns'] = st.st_mtime_ns
+            return True
+        return False
+
+    def update(self, tile_path, **extra):
+        """Record the current state of a tile, with optional extra fields"""
+        st = os.stat(tile_path)
+        entry = {
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'crcs': tile_crcs(tile_path),
+        }
+        entry.update(extra)
+        self.tiles[self.key(tile_path)] = entry
+        return entry
+
+    def prune(self, tile_paths):
+        """Forget the tiles that are not in tile_paths, return their keys"""
+        keep = {self.key(path) for path in tile_paths}
+        removed = [key for key in self.tiles if key not in keep]
+        for key in removed:
+            del self.tiles[key]
+        return removed
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            data = {
+                'version': MANIFEST_VERSION,
+                'tiles': self.tiles,
+            }
+            if self.compact:
+                json.dump(data, f, separators=(',', ':'), sort_keys=True)
+            else:
+                json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+class TileCache:
+    """
+    Manifest plus the decoded tables of every tile, stored in cache_dir
+    (e.g. stars_extracted/star_data.tiles).
+    """
+
+    def __init__(self, cache_dir, survey_dir):
+        self.cache_dir = Path(cache_dir)
+        self.manifest = TileManifest(self.cache_dir / 'manifest.json', survey_dir)
+
+    def shard_path(self, tile_path):
+        order, pix = tile_order_pix(tile_path)
+        return self.cache_dir / f'Norder{order}' / f'Npix{pix}.npz'
+
+    def changed_tiles(self, tile_paths):
+        """Tiles that are new, changed, or whose cached tables are missing"""
+        return [path for path in tile_paths
+                if not self.manifest.is_unchanged(path)
+                or not self.shard_path(path).exists()]
+
+    def is_up_to_date(self, tile_paths):
+        """True if nothing was added, changed or removed since the last run"""
+        keys = {self.manifest.key(path) for path in tile_paths}
+        return keys == set(self.manifest.tiles) and not self.changed_tiles(tile_paths)
+
+    def count(self):
+        """Total number of rows of the recorded tiles"""
+        return sum(entry.get('count', 0) for entry in self.manifest.tiles.values())
+
+    def store(self, tile_path, tables, complete=True):
+        """
+        Save the decoded tables of a tile.  Only complete tiles are
+        recorded in the manifest, so that tiles with errors are decoded
+        again on the next run.
+        """
+        arrays = {}
+        meta = []
+        for i, table in enumerate(tables):
+            columns = []
+            for name, values in table.items():
+                if values is None:
+                    columns.append([name, None])
+                    continue
+                is_string = not isinstance(values, np.ndarray)
+                if isinstance(values, StringColumn):
+                    values = values.raw
+                elif is_string:
+                    values = np.asarray(values, dtype=str)
+                arrays[f'{i}:{name}'] = values
+                columns.append([name, 's' if is_string else 'n'])
+            meta.append(columns)
+        arrays['meta'] = np.array(json.dumps(meta))
+
+        shard_path = self.shard_path(tile_path)
+        shard_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(shard_path, 'wb') as f:
+            np.savez(f, **arrays)
+        if complete:
+            count = sum(table_num_rows(table) for table in tables)
+            self.manifest.update(tile_path, count=count)
+
+    def load(self, tile_path):
+        """Decoded tables of a tile, as stored by store()"""
+        with np.load(self.shard_path(tile_path)) as shard:
+            meta = json.loads(str(shard['meta']))
+            tables = []
+            for i, columns in enumerate(meta):
+                table = {}
+                for name, kind in columns:
+                    if kind is None:
+                        table[name] = None
+                    elif kind == 's':
+                        values = shard[f'{i}:{name}']
+                        # Undecoded bytes are stored as 'S' arrays.
+                        table[name] = StringColumn(values) if values.dtype.kind == 'S' \
+                            else values.tolist()
+                    else:
+                        table[name] = shard[f'{i}:{name}']
+                tables.append(table)
+        return tables
+
+    def prune(self, tile_paths):
+        """Drop the manifest entries and shards of tiles that disappeared"""
+        removed = self.manifest.prune(tile_paths)
+        for key in removed:
+            try:
+                shard_path = self.shard_path(self.manifest.survey_dir / key)
+            except ValueError:
+                continue
+            if shard_path.exists():
+                shard_path.unlink()
+        return removed
+
+    def save(self):
+        self.manifest.save()
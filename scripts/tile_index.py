@@ -0,0 +1,202 @@
+"""
+Per-tile summary index of a survey, used to plan queries.
+
+Usage: python scripts/tile_index.py <survey_dir> [-j N] [--rebuild]
+
+The survey properties only give max_vmag and hips_order_min, so a query
+limited in magnitude or region would otherwise have to open every tile to
+find out it is irrelevant.  The index is a sidecar file next to the
+properties (<survey_dir>/tile_index.json) recording for each tile:
+
+    nuniq, order, pix   HEALPix position, from the tile header
+    rows                number of rows of all the tables of the tile
+    vmag_min, vmag_max  magnitude range of the rows (null if unknown)
+    data_size           decompressed table size in bytes
+    comp_size           compressed table size in bytes
+    schema              hash of the row layout (column descriptors)
+
+It is a TileManifest, so it also keeps the size, mtime and chunk CRCs of
+every tile and is only updated for the tiles that changed.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+
+from eph_file import EphFile, read_table_info, read_compressed_block
+from eph_file import unshuffle_bytes, table_dtype, CHUNK_DEGREE_COLUMNS
+from eph_survey import list_tiles, map_tiles, format_tile_error
+from tile_cache import TileManifest
+
+INDEX_FILENAME = 'tile_index.json'
+
+def index_path(survey_dir):
+    """Default location of the index of a survey"""
+    return Path(survey_dir) / INDEX_FILENAME
+
+def schema_hash(headers):
+    """Short hash of the row layout of a list of table headers"""
+    layout = [[header['flags'], header['row_size'],
+               [[col['name'], col['type'], col['unit'], col['start'], col['size']]
+                for col in header['columns']]]
+              for header in headers]
+    return hashlib.sha1(json.dumps(layout).encode('utf-8')).hexdigest()[:16]
+
+def _vmag_values(chunk_data, header):
+    # Inflate a table and view only its vmag column.
+    columns = [col for col in header['columns']
+               if col['name'] == 'vmag' and col['type'] == 'f']
+    if not columns or not header['n_row']:
+        return None
+    row_size, n_row = header['row_size'], header['n_row']
+    data = read_compressed_block(chunk_data[header['data_offset']:])
+    if header['flags'] & 1:
+        data = unshuffle_bytes(data, row_size, n_row)
+    records = np.frombuffer(data, dtype=table_dtype(columns[:1], row_size), count=n_row)
+    return records['vmag']
+
+def summarize_tile(path):
+    """Index entry of one tile (without the manifest fields)"""
+    headers = []
+    vmags = []
+    with EphFile(path) as eph:
+        for chunk in eph.find_chunks(*CHUNK_DEGREE_COLUMNS):
+            data = eph.chunk_data(chunk)
+            header = read_table_info(data)
+            headers.append(header)
+            values = _vmag_values(data, header)
+            if values is not None:
+                vmags.append(values[np.isfinite(values)])
+            del data
+
+    if not headers:
+        raise ValueError("No table chunk")
+    vmag = np.concatenate(vmags) if vmags else np.empty(0)
+    return {
+        'nuniq': headers[0]['nuniq'],
+        'order': headers[0]['order'],
+        'pix': headers[0]['pix'],
+        'rows': sum(header['n_row'] for header in headers),
+        # Exact values (not rounded): may_contain() prunes on them
+        'vmag_min': float(vmag.min()) if len(vmag) else None,
+        'vmag_max': float(vmag.max()) if len(vmag) else None,
+        'data_size': sum(header['data_size'] for header in headers),
+        'comp_size': sum(header['comp_size'] for header in headers),
+        'schema': schema_hash(headers),
+    }
+
+class TileIndex:
+    """Summary index of the tiles of a survey, see the module docstring"""
+
+    def __init__(self, survey_dir, path=None):
+        self.survey_dir = Path(survey_dir)
+        self.manifest = TileManifest(path or index_path(survey_dir),
+                                     survey_dir, compact=True)
+
+    @property
+    def path(self):
+        return self.manifest.path
+
+    def __len__(self):
+        return len(self.manifest.tiles)
+
+    def update(self, tiles=None, workers=1):
+        """
+        Summarize the new and changed tiles and forget the removed ones.
+        Returns (number of tiles summarized, removed keys, errors).
+        """
+        if tiles is None:
+            tiles = list_tiles(self.survey_dir)
+        changed = [path for path in tiles if not self.manifest.is_unchanged(path)]
+        errors = []
+        for path, summary, error in map_tiles(summarize_tile, changed, workers):
+            if error:
+                errors.append(format_tile_error(path, error))
+                continue
+            self.manifest.update(path, **summary)
+        removed = self.manifest.prune(tiles)
+        return len(changed), removed, errors
+
+    def save(self):
+        self.manifest.save()
+
+    def get(self, tile_path):
+        """
+        Entry of a tile, or None if the tile is not in the index or changed
+        since it was summarized.
+        """
+        try:
+            if not self.manifest.is_unchanged(tile_path):
+                return None
+        except (OSError, ValueError):
+            return None
+        return self.manifest.get(tile_path)
+
+    def may_contain(self, tile_path, min_vmag=None, max_vmag=None):
+        """
+        False if the index proves the tile holds no row in the magnitude
+        range.  Tiles that are not indexed are always kept.
+        """
+        entry = self.get(tile_path)
+        if entry is None:
+            return True
+        if not entry['rows']:
+            return False
+        if max_vmag is not None and entry['vmag_min'] is not None \
+                and entry['vmag_min'] > max_vmag:
+            return False
+        if min_vmag is not None and entry['vmag_max'] is not None \
+                and entry['vmag_max'] < min_vmag:
+            return False
+        return True
+
+def load_tile_index(survey_dir, path=None):
+    """The index of a survey if it was built, else None"""
+    path = Path(path or index_path(survey_dir))
+    if not path.exists():
+        return None
+    return TileIndex(survey_dir, path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the tile summary index of a survey")
+    parser.add_argument('survey_dir', help='e.g. apps/web-frontend/public/skydata/stars')
+    parser.add_argument('-o', '--output', default=None,
+                        help=f'Index file (default: <survey_dir>/{INDEX_FILENAME})')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='Number of worker processes')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Summarize every tile again')
+    args = parser.parse_args()
+
+    index = TileIndex(args.survey_dir, args.output)
+    if args.rebuild:
+        index.manifest.tiles = {}
+    tiles = list_tiles(args.survey_dir)
+    updated, removed, errors = index.update(tiles, args.workers)
+    index.save()
+
+    for error in errors:
+        print(f"  {error}")
+    print(f"{len(tiles)} tiles, {updated} summarized, {len(removed)} removed")
+
+    entries = index.manifest.tiles.values()
+    orders = sorted({entry['order'] for entry in entries})
+    print(f"\n{'order':>5s} {'tiles':>6s} {'rows':>8s} {'vmag min':>9s} {'vmag max':>9s} "
+          f"{'comp KB':>8s} {'data KB':>8s}")
+    print(f"{'-'*58}")
+    for order in orders:
+        group = [entry for entry in entries if entry['order'] == order]
+        vmin = [e['vmag_min'] for e in group if e['vmag_min'] is not None]
+        vmax = [e['vmag_max'] for e in group if e['vmag_max'] is not None]
+        print(f"{order:5d} {len(group):6d} {sum(e['rows'] for e in group):8d} "
+              f"{min(vmin) if vmin else math.nan:9.2f} {max(vmax) if vmax else math.nan:9.2f} "
+              f"{sum(e['comp_size'] for e in group) / 1024:8.1f} "
+              f"{sum(e['data_size'] for e in group) / 1024:8.1f}")
+    print(f"\nIndex saved to: {index.path}")
+
+if __name__ == "__main__":
+    main()
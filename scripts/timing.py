@@ -0,0 +1,17 @@
+"""
+Timing helper shared by the benchmarks and the tile writer's level report.
+"""
+
+import time
+
+def best_time(func, repeat):
+    """Return the best wall time of func() over repeat runs, and its result"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result